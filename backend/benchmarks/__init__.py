@@ -0,0 +1,3 @@
+"""
+Benchmarks del backend (se ejecutan sin conexión, desde backend/).
+"""
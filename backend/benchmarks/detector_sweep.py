@@ -0,0 +1,323 @@
+"""
+Barrido de la configuración de los detectores: coste por frame frente a precisión.
+
+Cada combinación de model_selection y confianza de la detección facial, de las
+confianzas de Face Mesh, del umbral EAR y de la resolución de entrada procesa
+un conjunto local de frames etiquetados. El análisis es el mismo que hacen los
+trabajadores (AttentionPipeline: detección facial -> Face Mesh sobre la ROI).
+Para cada combinación se informa:
+
+- latencia por frame (p50/p95/media en ms, sin decodificación)
+- tasa de detección: frames con rostro en los que se detecta
+- falsos rostros: frames sin rostro en los que se detecta uno
+- precisión de parpadeo: frames con rostro cuyo parpadeo coincide con la
+  etiqueta (un rostro no detectado cuenta como fallo)
+
+El umbral EAR no cambia la inferencia: los EAR de cada configuración se
+calculan una vez y se evalúan con todos los umbrales. Con --min-detection-rate
+y --min-blink-accuracy se indica la configuración más barata que cumple ambos.
+
+Conjunto etiquetado: un directorio con las imágenes y un labels.csv con las
+columnas archivo,rostro,parpadeo (1/0). Sin --frames se usan rostros
+sintéticos (ojos abiertos / entornados y fondos sin rostro), útiles para
+comprobar la herramienta pero no para elegir valores: sus etiquetas de
+parpadeo son aproximadas.
+
+Uso (desde backend/):
+    python -m benchmarks.detector_sweep --frames etiquetados/ --resolutions 320,480,640
+    python -m benchmarks.detector_sweep --frames etiquetados/ --ear-thresholds 0.2,0.25,1.55 --output barrido.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from benchmarks.harness import percentiles, quiet
+from core.config import settings
+
+
+LABELS_FILE = "labels.csv"
+
+# (imagen BGR, tiene rostro, está parpadeando)
+LabeledFrame = Tuple[np.ndarray, bool, bool]
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "si", "sí", "yes")
+
+
+def load_labeled_frames(directory: str) -> List[LabeledFrame]:
+    """
+    Carga un conjunto etiquetado (directorio con labels.csv: archivo,rostro,parpadeo).
+
+    Raises:
+        ValueError: Si falta labels.csv o no contiene imágenes válidas
+    """
+    labels_path = os.path.join(directory, LABELS_FILE)
+    if not os.path.isfile(labels_path):
+        raise ValueError(f"No se encontró {LABELS_FILE} en {directory}")
+
+    frames = []
+    with open(labels_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            img = cv2.imread(os.path.join(directory, row["archivo"]))
+            if img is None:
+                print(f"[Sweep] ⚠️ No se pudo leer {row['archivo']}", file=sys.stderr)
+                continue
+            face = _flag(row.get("rostro", "1"))
+            frames.append((img, face, face and _flag(row.get("parpadeo", "0"))))
+    if not frames:
+        raise ValueError(f"{labels_path} no contiene imágenes válidas")
+    return frames
+
+
+def synthetic_labeled_frames(count: int = 8) -> List[LabeledFrame]:
+    """
+    Rostros sintéticos (los impares con los ojos entornados, etiquetados como
+    parpadeo) y una cuarta parte de fondos sin rostro.
+    """
+    from benchmarks.vision_benchmark import generate_faces
+
+    frames = [(img, True, i % 2 == 1) for i, img in enumerate(generate_faces(count))]
+    rng = np.random.default_rng(1)
+    height, width = frames[0][0].shape[:2]
+    for _ in range(max(1, count // 4)):
+        background = np.clip(rng.normal(rng.integers(40, 200), 20, size=(height, width, 3)), 0, 255)
+        frames.append((background.astype(np.uint8), False, False))
+    return frames
+
+
+def _resize(img: np.ndarray, max_side: int) -> np.ndarray:
+    scale = max_side / max(img.shape[:2])
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def evaluate_threshold(
+    labels: List[Tuple[bool, bool]],
+    detections: List[bool],
+    ears: List[float],
+    ear_threshold: float
+) -> Dict[str, float]:
+    """
+    Calcula las métricas de precisión de una pasada para un umbral EAR.
+
+    Args:
+        labels: (tiene rostro, está parpadeando) de cada frame
+        detections: Si se detectó rostro en cada frame
+        ears: EAR promedio de cada frame (0.0 sin rostro)
+        ear_threshold: Umbral EAR evaluado
+
+    Returns:
+        dict con detection_rate, false_face_rate y blink_accuracy (None si no aplica)
+    """
+    with_face = [i for i, (face, _) in enumerate(labels) if face]
+    without_face = [i for i, (face, _) in enumerate(labels) if not face]
+    blink_hits = sum(
+        1 for i in with_face
+        if detections[i] and (ears[i] < ear_threshold) == labels[i][1]
+    )
+    return {
+        "detection_rate": round(sum(detections[i] for i in with_face) / len(with_face), 4) if with_face else None,
+        "false_face_rate": round(sum(detections[i] for i in without_face) / len(without_face), 4) if without_face else None,
+        "blink_accuracy": round(blink_hits / len(with_face), 4) if with_face else None
+    }
+
+
+def run_sweep(
+    frames: List[LabeledFrame],
+    resolutions: List[int],
+    model_selections: List[int],
+    face_confidences: List[float],
+    mesh_detection_confidences: List[float],
+    mesh_tracking_confidences: List[float],
+    ear_thresholds: List[float],
+    streaming: bool = False,
+    repeats: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Procesa el conjunto con cada combinación de parámetros.
+
+    Args:
+        frames: Conjunto etiquetado
+        resolutions: Lados mayores (px) de entrada
+        model_selections: Modelos de detección facial (0 corto, 1 completo)
+        face_confidences: Confianzas mínimas de la detección facial
+        mesh_detection_confidences: Confianzas mínimas de detección de Face Mesh
+        mesh_tracking_confidences: Confianzas mínimas de seguimiento de Face Mesh
+            (solo influyen con streaming=True)
+        ear_thresholds: Umbrales EAR
+        streaming: Procesar los frames como un video (Face Mesh en modo streaming
+            y ROI reutilizada entre frames) en lugar de como imágenes sueltas
+        repeats: Pasadas sobre el conjunto por combinación (la precisión es la de la primera)
+
+    Returns:
+        Lista de filas (una por combinación) con parámetros, latencia y precisión
+    """
+    # MediaPipe solo se importa al ejecutar el barrido (se puede importar el módulo sin él)
+    from services.attention_pipeline import AttentionPipeline
+    from services.blink_detection_service import BlinkDetectionService
+    from services.face_detection_service import FaceDetectionService
+
+    if not streaming:
+        mesh_tracking_confidences = mesh_tracking_confidences[:1]
+    labels = [(face, blinking) for _, face, blinking in frames]
+    rows = []
+    for max_side in resolutions:
+        images = [_resize(img, max_side) for img, _, _ in frames]
+        for model_selection, face_confidence in itertools.product(model_selections, face_confidences):
+            face_detector = FaceDetectionService(model_selection=model_selection, min_detection_confidence=face_confidence)
+            for mesh_detection, mesh_tracking in itertools.product(mesh_detection_confidences, mesh_tracking_confidences):
+                blink_detector = BlinkDetectionService(
+                    static_image_mode=not streaming,
+                    max_num_faces=1,
+                    min_detection_confidence=mesh_detection,
+                    min_tracking_confidence=mesh_tracking
+                )
+                pipeline = AttentionPipeline(face_detector, blink_detector, reuse_roi=streaming)
+                print(
+                    f"[Sweep] ⏱️ {max_side}px modelo={model_selection} rostro={face_confidence} "
+                    f"mesh={mesh_detection}/{mesh_tracking}...",
+                    file=sys.stderr
+                )
+
+                # Primer frame fuera de la medida (inicialización de los grafos de MediaPipe)
+                with quiet():
+                    pipeline.process(images[0])
+                pipeline.reset()
+
+                latencies: List[float] = []
+                detections: List[bool] = []
+                ears: List[float] = []
+                with quiet():
+                    for repeat in range(repeats):
+                        for img in images:
+                            started = time.perf_counter()
+                            analysis = pipeline.process(img)
+                            latencies.append((time.perf_counter() - started) * 1000.0)
+                            if repeat == 0:
+                                detections.append(analysis.face_detected)
+                                ears.append((analysis.blink.left_ear + analysis.blink.right_ear) / 2.0)
+                        pipeline.reset()
+                blink_detector.face_mesh.close()
+
+                latency = percentiles(latencies)
+                for ear_threshold in ear_thresholds:
+                    rows.append({
+                        "resolution": max_side,
+                        "model_selection": model_selection,
+                        "face_confidence": face_confidence,
+                        "mesh_detection_confidence": mesh_detection,
+                        "mesh_tracking_confidence": mesh_tracking,
+                        "ear_threshold": ear_threshold,
+                        "latency_ms": latency,
+                        **evaluate_threshold(labels, detections, ears, ear_threshold)
+                    })
+            face_detector.face_detection.close()
+    return rows
+
+
+def meets_bar(row: Dict[str, Any], min_detection_rate: float, min_blink_accuracy: float) -> bool:
+    """Indica si una combinación alcanza las precisiones mínimas."""
+    return (row["detection_rate"] or 0.0) >= min_detection_rate and (row["blink_accuracy"] or 0.0) >= min_blink_accuracy
+
+
+def cheapest(rows: List[Dict[str, Any]], min_detection_rate: float, min_blink_accuracy: float) -> Optional[Dict[str, Any]]:
+    """Combinación con menor latencia media que alcanza las precisiones mínimas (None si ninguna)."""
+    candidates = [row for row in rows if meets_bar(row, min_detection_rate, min_blink_accuracy)]
+    return min(candidates, key=lambda row: row["latency_ms"]["mean"], default=None)
+
+
+def _percent(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0%}"
+
+
+def print_table(rows: List[Dict[str, Any]], min_detection_rate: float, min_blink_accuracy: float) -> None:
+    """Imprime las combinaciones ordenadas por latencia media (* = alcanza las precisiones mínimas)."""
+    print(
+        f"  {'px':>5} {'modelo':>6} {'rostro':>6} {'mesh':>9} {'EAR':>6}"
+        f" {'p50 ms':>8} {'p95 ms':>8} {'media':>8} {'detección':>10} {'falsos':>7} {'parpadeo':>9}"
+    )
+    for row in sorted(rows, key=lambda row: row["latency_ms"]["mean"]):
+        latency = row["latency_ms"]
+        mark = "*" if meets_bar(row, min_detection_rate, min_blink_accuracy) else " "
+        print(
+            f"{mark} {row['resolution']:>5} {row['model_selection']:>6} {row['face_confidence']:>6}"
+            f" {row['mesh_detection_confidence']:>4}/{row['mesh_tracking_confidence']:<4} {row['ear_threshold']:>6}"
+            f" {latency['p50']:>8} {latency['p95']:>8} {latency['mean']:>8}"
+            f" {_percent(row['detection_rate']):>10} {_percent(row['false_face_rate']):>7} {_percent(row['blink_accuracy']):>9}"
+        )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Barrido de la configuración de los detectores (latencia frente a precisión)")
+    parser.add_argument("--frames", default=None, help="Directorio con las imágenes y labels.csv (por defecto, rostros sintéticos)")
+    parser.add_argument("--resolutions", type=_int_list, default=[320, 480, 640], help="Lados mayores en px, separados por comas")
+    parser.add_argument("--model-selection", type=_int_list, default=[0, 1], help="Modelos de detección facial (0 corto, 1 completo)")
+    parser.add_argument("--face-confidence", type=_float_list, default=[0.5, 0.7, settings.face_detection_min_confidence], help="Confianzas mínimas de la detección facial")
+    parser.add_argument("--mesh-detection-confidence", type=_float_list, default=[0.5, settings.face_mesh_min_detection_confidence], help="Confianzas mínimas de detección de Face Mesh")
+    parser.add_argument("--mesh-tracking-confidence", type=_float_list, default=[settings.face_mesh_min_tracking_confidence], help="Confianzas mínimas de seguimiento de Face Mesh (solo con --streaming)")
+    parser.add_argument("--ear-thresholds", type=_float_list, default=[settings.ear_threshold], help="Umbrales EAR")
+    parser.add_argument("--streaming", action="store_true", help="Procesar los frames en orden, como un video")
+    parser.add_argument("--repeats", type=int, default=3, help="Pasadas sobre el conjunto por combinación")
+    parser.add_argument("--min-detection-rate", type=float, default=0.95, help="Tasa de detección mínima aceptable")
+    parser.add_argument("--min-blink-accuracy", type=float, default=0.9, help="Precisión de parpadeo mínima aceptable")
+    parser.add_argument("--output", default=None, help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args(argv)
+
+    frames = load_labeled_frames(args.frames) if args.frames else synthetic_labeled_frames()
+    rows = run_sweep(
+        frames,
+        args.resolutions,
+        args.model_selection,
+        sorted(set(args.face_confidence)),
+        sorted(set(args.mesh_detection_confidence)),
+        sorted(set(args.mesh_tracking_confidence)),
+        args.ear_thresholds,
+        args.streaming,
+        args.repeats
+    )
+
+    faces = sum(face for _, face, _ in frames)
+    print(f"\n[Sweep] {len(frames)} frames ({faces} con rostro), {len(rows)} combinaciones")
+    print_table(rows, args.min_detection_rate, args.min_blink_accuracy)
+
+    best = cheapest(rows, args.min_detection_rate, args.min_blink_accuracy)
+    if best is None:
+        print(
+            f"\n[Sweep] ⚠️ Ninguna combinación alcanza detección ≥ {args.min_detection_rate:.0%}"
+            f" y parpadeo ≥ {args.min_blink_accuracy:.0%}"
+        )
+    else:
+        print(
+            f"\n[Sweep] ✅ Más barata que cumple: {best['resolution']}px, model_selection={best['model_selection']},"
+            f" face_confidence={best['face_confidence']}, face_mesh={best['mesh_detection_confidence']}"
+            f"/{best['mesh_tracking_confidence']}, ear_threshold={best['ear_threshold']}"
+            f" ({best['latency_ms']['mean']} ms por frame)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"frames": len(frames), "faces": faces, "rows": rows, "cheapest": best}, f, indent=2)
+        print(f"[Sweep] ✅ Resultados guardados en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Utilidades compartidas por los benchmarks.
+"""
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Percentiles 50/95/99, máximo y media de una lista de latencias."""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+    array = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(array, (50, 95, 99))
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(array.max()), 2),
+        "mean": round(float(array.mean()), 2)
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silencia los print de los servicios mientras se mide (su formateo sigue contando)."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+class InProcessServer:
+    """
+    Levanta en un hilo un servidor uvicorn en 127.0.0.1 (puerto libre) con los
+    routers indicados (por defecto, el router real de /ws/detect/blink).
+
+    Attributes:
+        url: Base WebSocket del servidor ("ws://127.0.0.1:<puerto>")
+        http_url: Base HTTP del servidor ("http://127.0.0.1:<puerto>")
+    """
+
+    def __init__(self, routers: Sequence = (), name: str = "benchmark-server"):
+        import uvicorn
+        from fastapi import FastAPI
+
+        from services.inference_executor import shutdown_inference_executor
+
+        if not routers:
+            from endpoints.websockets import blink_detection
+            routers = (blink_detection.router,)
+
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+        app.add_event_handler("shutdown", shutdown_inference_executor)
+
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name=name, daemon=True)
+        self.url = ""
+        self.http_url = ""
+
+    def __enter__(self) -> "InProcessServer":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("No se pudo iniciar el servidor de pruebas")
+            time.sleep(0.05)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        self.http_url = f"http://127.0.0.1:{port}"
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=30)
@@ -0,0 +1,614 @@
+"""
+Prueba de carga de un nodo: cientos de estudiantes simulados a la vez.
+
+Cada estudiante recorre el flujo completo de una sesión de estudio:
+1. POST /sessions/start
+2. Abre /ws/blink/count y /ws/detect/blink?session_id=... y envía frames al
+   ritmo indicado durante --session-seconds (espera cada respuesta antes del
+   siguiente frame, como la cámara del navegador).
+3. POST /sessions/end (genera el cuestionario)
+4. POST /sessions/quiz/submit
+
+Supabase y Gemini se sustituyen por dobles locales con latencia configurable:
+- FakeSupabase guarda las tablas en memoria y duerme con time.sleep en cada
+  execute(), igual que el cliente síncrono real bloquea el bucle de eventos.
+- FakeAIService duerme con asyncio.sleep y devuelve preguntas fijas.
+
+La concurrencia sube por niveles (--levels 10,50,100,200). Para cada nivel se
+informa, por endpoint, el número de peticiones, errores, respuestas "busy",
+rendimiento y latencias p50/p95/p99. La prueba se detiene en el primer nivel
+que supera la tasa de error (--max-error-rate) o la latencia p95 de los frames
+(--max-frame-p95-ms): ese es el punto de ruptura del nodo.
+
+El servidor se levanta en el propio proceso (uvicorn en 127.0.0.1 con los
+routers reales de sesiones, /ws/detect/blink y /ws/blink/count); la inferencia
+se ejecuta en los procesos del ejecutor, como en producción.
+
+Uso (desde backend/):
+    python -m benchmarks.load_test --levels 10,50,100,200 --session-seconds 20
+    python -m benchmarks.load_test --levels 50 --ai-latency 4 --output carga.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import cv2
+
+from benchmarks.harness import InProcessServer, percentiles, quiet
+
+
+SUPABASE_MODULES = (
+    "endpoints.api.sessions",
+    "endpoints.api.classes",
+    "endpoints.api.tasks",
+    "endpoints.api.video_genai",
+    "endpoints.websockets.class_live"
+)
+AI_MODULES = ("services.ai_service", "endpoints.api.sessions", "endpoints.api.video_genai")
+
+ENDPOINTS = (
+    "POST /sessions/start",
+    "WS /ws/blink/count",
+    "WS /ws/detect/blink (conexión)",
+    "WS /ws/detect/blink (frame)",
+    "POST /sessions/end",
+    "POST /sessions/quiz/submit"
+)
+
+
+class FakeAPIError(Exception):
+    """Error equivalente al de PostgREST (por ejemplo, .single() sin exactamente una fila)."""
+
+
+class FakeResponse:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class FakeQuery:
+    """
+    Consulta encadenable con el subconjunto de la API de supabase-py que usa el backend:
+    select / insert / update / delete, eq, order, limit, single y execute.
+    """
+
+    def __init__(self, client: "FakeSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._operation = "select"
+        self._values: Any = None
+        self._filters: List[Tuple[str, Any]] = []
+        self._limit: Optional[int] = None
+        self._single = False
+
+    def select(self, *columns: str, **kwargs) -> "FakeQuery":
+        self._operation = "select"
+        return self
+
+    def insert(self, rows: Any, **kwargs) -> "FakeQuery":
+        self._operation, self._values = "insert", rows
+        return self
+
+    def update(self, values: Dict[str, Any], **kwargs) -> "FakeQuery":
+        self._operation, self._values = "update", values
+        return self
+
+    def delete(self, **kwargs) -> "FakeQuery":
+        self._operation = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, value))
+        return self
+
+    def order(self, *args, **kwargs) -> "FakeQuery":
+        return self
+
+    def limit(self, count: int, **kwargs) -> "FakeQuery":
+        self._limit = count
+        return self
+
+    def single(self) -> "FakeQuery":
+        self._single = True
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(str(row.get(column)) == str(value) for column, value in self._filters)
+
+    def execute(self) -> FakeResponse:
+        self._client.wait()
+        with self._client.lock:
+            rows = self._client.tables.setdefault(self._table, [])
+            if self._operation == "insert":
+                inserted = []
+                for row in self._values if isinstance(self._values, list) else [self._values]:
+                    row = {"id": str(uuid.uuid4()), "created_at": datetime.utcnow().isoformat(), **row}
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return FakeResponse(inserted)
+
+            matched = [row for row in rows if self._matches(row)]
+            if self._operation == "update":
+                for row in matched:
+                    row.update(self._values)
+            elif self._operation == "delete":
+                self._client.tables[self._table] = [row for row in rows if not self._matches(row)]
+            if self._limit is not None:
+                matched = matched[:self._limit]
+            data = [dict(row) for row in matched]
+
+        if self._single:
+            if len(data) != 1:
+                raise FakeAPIError(f"{self._table}: se esperaba una fila y hay {len(data)}")
+            return FakeResponse(data[0])
+        return FakeResponse(data)
+
+
+class FakeSupabase:
+    """
+    Cliente de Supabase en memoria con latencia configurable por llamada.
+
+    La espera es bloqueante (time.sleep), como la del cliente síncrono real:
+    mientras dura, el bucle de eventos del servidor no atiende otras peticiones.
+    """
+
+    def __init__(self, latency: float = 0.03, jitter: float = 0.01):
+        """
+        Args:
+            latency: Segundos de cada llamada a execute()
+            jitter: Variación aleatoria máxima (± segundos) de la latencia
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def wait(self) -> None:
+        self.calls += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def seed_task(self, questions_count: int = 5) -> str:
+        """
+        Crea la tarea (video con transcripción) que ven todos los estudiantes.
+
+        Returns:
+            str: ID de la tarea
+        """
+        task_id = str(uuid.uuid4())
+        self.tables.setdefault("tasks", []).append({
+            "id": task_id,
+            "class_id": str(uuid.uuid4()),
+            "title": "Fotosíntesis",
+            "description": "Clase grabada de biología",
+            "transcription": "Las plantas transforman la luz en energía química. " * 40,
+            "questions_count": questions_count
+        })
+        return task_id
+
+
+class FakeAIService:
+    """
+    Sustituto de AIService (Gemini) con latencia configurable y respuestas fijas.
+    """
+
+    def __init__(self, latency: float = 2.0, jitter: float = 0.5):
+        """
+        Args:
+            latency: Segundos de cada llamada al modelo
+            jitter: Variación aleatoria máxima (± segundos) de la latencia
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def _wait(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def summarize_text(self, text: str) -> str:
+        await self._wait()
+        return text[:200]
+
+    async def generate_summary(self, text: str) -> str:
+        return await self.summarize_text(text)
+
+    async def generate_quiz(self, text: str, attention_score: float, num_questions: int = 5) -> list:
+        await self._wait()
+        return [
+            {
+                "question": f"Pregunta {i + 1}",
+                "options": ["Opción A", "Opción B", "Opción C", "Opción D"],
+                "correct_answer": "Opción A"
+            }
+            for i in range(num_questions)
+        ]
+
+    async def generate_summary_from_video(self, video_path: str) -> str:
+        await self._wait()
+        return "Resumen del video"
+
+
+def install_fakes(supabase: FakeSupabase, ai: FakeAIService) -> None:
+    """
+    Sustituye el cliente de Supabase de los módulos de endpoints/api y el servicio
+    de IA por los dobles locales. Solo afecta a los módulos ya importados (el de
+    sesiones se importa siempre).
+    """
+    import endpoints.api.sessions  # noqa: F401
+
+    for name in SUPABASE_MODULES:
+        module = sys.modules.get(name)
+        if module is not None:
+            module.supabase = supabase
+    for name in AI_MODULES:
+        module = sys.modules.get(name)
+        if module is not None:
+            module.ai_service = ai
+
+
+class EndpointStats:
+    """Peticiones, errores, respuestas "busy" y latencias (ms) de un endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.busy = 0
+        self.latencies: List[float] = []
+
+    def ok(self, started: float, finished: Optional[float] = None) -> None:
+        self.requests += 1
+        self.latencies.append(((finished or time.perf_counter()) - started) * 1000.0)
+
+    def error(self) -> None:
+        self.requests += 1
+        self.errors += 1
+
+    def rejected(self) -> None:
+        self.requests += 1
+        self.busy += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "busy": self.busy,
+            "error_rate": round((self.errors + self.busy) / self.requests, 4) if self.requests else 0.0,
+            "throughput_rps": round(len(self.latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": percentiles(self.latencies)
+        }
+
+
+def load_frames(paths: Optional[List[str]] = None, count: int = 4, max_side: int = 480, quality: int = 70) -> List[bytes]:
+    """
+    Prepara los frames JPEG que envían los estudiantes.
+
+    Args:
+        paths: Imágenes a usar (por defecto, rostros sintéticos)
+        count: Número de rostros sintéticos si no se indican imágenes
+        max_side: Lado mayor (px) de los frames
+        quality: Calidad JPEG (0-100)
+    """
+    if paths:
+        from benchmarks.vision_benchmark import load_images
+        images = load_images(paths)
+    else:
+        from benchmarks.vision_benchmark import generate_faces
+        images = generate_faces(count, size=max_side)
+
+    frames = []
+    for img in images:
+        scale = max_side / max(img.shape[:2])
+        if scale < 1.0:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+class LoadTest:
+    """
+    Simula estudiantes concurrentes contra un servidor con los dobles instalados.
+    """
+
+    def __init__(
+        self,
+        http_url: str,
+        ws_url: str,
+        task_id: str,
+        frames: List[bytes],
+        session_seconds: float = 20.0,
+        fps: float = 5.0,
+        ramp_seconds: float = 5.0,
+        timeout: float = 30.0
+    ):
+        """
+        Args:
+            http_url: Base HTTP del servidor
+            ws_url: Base WebSocket del servidor
+            task_id: Tarea sembrada en FakeSupabase
+            frames: Frames JPEG que cada estudiante envía en bucle
+            session_seconds: Duración del envío de frames de cada estudiante
+            fps: Frames por segundo de cada estudiante
+            ramp_seconds: Segundos en los que se reparten las llegadas de un nivel
+            timeout: Segundos máximos de cada petición o respuesta
+        """
+        self.http_url = http_url.rstrip("/")
+        self.ws_url = ws_url.rstrip("/")
+        self.task_id = task_id
+        self.frames = frames
+        self.session_seconds = session_seconds
+        self.fps = fps
+        self.ramp_seconds = ramp_seconds
+        self.timeout = timeout
+
+    async def warm_up(self) -> None:
+        """Envía un frame y espera la respuesta para que la carga de los modelos no cuente."""
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"{self.ws_url}/ws/detect/blink", max_msg_size=0) as ws:
+                await ws.send_bytes(self.frames[0])
+                while True:
+                    msg = await ws.receive(timeout=120)
+                    if msg.type != aiohttp.WSMsgType.TEXT or "seq" in json.loads(msg.data):
+                        break
+
+    async def run_level(self, students: int) -> Dict[str, Any]:
+        """
+        Ejecuta un nivel de concurrencia.
+
+        Returns:
+            dict: Estudiantes, duración y estadísticas por endpoint
+        """
+        stats = {name: EndpointStats() for name in ENDPOINTS}
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        started = time.perf_counter()
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            interval = self.ramp_seconds / students if students else 0.0
+            await asyncio.gather(*(
+                self._student(session, stats, f"alumno-{students}-{i}", i * interval)
+                for i in range(students)
+            ))
+        elapsed = time.perf_counter() - started
+        return {
+            "students": students,
+            "duration_s": round(elapsed, 3),
+            "endpoints": {name: endpoint.report(elapsed) for name, endpoint in stats.items()}
+        }
+
+    async def _post(
+        self,
+        session: aiohttp.ClientSession,
+        stats: EndpointStats,
+        path: str,
+        payload: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{self.http_url}{path}", json=payload) as response:
+                body = await response.json(content_type=None)
+                if response.status == 503:
+                    stats.rejected()
+                    return None
+                if response.status >= 400:
+                    stats.error()
+                    return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            stats.error()
+            return None
+        stats.ok(started)
+        return body
+
+    async def _student(
+        self,
+        session: aiohttp.ClientSession,
+        stats: Dict[str, EndpointStats],
+        student_id: str,
+        delay: float
+    ) -> None:
+        await asyncio.sleep(delay)
+
+        body = await self._post(session, stats["POST /sessions/start"], "/sessions/start", {
+            "task_id": self.task_id,
+            "student_id": student_id
+        })
+        if body is None:
+            return
+        session_id = body["session"]["id"]
+
+        counter = asyncio.create_task(self._count_socket(session, stats["WS /ws/blink/count"]))
+        try:
+            await self._blink_socket(session, stats, session_id)
+        finally:
+            counter.cancel()
+            await asyncio.gather(counter, return_exceptions=True)
+
+        body = await self._post(session, stats["POST /sessions/end"], "/sessions/end", {
+            "session_id": session_id,
+            "attention_level": "medio"
+        })
+        if body is None:
+            return
+        answers = {f"q{i}": question["options"][0] for i, question in enumerate(body["questions"])}
+        await self._post(session, stats["POST /sessions/quiz/submit"], "/sessions/quiz/submit", {
+            "quiz_id": body["quiz_id"],
+            "answers": answers
+        })
+
+    async def _count_socket(self, session: aiohttp.ClientSession, stats: EndpointStats) -> None:
+        """Abre /ws/blink/count, mide la llegada del contador inicial y escucha hasta que se cancele."""
+        started = time.perf_counter()
+        try:
+            async with session.ws_connect(f"{self.ws_url}/ws/blink/count") as ws:
+                msg = await ws.receive(timeout=self.timeout)
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    stats.error()
+                    return
+                stats.ok(started)
+                async for _ in ws:
+                    pass
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            stats.error()
+
+    async def _blink_socket(self, session: aiohttp.ClientSession, stats: Dict[str, EndpointStats], session_id: str) -> None:
+        """Envía frames a /ws/detect/blink durante la sesión, esperando cada respuesta."""
+        connection = stats["WS /ws/detect/blink (conexión)"]
+        frame_stats = stats["WS /ws/detect/blink (frame)"]
+        started = time.perf_counter()
+        try:
+            ws = await session.ws_connect(f"{self.ws_url}/ws/detect/blink?session_id={session_id}", max_msg_size=0)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            connection.error()
+            return
+
+        handshake = time.perf_counter()
+        admitted = rejected = False
+        try:
+            period = 1.0 / self.fps if self.fps > 0 else 0.0
+            offset = random.randrange(len(self.frames))
+            deadline = time.perf_counter() + self.session_seconds
+            seq = 0
+            while time.perf_counter() < deadline:
+                tick = time.perf_counter()
+                seq += 1
+                await ws.send_bytes(self.frames[(offset + seq) % len(self.frames)])
+                while True:
+                    msg = await ws.receive(timeout=self.timeout)
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        frame_stats.error()
+                        return
+                    data = json.loads(msg.data)
+                    if data.get("type") == "busy" and "seq" not in data:
+                        # Conexión rechazada por el control de admisión (se cierra con 1013)
+                        connection.rejected()
+                        rejected = True
+                        return
+                    if data.get("seq", 0) >= seq:
+                        break
+                if not admitted:
+                    admitted = True
+                    connection.ok(started, handshake)
+                if data.get("type") == "busy":
+                    frame_stats.rejected()
+                elif "error" in data:
+                    frame_stats.error()
+                else:
+                    frame_stats.ok(tick)
+                await asyncio.sleep(max(0.0, tick + period - time.perf_counter()))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError):
+            frame_stats.error()
+        finally:
+            await ws.close()
+            if not admitted and not rejected:
+                connection.ok(started, handshake)
+
+
+def find_breaking_point(level: Dict[str, Any], max_error_rate: float, max_frame_p95_ms: float) -> Optional[str]:
+    """
+    Indica por qué un nivel supera los límites (None si los cumple).
+    """
+    for name, endpoint in level["endpoints"].items():
+        if endpoint["requests"] and endpoint["error_rate"] > max_error_rate:
+            return f"{name}: tasa de error {endpoint['error_rate']:.1%}"
+    frame_p95 = level["endpoints"]["WS /ws/detect/blink (frame)"]["latency_ms"]["p95"]
+    if max_frame_p95_ms > 0 and frame_p95 > max_frame_p95_ms:
+        return f"WS /ws/detect/blink (frame): p95 {frame_p95} ms"
+    return None
+
+
+def print_level(level: Dict[str, Any]) -> None:
+    print(f"[Load] {level['students']} estudiantes en {level['duration_s']} s")
+    print(f"  {'endpoint':32} {'peticiones':>10} {'errores':>8} {'busy':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, endpoint in level["endpoints"].items():
+        latency = endpoint["latency_ms"]
+        print(
+            f"  {name:32} {endpoint['requests']:>10} {endpoint['errors']:>8} {endpoint['busy']:>6}"
+            f" {endpoint['throughput_rps']:>8} {latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8}"
+        )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga con estudiantes simulados")
+    parser.add_argument("--levels", type=_int_list, default=[10, 50, 100, 200], help="Estudiantes concurrentes por nivel")
+    parser.add_argument("--session-seconds", type=float, default=20.0, help="Segundos de envío de frames por estudiante")
+    parser.add_argument("--fps", type=float, default=5.0, help="Frames por segundo de cada estudiante")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="Segundos en los que llegan los estudiantes de un nivel")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Segundos máximos por petición o respuesta")
+    parser.add_argument("--images", nargs="*", default=None, help="Imágenes de los frames (por defecto, rostros sintéticos)")
+    parser.add_argument("--static", action="store_true", help="Enviar siempre el mismo frame (estudiante inmóvil)")
+    parser.add_argument("--questions", type=int, default=5, help="Preguntas de cada cuestionario")
+    parser.add_argument("--supabase-latency", type=float, default=0.03, help="Segundos de cada llamada a Supabase")
+    parser.add_argument("--supabase-jitter", type=float, default=0.01, help="Variación (± s) de la latencia de Supabase")
+    parser.add_argument("--ai-latency", type=float, default=2.0, help="Segundos de cada llamada a Gemini")
+    parser.add_argument("--ai-jitter", type=float, default=0.5, help="Variación (± s) de la latencia de Gemini")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Tasa de error (incluye busy) que marca la ruptura")
+    parser.add_argument("--max-frame-p95-ms", type=float, default=1000.0, help="Latencia p95 de frames que marca la ruptura (0 = sin límite)")
+    parser.add_argument("--keep-going", action="store_true", help="Seguir con los niveles siguientes tras la ruptura")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes del servidor durante la carga")
+    parser.add_argument("--output", default=None, help="Archivo JSON donde guardar el informe")
+    args = parser.parse_args(argv)
+
+    fake_supabase = FakeSupabase(args.supabase_latency, args.supabase_jitter)
+    fake_ai = FakeAIService(args.ai_latency, args.ai_jitter)
+    install_fakes(fake_supabase, fake_ai)
+    task_id = fake_supabase.seed_task(args.questions)
+    frames = load_frames(args.images)
+    if args.static:
+        frames = frames[:1]
+
+    from endpoints.api import sessions
+    from endpoints.websockets import blink_count, blink_detection
+
+    report: Dict[str, Any] = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "levels": [],
+        "breaking_point": None
+    }
+    with InProcessServer((sessions.router, blink_detection.router, blink_count.router), name="load-server") as server:
+        test = LoadTest(
+            server.http_url, server.url, task_id, frames,
+            args.session_seconds, args.fps, args.ramp_seconds, args.timeout
+        )
+        asyncio.run(test.warm_up())
+        for students in args.levels:
+            if args.verbose:
+                level = asyncio.run(test.run_level(students))
+            else:
+                with quiet():
+                    level = asyncio.run(test.run_level(students))
+            report["levels"].append(level)
+            print_level(level)
+            reason = find_breaking_point(level, args.max_error_rate, args.max_frame_p95_ms)
+            if reason and report["breaking_point"] is None:
+                report["breaking_point"] = {"students": students, "reason": reason}
+                print(f"[Load] ⚠️ Punto de ruptura: {students} estudiantes ({reason})")
+                if not args.keep_going:
+                    break
+
+    if report["breaking_point"] is None:
+        print(f"[Load] ✅ Sin ruptura hasta {args.levels[-1]} estudiantes")
+    print(f"[Load] Llamadas simuladas: Supabase {fake_supabase.calls}, Gemini {fake_ai.calls}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Load] ✅ Informe guardado en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
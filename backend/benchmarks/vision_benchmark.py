@@ -0,0 +1,374 @@
+"""
+Micro-benchmark del pipeline de visión: cuánto cuesta cada etapa de un frame.
+
+Cada imagen de muestra se reescala a cada resolución, se codifica en JPEG con
+cada calidad y pasa por las etapas que recorre un frame en /detect/blink y
+/ws/detect/blink, medidas por separado:
+
+- decode: utils.image_utils.base64_to_opencv
+- color: conversión BGR -> RGB (utils.image_utils.bgr_to_rgb)
+- face: FaceDetectionService.detect_face
+- blink: BlinkDetectionService.detect_blink
+- ear: cálculo del EAR y del parpadeo a partir de los landmarks
+- json: serialización de la respuesta del WebSocket
+
+Para cada etapa se informa p50/p95/p99 (ms), frames por segundo y frames por
+segundo por núcleo (a partir del tiempo de CPU del proceso, que incluye los
+hilos de MediaPipe). Los resultados se pueden guardar como línea base y
+comparar después: el comando termina con código 1 si alguna etapa empeora.
+
+Sin --images se usan rostros sintéticos generados con OpenCV; MediaPipe puede
+no detectarlos, por lo que el informe indica la fracción de imágenes con
+rostro ("rostros", campo faces del JSON) (sin rostro, face/blink son más baratos). Para medidas
+representativas, pasar fotos reales de rostros.
+
+Uso (desde backend/):
+    python -m benchmarks.vision_benchmark --images fotos/ --save-baseline benchmarks/baseline.json
+    python -m benchmarks.vision_benchmark --images fotos/ --baseline benchmarks/baseline.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.harness import quiet
+from core.config import settings
+from services.landmark_features import NUM_REFINED_LANDMARKS, landmarks_to_array, to_pixels
+from utils.image_utils import base64_to_opencv, bgr_to_rgb
+
+
+STAGES = ("decode", "color", "face", "blink", "ear", "json")
+
+# Extensiones de imagen aceptadas al recorrer un directorio de muestras
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def generate_faces(count: int = 4, size: int = 1280) -> List[np.ndarray]:
+    """
+    Genera rostros sintéticos (óvalo, ojos, cejas, nariz y boca) sobre fondos distintos.
+
+    Args:
+        count: Número de imágenes
+        size: Lado mayor de cada imagen (proporción 4:3)
+
+    Returns:
+        Lista de imágenes BGR
+    """
+    rng = np.random.default_rng(0)
+    width, height = size, size * 3 // 4
+    images = []
+    for i in range(count):
+        img = np.empty((height, width, 3), dtype=np.uint8)
+        img[:] = rng.integers(40, 200, size=3)
+        noise = rng.normal(0, 6, size=img.shape)
+        img = np.clip(img + noise, 0, 255).astype(np.uint8)
+
+        cx = width // 2 + int(rng.integers(-width // 10, width // 10))
+        cy = height // 2
+        fw, fh = int(height * 0.22), int(height * 0.30)
+        skin = tuple(int(c) for c in rng.integers((120, 150, 180), (170, 190, 235)))
+        cv2.ellipse(img, (cx, cy), (fw, fh), 0, 0, 360, skin, -1, cv2.LINE_AA)
+
+        # Ojos (abiertos o entornados para variar el EAR), cejas, nariz y boca
+        eye_h = max(2, int(fh * (0.10 if i % 2 == 0 else 0.03)))
+        for side in (-1, 1):
+            ex, ey = cx + side * int(fw * 0.42), cy - int(fh * 0.18)
+            cv2.ellipse(img, (ex, ey), (int(fw * 0.22), eye_h), 0, 0, 360, (245, 245, 245), -1, cv2.LINE_AA)
+            cv2.circle(img, (ex, ey), max(1, min(eye_h, int(fw * 0.09))), (40, 30, 20), -1, cv2.LINE_AA)
+            cv2.line(img, (ex - int(fw * 0.25), ey - int(fh * 0.17)), (ex + int(fw * 0.25), ey - int(fh * 0.2)),
+                     (50, 40, 30), max(2, fh // 30), cv2.LINE_AA)
+        cv2.line(img, (cx, cy - int(fh * 0.05)), (cx - int(fw * 0.08), cy + int(fh * 0.22)),
+                 tuple(int(c * 0.8) for c in skin), max(2, fh // 40), cv2.LINE_AA)
+        cv2.ellipse(img, (cx, cy + int(fh * 0.5)), (int(fw * 0.35), int(fh * 0.08)), 0, 0, 180,
+                    (60, 60, 160), max(2, fh // 30), cv2.LINE_AA)
+        images.append(img)
+    return images
+
+
+def load_images(paths: List[str]) -> List[np.ndarray]:
+    """
+    Carga las imágenes de muestra (archivos o directorios).
+
+    Raises:
+        ValueError: Si no se encuentra ninguna imagen válida
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(_IMAGE_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+    images = [img for img in (cv2.imread(f) for f in files) if img is not None]
+    if not images:
+        raise ValueError(f"No se encontraron imágenes válidas en: {', '.join(paths)}")
+    return images
+
+
+def prepare_sample(img: np.ndarray, max_side: int, quality: int) -> str:
+    """Reescala una imagen a max_side, la codifica en JPEG y la devuelve en Base64."""
+    scale = max_side / max(img.shape[:2])
+    if scale != 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("No se pudo codificar la imagen de muestra")
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
+
+
+def summarize(wall_ns: List[int], cpu_ns: List[int]) -> Dict[str, float]:
+    """Percentiles (ms) y ritmo de una etapa a partir de sus tiempos por llamada."""
+    wall = np.asarray(wall_ns, dtype=np.float64) / 1e6
+    cpu = np.asarray(cpu_ns, dtype=np.float64) / 1e9
+    p50, p95, p99 = np.percentile(wall, (50, 95, 99))
+    return {
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "fps": round(1000.0 / float(wall.mean()), 1) if wall.mean() > 0 else 0.0,
+        "fps_per_core": round(1.0 / float(cpu.mean()), 1) if cpu.mean() > 0 else 0.0,
+    }
+
+
+class VisionBenchmark:
+    """
+    Ejecuta las etapas del pipeline con los mismos servicios que usan los trabajadores.
+    """
+
+    def __init__(self, stages: Tuple[str, ...] = STAGES):
+        # MediaPipe solo se importa al crear el benchmark (se puede importar el módulo sin él)
+        from services.blink_detection_service import BlinkDetectionService
+        from services.face_detection_service import FaceDetectionService
+
+        self.stages = stages
+        self.face_service = FaceDetectionService(
+            model_selection=settings.face_detection_model_selection,
+            min_detection_confidence=settings.face_detection_min_confidence
+        )
+        self.blink_service = BlinkDetectionService()
+        self._rgb_buffer = None
+
+    def run_config(
+        self,
+        images: List[np.ndarray],
+        max_side: int,
+        quality: int,
+        iterations: int,
+        warmup: int
+    ) -> Dict[str, Any]:
+        """
+        Mide todas las etapas para una resolución y calidad JPEG.
+
+        Returns:
+            dict con las estadísticas por etapa, la del frame completo y la fracción de imágenes con rostro
+        """
+        samples = [prepare_sample(img, max_side, quality) for img in images]
+
+        # Landmarks de referencia de cada muestra para la etapa "ear" (sin rostro: landmarks sintéticos)
+        decoded = [base64_to_opencv(sample) for sample in samples]
+        landmarks = []
+        faces = 0
+        with quiet():
+            for img in decoded:
+                face_landmarks = self.blink_service.detect_landmarks(img)
+                if face_landmarks is not None:
+                    faces += 1
+                    landmarks.append(to_pixels(landmarks_to_array(face_landmarks), img.shape))
+                else:
+                    points = np.random.default_rng(0).random((NUM_REFINED_LANDMARKS, 3), dtype=np.float32)
+                    landmarks.append(to_pixels(points, img.shape))
+
+        wall = {stage: [] for stage in self.stages}
+        cpu = {stage: [] for stage in self.stages}
+        frame_wall, frame_cpu = [], []
+
+        with quiet():
+            for iteration in range(warmup + iterations):
+                for index, sample in enumerate(samples):
+                    timings = self._run_frame(sample, landmarks[index])
+                    if iteration < warmup:
+                        continue
+                    for stage, (wall_ns, cpu_ns) in timings.items():
+                        wall[stage].append(wall_ns)
+                        cpu[stage].append(cpu_ns)
+                    frame_wall.append(sum(t[0] for t in timings.values()))
+                    frame_cpu.append(sum(t[1] for t in timings.values()))
+
+        stats = {stage: summarize(wall[stage], cpu[stage]) for stage in self.stages}
+        stats["frame"] = summarize(frame_wall, frame_cpu)
+        return {
+            "stages": stats,
+            "faces": round(faces / len(samples), 3),
+            "payload_bytes": int(np.mean([len(sample) for sample in samples]))
+        }
+
+    def _run_frame(self, sample: str, points: np.ndarray) -> Dict[str, Tuple[int, int]]:
+        """Ejecuta las etapas seleccionadas sobre un frame y devuelve (ns de reloj, ns de CPU) de cada una."""
+        timings = {}
+        results: Dict[str, Any] = {}
+
+        def measure(stage: str, fn: Callable[[], Any]) -> None:
+            if stage not in self.stages:
+                return
+            wall_start, cpu_start = time.perf_counter_ns(), time.process_time_ns()
+            results[stage] = fn()
+            timings[stage] = (time.perf_counter_ns() - wall_start, time.process_time_ns() - cpu_start)
+
+        img = base64_to_opencv(sample) if "decode" not in self.stages else None
+        measure("decode", lambda: base64_to_opencv(sample))
+        img = results.get("decode", img)
+
+        def color():
+            self._rgb_buffer = bgr_to_rgb(img, self._rgb_buffer)
+            return self._rgb_buffer
+
+        measure("color", color)
+        measure("face", lambda: self.face_service.detect_face(img))
+        measure("blink", lambda: self.blink_service.detect_blink(img))
+        measure("ear", lambda: self.blink_service.evaluate_points(points))
+
+        blink = results.get("blink") or results.get("ear")
+        if blink is not None:
+            payload = {**jsonable_encoder(blink), "seq": 1, "dropped": 0, "reused": False, "skip_ratio": 0.0}
+            measure("json", lambda: json.dumps(payload))
+        return timings
+
+
+def compare_with_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    metric: str = "p50_ms",
+    tolerance: float = 0.2,
+    min_delta_ms: float = 0.05
+) -> List[str]:
+    """
+    Compara los resultados con una línea base.
+
+    Una etapa empeora si su métrica supera la de la línea base en más de
+    tolerance (fracción) y en más de min_delta_ms (evita falsos positivos en
+    etapas de microsegundos).
+
+    Returns:
+        Lista de regresiones en texto (vacía si no hay)
+    """
+    regressions = []
+    for config, current in results["configs"].items():
+        base_config = baseline.get("configs", {}).get(config)
+        if base_config is None:
+            continue
+        for stage, stats in current["stages"].items():
+            base_stats = base_config["stages"].get(stage)
+            if base_stats is None:
+                continue
+            value, reference = stats[metric], base_stats[metric]
+            if value > reference * (1.0 + tolerance) and value - reference > min_delta_ms:
+                regressions.append(
+                    f"{config} {stage}: {metric} {reference:.3f} -> {value:.3f} ms (+{(value / reference - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """Imprime una tabla por configuración."""
+    for config, data in results["configs"].items():
+        print(f"\n[Benchmark] {config}  (rostros: {data['faces']:.0%}, payload: {data['payload_bytes']} bytes en Base64)")
+        print(f"  {'etapa':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}{'fps/núcleo':>12}")
+        for stage, stats in data["stages"].items():
+            print(
+                f"  {stage:<8}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+                f"{stats['fps']:>10.1f}{stats['fps_per_core']:>12.1f}"
+            )
+
+
+def run_benchmark(
+    images: List[np.ndarray],
+    resolutions: List[int],
+    qualities: List[int],
+    iterations: int = 20,
+    warmup: int = 3,
+    stages: Tuple[str, ...] = STAGES
+) -> Dict[str, Any]:
+    """
+    Ejecuta el benchmark para cada combinación de resolución y calidad JPEG.
+
+    Returns:
+        dict {"meta": {...}, "configs": {"<lado>px_q<calidad>": {...}}}
+    """
+    benchmark = VisionBenchmark(stages=stages)
+    configs = {}
+    for max_side in resolutions:
+        for quality in qualities:
+            config = f"{max_side}px_q{quality}"
+            print(f"[Benchmark] ⏱️ {config}...", file=sys.stderr)
+            configs[config] = benchmark.run_config(images, max_side, quality, iterations, warmup)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "images": len(images),
+            "iterations": iterations,
+        },
+        "configs": configs
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark de las etapas del pipeline de visión")
+    parser.add_argument("--images", nargs="*", default=None, help="Imágenes o directorios de rostros (por defecto, rostros sintéticos)")
+    parser.add_argument("--resolutions", type=_int_list, default=[320, 480, 640, 1280], help="Lados mayores en px, separados por comas")
+    parser.add_argument("--qualities", type=_int_list, default=[50, 70, 90], help="Calidades JPEG, separadas por comas")
+    parser.add_argument("--iterations", type=int, default=20, help="Repeticiones medidas por imagen y configuración")
+    parser.add_argument("--warmup", type=int, default=3, help="Repeticiones iniciales descartadas")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Etapas a medir, separadas por comas")
+    parser.add_argument("--output", default=None, help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--save-baseline", default=None, help="Guardar los resultados como línea base en este archivo")
+    parser.add_argument("--baseline", default=None, help="Línea base con la que comparar (código 1 si hay regresiones)")
+    parser.add_argument("--metric", default="p50_ms", choices=("p50_ms", "p95_ms", "p99_ms"), help="Métrica comparada con la línea base")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Empeoramiento absoluto mínimo para contar como regresión")
+    args = parser.parse_args(argv)
+
+    stages = tuple(stage for stage in args.stages.split(",") if stage in STAGES)
+    images = load_images(args.images) if args.images else generate_faces()
+    results = run_benchmark(images, args.resolutions, args.qualities, args.iterations, args.warmup, stages)
+    print_report(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"\n[Benchmark] ✅ Resultados guardados en {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("images") != results["meta"]["images"]:
+            print("[Benchmark] ⚠️ La línea base se midió con otro conjunto de imágenes")
+        regressions = compare_with_baseline(results, baseline, args.metric, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n[Benchmark] ❌ {len(regressions)} regresiones respecto a {args.baseline}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\n[Benchmark] ✅ Sin regresiones respecto a {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
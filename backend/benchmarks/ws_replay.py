@@ -0,0 +1,316 @@
+"""
+Reproducción de sesiones grabadas de /ws/detect/blink para medir la latencia de extremo a extremo.
+
+Las grabaciones (.wsrec, ver utils/ws_recording.py) se obtienen de dos formas:
+- En el servidor, configurando WS_RECORDING_DIR: cada conexión a /ws/detect/blink
+  se graba tal como llega (frames, instantes e intervalos entre llegadas).
+- A partir de un video, con el subcomando from-video (sin cámara ni servidor).
+
+El reproductor envía los mensajes con sus intervalos originales (o acelerados
+con --speed) y mide, por cada frame, el tiempo hasta su respuesta (emparejada
+por seq), los frames descartados por el servidor, las respuestas "busy" y el
+rendimiento. Por defecto levanta la aplicación en el propio proceso (uvicorn
+en 127.0.0.1 con el router real de /ws/detect/blink), así que funciona sin red
+y permite comparar versiones con la misma entrada; con --url se usa un servidor
+ya en marcha.
+
+Uso (desde backend/):
+    python -m benchmarks.ws_replay from-video clase.mp4 clase.wsrec --fps 10
+    python -m benchmarks.ws_replay replay clase.wsrec --speed 2 --output informe.json
+    python -m benchmarks.ws_replay replay clase.wsrec --url ws://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import aiohttp
+import cv2
+
+from benchmarks.harness import InProcessServer, percentiles
+from utils.ws_recording import WebSocketRecorder, WebSocketRecording, read_recording
+
+
+DEFAULT_ENDPOINT = "/ws/detect/blink"
+
+
+def recording_from_video(
+    video_path: str,
+    output_path: str,
+    fps: float = 10.0,
+    max_side: int = 480,
+    quality: int = 70,
+    query: str = ""
+) -> int:
+    """
+    Crea una grabación a partir de un video: frames JPEG binarios al ritmo indicado.
+
+    Args:
+        video_path: Archivo de video
+        output_path: Archivo .wsrec de salida
+        fps: Frames por segundo que se envían
+        max_side: Lado mayor (px) de los frames
+        quality: Calidad JPEG (0-100)
+        query: Parámetros de la URL con los que se reproducirá (por ejemplo "type=analyze")
+
+    Returns:
+        int: Número de frames grabados
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el video: {video_path}")
+
+    recorder = WebSocketRecorder(output_path, DEFAULT_ENDPOINT, query)
+    try:
+        video_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1.0, video_fps / fps)
+        next_sample = 0.0
+        index = 0
+        while True:
+            if index < int(next_sample):
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, img = capture.read()
+            if not ok:
+                break
+            scale = max_side / max(img.shape[:2])
+            if scale < 1.0:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+            recorder.write(encoded.tobytes(), at=index / video_fps)
+            index += 1
+            next_sample += step
+    finally:
+        capture.release()
+        frames = recorder.frames
+        recorder.close()
+    return frames
+
+
+def _expects_response(message: Union[bytes, str]) -> bool:
+    """Indica si el servidor asigna seq al mensaje (frames binarios, imágenes en JSON y landmarks)."""
+    if isinstance(message, bytes):
+        return True
+    try:
+        data = json.loads(message)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(data, dict) and (data.get("type") == "landmarks" or "image" in data)
+
+
+async def warm_up(
+    recording: WebSocketRecording,
+    url: str,
+    frames: int = 1,
+    query: Optional[str] = None,
+    timeout: float = 60.0
+) -> None:
+    """
+    Envía los primeros frames de la grabación por una conexión aparte y espera
+    cada respuesta, para que la carga de los modelos no cuente en la medida.
+    """
+    endpoint = recording.header.get("endpoint") or DEFAULT_ENDPOINT
+    query = recording.header.get("query", "") if query is None else query
+    messages = [message for _, message in recording.messages if _expects_response(message)][:frames]
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f"{url.rstrip('/')}{endpoint}" + (f"?{query}" if query else ""), max_msg_size=0) as ws:
+            for message in messages:
+                if isinstance(message, bytes):
+                    await ws.send_bytes(message)
+                else:
+                    await ws.send_str(message)
+                while True:
+                    msg = await ws.receive(timeout=timeout)
+                    if msg.type != aiohttp.WSMsgType.TEXT or "seq" in json.loads(msg.data):
+                        break
+
+
+async def replay(
+    recording: WebSocketRecording,
+    url: str,
+    speed: float = 1.0,
+    query: Optional[str] = None,
+    drain_timeout: float = 10.0
+) -> Dict[str, Any]:
+    """
+    Reproduce una grabación contra un servidor y mide las respuestas.
+
+    Args:
+        recording: Grabación a reproducir
+        url: Base del servidor (por ejemplo "ws://127.0.0.1:8000")
+        speed: Factor de velocidad (1 = ritmo original, 0 = lo más rápido posible)
+        query: Parámetros de la URL (por defecto, los de la grabación)
+        drain_timeout: Segundos que se esperan respuestas tras el último mensaje
+
+    Returns:
+        dict: Informe con latencias (ms), descartes, respuestas "busy" y rendimiento
+    """
+    endpoint = recording.header.get("endpoint") or DEFAULT_ENDPOINT
+    query = recording.header.get("query", "") if query is None else query
+    ws_url = f"{url.rstrip('/')}{endpoint}" + (f"?{query}" if query else "")
+
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    counts = {"responses": 0, "busy": 0, "errors": 0, "reused": 0, "control": 0, "unmatched": 0}
+    dropped = 0
+    last_seq = 0
+    done = asyncio.Event()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+
+            async def receive() -> None:
+                nonlocal dropped
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    received = time.perf_counter()
+                    data = json.loads(msg.data)
+                    if data.get("type") == "control":
+                        counts["control"] += 1
+                        continue
+                    seq = data.get("seq")
+                    if seq is None:
+                        continue
+                    counts["responses"] += 1
+                    dropped = max(dropped, data.get("dropped", 0))
+                    if data.get("type") == "busy":
+                        counts["busy"] += 1
+                    elif "error" in data:
+                        counts["errors"] += 1
+                    else:
+                        sent = sent_at.get(seq)
+                        if sent is None:
+                            # La numeración del servidor no coincide con la del replay
+                            # (mensajes que el replay no esperaba que se respondieran)
+                            counts["unmatched"] += 1
+                        else:
+                            latencies.append((received - sent) * 1000.0)
+                        counts["reused"] += bool(data.get("reused"))
+                    if seq == last_seq and sending_done:
+                        done.set()
+
+            sending_done = False
+            receiver = asyncio.create_task(receive())
+            started = time.perf_counter()
+            try:
+                for offset, message in recording.messages:
+                    if speed > 0:
+                        delay = started + offset / speed - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if _expects_response(message):
+                        last_seq += 1
+                        sent_at[last_seq] = time.perf_counter()
+                    if isinstance(message, bytes):
+                        await ws.send_bytes(message)
+                    else:
+                        await ws.send_str(message)
+                sending_done = True
+
+                # El último frame siempre se procesa (el más reciente gana): esperar su respuesta
+                if last_seq and not done.is_set():
+                    try:
+                        await asyncio.wait_for(done.wait(), timeout=drain_timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                elapsed = time.perf_counter() - started
+            finally:
+                await ws.close()
+                receiver.cancel()
+
+    answered = len(latencies)
+    gaps = [gap * 1000.0 for gap in recording.gaps()]
+    return {
+        "url": ws_url,
+        "speed": speed,
+        "messages": len(recording.messages),
+        "frames": last_seq,
+        "answered": answered,
+        "dropped": dropped,
+        "unanswered": max(0, last_seq - counts["responses"] - dropped),
+        "busy": counts["busy"],
+        "errors": counts["errors"],
+        "reused": counts["reused"],
+        "control": counts["control"],
+        "unmatched": counts["unmatched"],
+        "duration_s": round(elapsed, 3),
+        "throughput_fps": round(answered / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles(latencies),
+        "recording": {
+            "duration_s": round(recording.duration, 3),
+            "gap_ms": percentiles(gaps)
+        }
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency_ms"]
+    print(f"[Replay] {report['url']} (velocidad {report['speed']}x)")
+    print(f"  frames enviados:   {report['frames']} de {report['messages']} mensajes")
+    print(f"  respondidos:       {report['answered']} (reutilizados: {report['reused']})")
+    print(f"  descartados:       {report['dropped']}  sin respuesta: {report['unanswered']}")
+    print(f"  busy / errores:    {report['busy']} / {report['errors']}")
+    if report["unmatched"]:
+        print(f"  ⚠️ respuestas con seq desconocido: {report['unmatched']} (sin latencia)")
+    print(f"  rendimiento:       {report['throughput_fps']} frames/s en {report['duration_s']} s")
+    print(
+        f"  latencia (ms):     p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}"
+        f"  máx {latency['max']}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Grabación y reproducción de sesiones de /ws/detect/blink")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="Reproducir una grabación y medir la latencia")
+    replay_parser.add_argument("recording", help="Archivo .wsrec")
+    replay_parser.add_argument("--url", default=None, help="Servidor ya en marcha (por defecto, uno en el propio proceso)")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Factor de velocidad (0 = sin esperas)")
+    replay_parser.add_argument("--query", default=None, help="Parámetros de la URL (por defecto, los de la grabación)")
+    replay_parser.add_argument("--drain-timeout", type=float, default=10.0, help="Segundos de espera tras el último mensaje")
+    replay_parser.add_argument("--warmup", type=int, default=1, help="Frames enviados antes de medir (carga de los modelos)")
+    replay_parser.add_argument("--output", default=None, help="Archivo JSON donde guardar el informe")
+
+    video_parser = commands.add_parser("from-video", help="Crear una grabación a partir de un video")
+    video_parser.add_argument("video", help="Archivo de video")
+    video_parser.add_argument("output", help="Archivo .wsrec de salida")
+    video_parser.add_argument("--fps", type=float, default=10.0, help="Frames por segundo enviados")
+    video_parser.add_argument("--max-side", type=int, default=480, help="Lado mayor (px) de los frames")
+    video_parser.add_argument("--quality", type=int, default=70, help="Calidad JPEG (0-100)")
+    video_parser.add_argument("--query", default="", help="Parámetros de la URL (por ejemplo type=analyze)")
+    args = parser.parse_args(argv)
+
+    if args.command == "from-video":
+        frames = recording_from_video(args.video, args.output, args.fps, args.max_side, args.quality, args.query)
+        print(f"[Replay] ✅ {frames} frames grabados en {args.output}")
+        return 0
+
+    recording = read_recording(args.recording)
+
+    async def run(url: str) -> Dict[str, Any]:
+        if args.warmup > 0:
+            await warm_up(recording, url, args.warmup, args.query)
+        return await replay(recording, url, args.speed, args.query, args.drain_timeout)
+
+    if args.url:
+        report = asyncio.run(run(args.url))
+    else:
+        with InProcessServer() as server:
+            report = asyncio.run(run(server.url))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Replay] ✅ Informe guardado en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
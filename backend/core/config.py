@@ -28,8 +28,90 @@ class Settings(BaseSettings):
     # Configuración de detección de parpadeo
     ear_threshold: float = 1.55  # Umbral EAR para detectar si esta viendo a la pantalla. Valores más altos = más estricto
     
+    # Configuración del ejecutor de inferencia
+    inference_workers: int = 0  # Número de procesos de inferencia (0 = número de núcleos de CPU)
+    face_mesh_pool_size: int = 8  # Instancias de Face Mesh en modo streaming que cada proceso conserva para reutilizar
+    
+    # Control de admisión de la inferencia (respuestas "busy" en lugar de encolar)
+    admission_max_streams: int = 0  # Conexiones de streaming simultáneas admitidas (0 = 8 por proceso de inferencia)
+    admission_max_queue_depth: int = 0  # Trabajos de inferencia pendientes antes de rechazar frames (0 = 4 por proceso)
+    admission_frame_deadline: float = 1.0  # Segundos máximos de espera por el resultado de un frame (0 = sin plazo)
+    admission_max_batch_frames: int = 0  # Frames de lotes (/detect/blink/batch) en curso admitidos (0 = blink_batch_max_frames por proceso)
+    admission_stream_retry_after: float = 30.0  # Segundos sugeridos para reintentar una conexión rechazada
+    
+    # Configuración de decodificación de frames
+    frame_decode_target_side: int = 480  # Lado mayor (px) al que se reducen los frames para detección de parpadeo (0 = resolución completa)
+    max_frame_pixels: int = 2073600  # Frames con más píxeles (por defecto 1920x1080) se rechazan antes de decodificarlos
+    blink_batch_max_frames: int = 60  # Número máximo de frames aceptados por /detect/blink/batch
+    
+    # Configuración de la cascada detección facial -> Face Mesh
+    roi_margin: float = 0.5  # Margen alrededor del rostro al recortar la región de interés (fracción del tamaño del rostro)
+    roi_max_side: int = 256  # Lado mayor (px) al que se reduce la región de interés antes de Face Mesh
+    
+    # Omisión de frames casi idénticos en /ws/detect/blink
+    frame_similarity_tolerance: float = 4.0  # Diferencia máxima (niveles de gris por celda de la miniatura) para reutilizar el último resultado (0 = desactivado)
+    frame_similarity_max_reuse: int = 15  # Máximo de frames consecutivos que reutilizan un resultado antes de forzar una inferencia
+    
+    # Control adaptativo de la captura (mensajes "control" en /ws/detect/blink)
+    capture_max_fps: int = 15  # Ritmo de captura cerca del umbral EAR o durante un parpadeo
+    capture_idle_fps: int = 5  # Ritmo de captura con los ojos abiertos de forma estable
+    capture_min_fps: int = 1  # Ritmo mínimo aunque el servidor esté saturado
+    capture_target_utilization: float = 0.8  # Fracción de la capacidad de inferencia que se reparte entre las sesiones
+    capture_threshold_margin: float = 0.05  # Distancia relativa al umbral EAR que se considera "cerca del umbral"
+    capture_active_hold: float = 3.0  # Segundos que se mantiene el ritmo máximo tras acercarse al umbral
+    capture_control_interval: float = 2.0  # Segundos mínimos entre mensajes de control a un mismo cliente
+    
+    # Modo aula (/ws/classroom): una sola cámara para toda la clase
+    classroom_max_faces: int = 40  # Número máximo de rostros que busca Face Mesh en cada frame
+    classroom_decode_target_side: int = 1280  # Lado mayor (px) de los frames del aula (los rostros son pequeños)
+    classroom_iou_threshold: float = 0.3  # IoU mínimo para asociar un rostro a una identidad existente
+    classroom_max_missed: int = 15  # Frames sin ver un rostro antes de olvidar su identidad
+    classroom_max_yaw: float = 30.0  # Giro máximo (grados) para considerar que el estudiante mira al frente
+    classroom_max_pitch: float = 25.0  # Inclinación máxima (grados) para considerar que mira al frente
+    
+    # Análisis offline de videos grabados
+    video_sample_fps: float = 5.0  # Frames por segundo de video que se analizan
+    video_segment_seconds: int = 60  # Duración (s) de cada segmento que procesa un trabajador
+    video_analysis_dir: str = "temp_uploads"  # Carpeta donde se escriben las líneas de tiempo
+    video_analysis_workers: int = 1  # Procesos de inferencia propios del análisis (separados de los de tiempo real)
+    video_analysis_job_ttl: float = 86400.0  # Segundos que se conservan el estado de un análisis y su línea de tiempo
+    
+    # Línea de tiempo de atención por sesión de estudio (memoria acotada por sesión)
+    session_timeline_frames: int = 9000  # Frames recientes conservados (~10 min a 15 FPS, 9 bytes por frame)
+    session_timeline_seconds: int = 14400  # Segundos agregados conservados (4 horas, 18 bytes por segundo)
+    session_timeline_ttl: float = 3600.0  # Segundos sin frames antes de descartar una sesión no finalizada
+    session_max_yaw: float = 30.0  # Giro máximo (grados) frente a la cámara propia para contar un frame como atento
+    session_max_pitch: float = 25.0  # Inclinación máxima (grados) frente a la cámara propia para contar un frame como atento
+    attention_high_threshold: float = 0.7  # Puntaje por encima del cual la atención es 'alto'
+    attention_medium_threshold: float = 0.4  # Puntaje mínimo para una atención 'medio'
+    
+    # Contadores de parpadeos por sesión (memoria acotada con miles de sesiones)
+    blink_counter_max_keys: int = 10000  # Contadores en memoria; al superarlo se descartan los usados hace más tiempo
+    blink_counter_ttl: float = 3600.0  # Segundos sin parpadeos antes de descartar el contador de una sesión
+    blink_rate_window: float = 60.0  # Constante de tiempo (s) de la tasa de parpadeos por minuto
+    
+    # Estado compartido entre procesos de uvicorn (contadores, transcripciones y sesiones)
+    state_backend: str = "memory"  # "memory" (un solo proceso), "sqlite" (varios procesos en la máquina) o "redis"
+    state_sqlite_path: str = "temp_uploads/state.sqlite3"  # Archivo SQLite (modo WAL) del backend "sqlite"
+    state_redis_url: str = "redis://localhost:6379/0"  # Servidor del backend "redis" (requiere el paquete redis)
+    state_redis_prefix: str = "attention"  # Prefijo de las claves en Redis
+    state_poll_interval: float = 0.5  # Segundos entre consultas de los contadores con suscriptores (cambios de otros procesos y contadores caducados)
+    state_io_threads: int = 4  # Hilos que ejecutan las operaciones de los backends sqlite/redis fuera del loop de asyncio
+    session_state_sync_interval: float = 10.0  # Segundos entre copias de la línea de tiempo al backend compartido
+    transcription_job_ttl: float = 86400.0  # Segundos que se conserva el estado de una transcripción
+    
     # Configuración de WebSocket
-    websocket_check_interval: float = 0.5  # Intervalo en segundos para verificar cambios en WebSocket (blink_count)
+    blink_count_min_interval: float = 0.1  # Intervalo mínimo (s) entre actualizaciones a un mismo cliente de /ws/blink/count (agrupa los cambios)
+    ws_recording_dir: str = ""  # Carpeta donde grabar las sesiones de /ws/detect/blink para reproducirlas (vacío = sin grabar)
+    ws_send_queue_size: int = 32  # Mensajes pendientes de envío por conexión (cola de salida acotada)
+    ws_slow_consumer_policy: str = "drop_oldest"  # Con la cola llena: "drop_oldest" (descarta los mensajes más antiguos) o "disconnect" (cierra la conexión)
+    ws_send_timeout: float = 10.0  # Segundos máximos de un envío antes de cerrar la conexión por cliente lento
+    
+    # Configuración del panel de atención en vivo (/ws/class/{class_id}/live)
+    live_publish_interval: float = 1.0  # Segundos entre las instantáneas de atención que publica cada estudiante en sus salas
+    live_tick_interval: float = 1.0  # Segundos entre los frames agregados que recibe el docente
+    live_student_timeout: float = 10.0  # Segundos sin instantáneas antes de quitar a un estudiante del panel
+    live_recent_seconds: int = 10  # Segundos de la atención reciente de cada estudiante
     
     # Configuración de Supabase
     supabase_url: str
@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 
+from endpoints.websockets.connection_manager import get_connection_stats
+
 router = APIRouter()
 
 
@@ -17,3 +19,12 @@ async def suma(a: int, b: int):
     Endpoint de ejemplo que suma dos números
     """
     return {"resultado": a + b}
+
+
+@router.get("/check/websockets")
+async def websockets_stats():
+    """
+    Endpoint que devuelve las métricas de las colas de salida de cada WebSocket
+    (profundidad de las colas, mensajes descartados y clientes lentos desconectados)
+    """
+    return get_connection_stats()
@@ -1,49 +1,183 @@
-from fastapi import APIRouter
+import asyncio
+import uuid
+from typing import List, Optional, Union
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
 from core.config import settings
-from models.schemas import FaceDetectionRequest, FaceDetectionResponse, BlinkDetectionResponse
-from services.face_detection_service import FaceDetectionService
-from services.blink_detection_service import BlinkDetectionService
-from services.blink_counter import increment_blink_count, reset_blink_count, get_blink_count
-from utils.image_utils import base64_to_opencv
+from models.schemas import (
+    AttentionAnalysisResponse,
+    BlinkBatchRequest,
+    BlinkBatchResponse,
+    BlinkDetectionResponse,
+    FaceDetectionRequest,
+    FaceDetectionResponse,
+)
+from services.admission_control import BATCH_SESSION_PREFIX, AdmissionController, AdmissionRejected, get_admission_controller
+from services.inference_executor import get_inference_executor
+from services.blink_counter import (
+    DEFAULT_KEY,
+    get_blink_count,
+    get_blink_counter_store,
+    increment_blink_count,
+    reset_blink_count,
+)
+from utils.image_utils import FrameDecoder, base64_to_bytes, decode_frame
 
 router = APIRouter()
 
-# Servicios se inicializan de forma "lazy" para evitar errores de MediaPipe al importar
-_face_detection_service = None
-_blink_detection_service = None
+# Documentación OpenAPI de los formatos de imagen aceptados por los endpoints de detección
+IMAGE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": FaceDetectionRequest.model_json_schema()
+                if hasattr(FaceDetectionRequest, "model_json_schema")
+                else FaceDetectionRequest.schema()
+            },
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"}
+            },
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"image": {"type": "string", "format": "binary"}},
+                    "required": ["image"]
+                }
+            },
+        },
+    }
+}
 
 
-def get_face_detection_service():
-    """Inicializa el servicio de detección facial solo cuando se necesita."""
-    global _face_detection_service
-    if _face_detection_service is None:
-        _face_detection_service = FaceDetectionService(
-            model_selection=settings.face_detection_model_selection,
-            min_detection_confidence=settings.face_detection_min_confidence
-        )
-    return _face_detection_service
+# Documentación OpenAPI de los formatos aceptados por /detect/blink/batch
+BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": BlinkBatchRequest.model_json_schema()
+                if hasattr(BlinkBatchRequest, "model_json_schema")
+                else BlinkBatchRequest.schema()
+            },
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "images": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    },
+                    "required": ["images"]
+                }
+            },
+        },
+    }
+}
 
 
-def get_blink_detection_service():
-    """Inicializa el servicio de detección de parpadeo solo cuando se necesita."""
-    global _blink_detection_service
-    if _blink_detection_service is None:
-        _blink_detection_service = BlinkDetectionService(
-            static_image_mode=True,
-            max_num_faces=1
-        )
-    return _blink_detection_service
+def busy_error(rejection: AdmissionRejected) -> HTTPException:
+    """
+    Convierte un rechazo del control de admisión en una respuesta 503.
+    
+    El cuerpo lleva el mensaje "busy" estructurado y la cabecera Retry-After
+    los segundos sugeridos antes de reintentar.
+    """
+    return HTTPException(
+        status_code=503,
+        detail=rejection.to_dict(),
+        headers={"Retry-After": rejection.retry_after_header}
+    )
+
+
+async def read_request_image(request: Request, target_side: int = 0) -> np.ndarray:
+    """
+    Obtiene la imagen de una petición de detección.
+    
+    Las imágenes que superan settings.max_frame_pixels se rechazan antes de decodificarlas.
+    
+    Args:
+        request: Petición HTTP
+        target_side: Lado mayor al que reducir la imagen (0 = resolución completa)
+    
+    Returns:
+        np.ndarray: Imagen en formato OpenCV BGR
+    """
+    image_bytes = await read_request_image_bytes(request)
+    return decode_frame(image_bytes, target_side=target_side, max_pixels=settings.max_frame_pixels)
+
+
+async def read_request_image_bytes(request: Request) -> bytes:
+    """
+    Obtiene los bytes codificados de la imagen de una petición de detección.
+    
+    Acepta bytes crudos (application/octet-stream o image/*), un formulario
+    multipart con el campo 'image' o, para clientes anteriores, un JSON con
+    la imagen en Base64.
+    
+    Args:
+        request: Petición HTTP
+    
+    Returns:
+        bytes: Imagen codificada (JPEG, WebP, PNG...)
+    
+    Raises:
+        RequestValidationError: Si el cuerpo no tiene el formato esperado (respuesta 422)
+    """
+    content_type = request.headers.get("content-type", "").lower()
+    
+    if content_type.startswith(("application/octet-stream", "image/")):
+        image_bytes = await request.body()
+    elif content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise _invalid_body("El formulario debe contener el archivo 'image'", ("body", "image"))
+        image_bytes = await upload.read()
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise _invalid_body("El cuerpo debe ser un JSON válido")
+        if not isinstance(body, dict):
+            raise _invalid_body("El cuerpo debe ser un objeto JSON con el campo 'image'")
+        try:
+            payload = FaceDetectionRequest(**body)
+        except ValidationError as e:
+            raise _body_validation_error(e)
+        image_bytes = base64_to_bytes(payload.image)
+    
+    return image_bytes
+
+
+def _invalid_body(message: str, loc: tuple = ("body",)) -> RequestValidationError:
+    """Error de validación del cuerpo de la petición (FastAPI responde 422, como con un modelo Pydantic)."""
+    return RequestValidationError([{"loc": loc, "msg": message, "type": "value_error"}])
+
+
+def _body_validation_error(error: ValidationError) -> RequestValidationError:
+    """
+    Convierte la validación fallida de un modelo del cuerpo en un error 422.
+    
+    Pydantic v2 añade a cada error la clave 'url' (v1 no la tiene ni admite
+    errors(include_url=False)), así que se quita a mano.
+    """
+    return RequestValidationError([
+        {**{key: value for key, value in item.items() if key != "url"}, "loc": ("body", *item["loc"])}
+        for item in error.errors()
+    ])
 
 
-@router.post("/detect/face", response_model=FaceDetectionResponse)
-async def detect_face(request: FaceDetectionRequest):
+@router.post("/detect/face", response_model=FaceDetectionResponse, openapi_extra=IMAGE_REQUEST_BODY)
+async def detect_face(request: Request):
     """
     Endpoint para detectar rostros en una imagen.
     
     Args:
-        request: Request con imagen en Base64
-        
+        request: Request con la imagen binaria, multipart o en Base64 (JSON)
+    
     Returns:
         FaceDetectionResponse con información sobre la detección del rostro
     """
@@ -51,16 +185,25 @@ async def detect_face(request: FaceDetectionRequest):
     print("[ENDPOINT /detect/face] ✅ REQUEST RECIBIDO")
     print("=" * 50)
     try:
-        # Convertir Base64 a OpenCV
-        img = base64_to_opencv(request.image)
+        # Rechazar antes de decodificar si la cola de inferencia está llena
+        admission = get_admission_controller()
+        admission.check_frame()
+        
+        # Convertir la imagen recibida a OpenCV (a resolución completa: las coordenadas se devuelven en píxeles)
+        img = await read_request_image(request)
         print(f"[ENDPOINT] Imagen convertida: {img.shape if img is not None else 'None'}")
         
-        # Detectar rostro
-        result = get_face_detection_service().detect_face(img)
+        # Detectar rostro en un proceso de inferencia
+        result = await admission.run(get_inference_executor().detect_face(img))
         
         print(f"[ENDPOINT] Resultado: detected={result.detected}, confidence={result.confidence}")
         
         return result
+    except AdmissionRejected as e:
+        raise busy_error(e)
+    except RequestValidationError:
+        # Cuerpo mal formado: error del cliente (422), no "sin rostro"
+        raise
     except Exception as e:
         print(f"[ENDPOINT] ⚠️ ERROR: {e}")
         # En caso de error, retornar que no se detectó
@@ -71,29 +214,39 @@ async def detect_face(request: FaceDetectionRequest):
         )
 
 
-@router.post("/detect/blink", response_model=BlinkDetectionResponse)
-async def detect_blink(request: FaceDetectionRequest):
+@router.post("/detect/blink", response_model=BlinkDetectionResponse, openapi_extra=IMAGE_REQUEST_BODY)
+async def detect_blink(request: Request, session_id: Optional[str] = None):
     """
     Endpoint para detectar parpadeos en una imagen.
     
     Args:
-        request: Request con imagen en Base64
-        
+        request: Request con la imagen binaria, multipart o en Base64 (JSON)
+        session_id: Clave del contador de parpadeos (por defecto, el compartido)
+    
     Returns:
         BlinkDetectionResponse con información sobre el parpadeo (blinking, left_ear, right_ear)
     """
     try:
-        # Convertir Base64 a OpenCV
-        img = base64_to_opencv(request.image)
+        # Rechazar antes de decodificar si la cola de inferencia está llena
+        admission = get_admission_controller()
+        admission.check_frame()
         
-        # Detectar parpadeo
-        result = get_blink_detection_service().detect_blink(img)
+        # Convertir la imagen recibida a OpenCV a escala reducida (el EAR no depende de la escala)
+        img = await read_request_image(request, target_side=settings.frame_decode_target_side)
+        
+        # Detectar parpadeo en un proceso de inferencia
+        result = await admission.run(get_inference_executor().detect_blink(img))
         
         # Incrementar contador si se detecta parpadeo
         if result.blinking:
-            increment_blink_count()
+            await increment_blink_count(session_id or DEFAULT_KEY)
         
         return result
+    except AdmissionRejected as e:
+        raise busy_error(e)
+    except RequestValidationError:
+        # Cuerpo mal formado: error del cliente (422), no "sin rostro"
+        raise
     except Exception as e:
         # En caso de error, retornar valores por defecto
         return BlinkDetectionResponse(
@@ -103,24 +256,254 @@ async def detect_blink(request: FaceDetectionRequest):
         )
 
 
+@router.post("/detect/analyze", response_model=AttentionAnalysisResponse, openapi_extra=IMAGE_REQUEST_BODY)
+async def analyze_frame(request: Request, session_id: Optional[str] = None):
+    """
+    Endpoint que detecta rostro y parpadeo en una sola pasada.
+    
+    Sustituye a llamar a /detect/face y /detect/blink con la misma imagen: la
+    imagen se decodifica una vez (a escala reducida) y la caja del rostro se
+    obtiene de los landmarks de Face Mesh, reescalada a la resolución original.
+    
+    Args:
+        request: Request con la imagen binaria, multipart o en Base64 (JSON)
+        session_id: Clave del contador de parpadeos (por defecto, el compartido)
+    
+    Returns:
+        AttentionAnalysisResponse con los campos de FaceDetectionResponse y BlinkDetectionResponse
+    """
+    try:
+        # Rechazar antes de decodificar si la cola de inferencia está llena
+        admission = get_admission_controller()
+        admission.check_frame()
+        
+        decoder = FrameDecoder(
+            target_side=settings.frame_decode_target_side,
+            max_pixels=settings.max_frame_pixels
+        )
+        img = decoder.decode(await read_request_image_bytes(request))
+        
+        # Detectar rostro y parpadeo en un proceso de inferencia
+        result = await admission.run(get_inference_executor().analyze(img, scale=decoder.scale))
+        
+        # Incrementar contador si se detecta parpadeo
+        if result.blinking:
+            await increment_blink_count(session_id or DEFAULT_KEY)
+        
+        return result
+    except AdmissionRejected as e:
+        raise busy_error(e)
+    except RequestValidationError:
+        # Cuerpo mal formado: error del cliente (422), no "sin rostro"
+        raise
+    except Exception as e:
+        print(f"[ENDPOINT /detect/analyze] ⚠️ ERROR: {e}")
+        # En caso de error, retornar valores por defecto
+        return AttentionAnalysisResponse(
+            detected=False,
+            coordinates=None,
+            confidence=0.0,
+            blinking=False,
+            left_ear=0.0,
+            right_ear=0.0
+        )
+
+
+async def read_batch_frames(request: Request) -> List[Union[bytes, str]]:
+    """
+    Obtiene los frames de una petición por lotes, en el orden recibido.
+    
+    Acepta un formulario multipart con varios archivos 'images' (se devuelven
+    sus bytes) o un JSON con la lista de imágenes en Base64 (se devuelven las
+    cadenas, que se decodifican junto con la imagen).
+    
+    Raises:
+        RequestValidationError: Si el JSON no tiene el formato esperado (respuesta 422)
+    """
+    content_type = request.headers.get("content-type", "").lower()
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = [upload for upload in form.getlist("images") if not isinstance(upload, str)]
+        return [await upload.read() for upload in uploads]
+    
+    try:
+        body = await request.json()
+    except ValueError:
+        raise _invalid_body("El cuerpo debe ser un JSON válido")
+    if not isinstance(body, dict):
+        raise _invalid_body("El cuerpo debe ser un objeto JSON con el campo 'images'")
+    try:
+        payload = BlinkBatchRequest(**body)
+    except ValidationError as e:
+        raise _body_validation_error(e)
+    return payload.images
+
+
+def _decode_batch_frame(frame: Union[bytes, str]) -> Optional[np.ndarray]:
+    """Decodifica un frame de un lote; devuelve None si no es una imagen válida."""
+    try:
+        image_bytes = base64_to_bytes(frame) if isinstance(frame, str) else frame
+        return decode_frame(
+            image_bytes,
+            target_side=settings.frame_decode_target_side,
+            max_pixels=settings.max_frame_pixels
+        )
+    except ValueError:
+        return None
+
+
+@router.post("/detect/blink/batch", response_model=BlinkBatchResponse, openapi_extra=BATCH_REQUEST_BODY)
+async def detect_blink_batch(request: Request, session_id: Optional[str] = None):
+    """
+    Endpoint para detectar parpadeos en un lote de frames consecutivos.
+    
+    Pensado para clientes con conexiones inestables que acumulan, por ejemplo,
+    un segundo de frames y los envían juntos. Los frames se decodifican en
+    paralelo y se procesan en orden con seguimiento entre frames.
+    
+    Args:
+        request: Request con los frames (multipart 'images' o JSON con Base64)
+        session_id: Clave del contador de parpadeos (por defecto, el compartido)
+    
+    Returns:
+        BlinkBatchResponse con los arrays por frame (None en los frames que no
+        son imágenes válidas, listados en failed_frames) y los parpadeos agregados
+    
+    Raises:
+        RequestValidationError: Si el JSON no tiene el formato esperado (respuesta 422)
+        HTTPException 503: Si el servidor está ocupado, el lote no termina a
+            tiempo o falla la inferencia
+    """
+    try:
+        frames = await read_batch_frames(request)
+    except RequestValidationError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Lote de imágenes inválido: {str(e)}")
+    
+    if len(frames) > settings.blink_batch_max_frames:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {settings.blink_batch_max_frames} frames"
+        )
+    
+    # Los lotes tienen su propio cupo: no ocupan la cola de los frames sueltos
+    admission = get_admission_controller()
+    try:
+        admission.open_batch(len(frames))
+    except AdmissionRejected as e:
+        raise busy_error(e)
+    
+    try:
+        return await _detect_batch(admission, frames, session_id)
+    finally:
+        admission.close_batch(len(frames))
+
+
+async def _detect_batch(admission: AdmissionController, frames: List[Union[bytes, str]], session_id: Optional[str]) -> BlinkBatchResponse:
+    """Decodifica y procesa en orden los frames de un lote ya admitido."""
+    # Decodificar todos los frames en paralelo (cv2.imdecode libera el GIL)
+    loop = asyncio.get_running_loop()
+    images = await asyncio.gather(*(
+        loop.run_in_executor(None, _decode_batch_frame, frame) for frame in frames
+    ))
+    failed_frames = [index for index, img in enumerate(images) if img is None]
+    
+    # Procesar en orden dentro de una sesión temporal: todos los frames van al
+    # mismo trabajador, que los atiende en el orden en que se encolaron
+    executor = get_inference_executor()
+    batch_session = f"{BATCH_SESSION_PREFIX}{uuid.uuid4()}"
+    try:
+        detected = await admission.run_batch([
+            executor.detect_blink(img, session_id=batch_session) for img in images if img is not None
+        ])
+    except AdmissionRejected as e:
+        raise busy_error(e)
+    except RuntimeError as e:
+        # Un fallo de inferencia invalida el orden del lote: no se devuelven resultados parciales
+        print(f"[ENDPOINT /detect/blink/batch] ❌ Error de inferencia: {e}")
+        raise HTTPException(status_code=503, detail=f"Error de inferencia: {str(e)}")
+    finally:
+        await executor.release_session(batch_session)
+    
+    # Los frames que no se pudieron decodificar quedan sin resultado (None)
+    detected = iter(detected)
+    results = [next(detected) if img is not None else None for img in images]
+    
+    # Agregar parpadeos: un evento por cada transición a "parpadeando"
+    # (los frames sin resultado no interrumpen un parpadeo)
+    blink_events = []
+    previous = False
+    for index, result in enumerate(results):
+        if result is None:
+            continue
+        if result.blinking:
+            await increment_blink_count(session_id or DEFAULT_KEY)
+            if not previous:
+                blink_events.append(index)
+        previous = result.blinking
+    
+    return BlinkBatchResponse(
+        blinking=[result.blinking if result is not None else None for result in results],
+        left_ear=[result.left_ear if result is not None else None for result in results],
+        right_ear=[result.right_ear if result is not None else None for result in results],
+        blink_events=blink_events,
+        blink_count=len(blink_events),
+        failed_frames=failed_frames
+    )
+
+
 @router.get("/detect/blink/count")
-async def get_blink_count_endpoint():
+async def get_blink_count_endpoint(session_id: Optional[str] = None):
     """
     Endpoint para consultar el contador actual de parpadeos.
     
+    Args:
+        session_id: Clave del contador (por defecto, el compartido)
+    
     Returns:
         dict: Contador actual de parpadeos
     """
-    return {"blink_count": get_blink_count()}
+    return {"blink_count": await get_blink_count(session_id or DEFAULT_KEY)}
+
+
+@router.get("/detect/blink/counts")
+async def get_blink_counts_endpoint(session_id: Optional[List[str]] = Query(None)):
+    """
+    Endpoint para consultar varios contadores de parpadeos a la vez (paneles).
+    
+    Args:
+        session_id: Claves a consultar (se puede repetir); sin claves, todos los contadores activos
+    
+    Returns:
+        dict: {"counts": {clave: {"blink_count", "last_blink_at", "blink_rate"}}}
+        (last_blink_at en segundos Unix, blink_rate en parpadeos por minuto)
+    """
+    return {"counts": await get_blink_counter_store().snapshot(session_id)}
 
 
 @router.post("/detect/blink/reset")
-async def reset_blink_count_endpoint():
+async def reset_blink_count_endpoint(session_id: Optional[str] = None):
     """
-    Endpoint para reiniciar el contador de parpadeos a 0.
+    Endpoint para reiniciar a 0 el contador de parpadeos de una sesión.
+    
+    Args:
+        session_id: Clave del contador (por defecto, el compartido)
     
     Returns:
         dict: Confirmación del reset con el contador en 0
     """
-    reset_blink_count()
+    await reset_blink_count(session_id or DEFAULT_KEY)
     return {"message": "Contador de parpadeos reiniciado", "blink_count": 0}
+
+
+@router.get("/detect/admission")
+async def get_admission_stats():
+    """
+    Endpoint para consultar el estado del control de admisión.
+    
+    Returns:
+        dict: Conexiones admitidas, trabajos pendientes, límites y contadores de rechazos
+    """
+    return get_admission_controller().get_stats()
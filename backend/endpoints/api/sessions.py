@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from typing import Optional
 from core.config import settings
 from services.ai_service import ai_service
+from services.live_attention import get_live_attention_hub
+from services.session_timeline import find_session_timeline, pop_session_timeline
 from supabase import create_client, Client
 from datetime import datetime
 
@@ -21,7 +23,7 @@ class SessionStart(BaseModel):
 
 class SessionEnd(BaseModel):
     session_id: str
-    attention_level: str  # 'alto', 'medio', 'bajo'
+    attention_level: Optional[str] = None  # 'alto', 'medio', 'bajo' (se ignora si el servidor tiene la línea de tiempo)
 
 
 class QuizAnswer(BaseModel):
@@ -33,6 +35,8 @@ class QuizAnswer(BaseModel):
 async def start_session(data: SessionStart):
     """
     Inicia una sesión de estudio cuando el estudiante empieza a ver un video.
+    La sesión se registra en las salas de su tarea y de su clase para el panel
+    en vivo del docente (/ws/class/{class_id}/live).
     """
     try:
         # attention_level se establecerá cuando se finalice la sesión
@@ -43,7 +47,18 @@ async def start_session(data: SessionStart):
             "status": "started"
         }
         response = supabase.table("activity_sessions").insert(session_data).execute()
-        return {"message": "Sesión iniciada", "session": response.data[0]}
+        session = response.data[0]
+        
+        # Salas del panel en vivo: sin la clase, la sesión solo aparece en la sala de la tarea
+        class_id = None
+        try:
+            task = supabase.table("tasks").select("class_id").eq("id", data.task_id).single().execute()
+            class_id = task.data.get("class_id")
+        except Exception as e:
+            print(f"[Session Start] ⚠️ No se pudo obtener la clase de la tarea {data.task_id}: {e}")
+        await get_live_attention_hub().register_session(session["id"], data.student_id, data.task_id, class_id)
+        
+        return {"message": "Sesión iniciada", "session": session}
     except Exception as e:
         print(f"[Session Start] ❌ ERROR: {e}")
         import traceback
@@ -55,35 +70,60 @@ async def start_session(data: SessionStart):
 async def end_session(data: SessionEnd):
     """
     Finaliza una sesión de estudio.
-    1. Actualiza el registro de sesión con el puntaje de atención.
+    1. Calcula el nivel de atención con la línea de tiempo registrada por
+       /ws/detect/blink (?session_id=...) o, si no la hay, usa el enviado por el cliente,
+       y actualiza el registro de sesión (guardando la línea de tiempo en una sola inserción).
     2. Obtiene el resumen/transcripción del video asociado.
     3. Genera un cuestionario personalizado con IA.
     4. Guarda el cuestionario.
     5. Retorna el cuestionario al frontend.
     """
     try:
-        # Validar que attention_level sea válido
-        if data.attention_level not in ['alto', 'medio', 'bajo']:
-            raise HTTPException(
-                status_code=400, 
-                detail="attention_level debe ser 'alto', 'medio' o 'bajo'"
-            )
+        # Línea de tiempo registrada en el servidor: su nivel de atención prevalece.
+        # Se retira solo cuando ya está guardada: si falla una escritura, el cliente
+        # puede reintentar /end sin perderla
+        timeline = await find_session_timeline(data.session_id)
+        attention_score = timeline.attention_score() if timeline is not None else None
+        
+        if attention_score is not None:
+            attention_level = timeline.attention_level()
+        else:
+            # Validar que attention_level sea válido
+            if data.attention_level not in ['alto', 'medio', 'bajo']:
+                raise HTTPException(
+                    status_code=400, 
+                    detail="attention_level debe ser 'alto', 'medio' o 'bajo'"
+                )
+            attention_level = data.attention_level
         
         print(f"[Session End] 🎬 Finalizando sesión: {data.session_id}")
-        print(f"[Session End] 📊 Nivel de atención: {data.attention_level}")
+        print(f"[Session End] 📊 Nivel de atención: {attention_level}" + (
+            f" (servidor, puntaje {attention_score:.2f})" if attention_score is not None else " (cliente)"
+        ))
         
         # 1. Actualizar sesión
         update_data = {
-            "attention_level": data.attention_level,
+            "attention_level": attention_level,
             "status": "completed",
             "completed_at": datetime.utcnow().isoformat()
         }
+        if attention_score is not None:
+            update_data["attention_score"] = round(attention_score, 3)
         supabase.table("activity_sessions") \
             .update(update_data) \
             .eq("id", data.session_id) \
             .execute()
         print(f"[Session End] ✅ Sesión actualizada")
         
+        # Guardar la línea de tiempo por segundo en una sola escritura
+        if timeline is not None:
+            rows = [{"session_id": data.session_id, **row} for row in timeline.to_rows()]
+            if rows:
+                supabase.table("session_attention_timeline").insert(rows).execute()
+                print(f"[Session End] ✅ Línea de tiempo guardada: {len(rows)} segundos")
+        await pop_session_timeline(data.session_id)
+        await get_live_attention_hub().end_session(data.session_id)
+        
         # 2. Obtener información de la tarea/video
         session_info = supabase.table("activity_sessions") \
             .select("task_id") \
@@ -110,14 +150,15 @@ async def end_session(data: SessionEnd):
         q_count = task_info.data.get("questions_count") or 5
         print(f"[Session End] 🔢 Número de preguntas: {q_count}")
 
-        # Convertir attention_level a score numérico para el quiz
+        # Sin línea de tiempo, convertir attention_level a score numérico para el quiz
         # (generate_quiz necesita un float)
-        attention_score_map = {
-            'alto': 0.8,
-            'medio': 0.5,
-            'bajo': 0.3
-        }
-        attention_score = attention_score_map.get(data.attention_level, 0.5)
+        if attention_score is None:
+            attention_score_map = {
+                'alto': 0.8,
+                'medio': 0.5,
+                'bajo': 0.3
+            }
+            attention_score = attention_score_map.get(attention_level, 0.5)
 
         quiz_questions = await ai_service.generate_quiz(
             text=content_for_quiz,
@@ -138,8 +179,11 @@ async def end_session(data: SessionEnd):
         return {
             "message": "Sesión completada. Cuestionario generado.",
             "quiz_id": quiz_response.data[0]["id"],
-            "questions": quiz_questions
+            "questions": quiz_questions,
+            "attention_level": attention_level
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[Session End] ❌ ERROR: {e}")
         import traceback
@@ -142,7 +142,7 @@ async def upload_task_video(
         
         # 3. Transcribir video con Whisper y generar resumen
         print(f"[upload_task_video] Iniciando transcripción del video...")
-        transcribe_task_id = transcription_service.start_transcription(local_path)
+        transcribe_task_id = await transcription_service.start_transcription(local_path)
         
         # Polling para esperar la transcripción (máximo 10 minutos)
         summary = "Resumen no disponible (tiempo de espera agotado)."
@@ -153,7 +153,7 @@ async def upload_task_video(
             await asyncio.sleep(2)  # Esperar 2 segundos entre intentos
             attempts += 1
             
-            status_data = transcription_service.get_task_status(transcribe_task_id)
+            status_data = await transcription_service.get_task_status(transcribe_task_id)
             
             if status_data is None:
                 # Tarea aún no registrada, continuar esperando
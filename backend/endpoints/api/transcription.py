@@ -43,7 +43,7 @@ async def transcribe_video(
             raise HTTPException(status_code=400, detail="Debe proporcionar un archivo o video_url")
         
         # Iniciar transcripción
-        task_id = transcription_service.start_transcription(temp_path)
+        task_id = await transcription_service.start_transcription(temp_path)
         
         return {
             "task_id": task_id,
@@ -61,7 +61,7 @@ async def get_transcription_status(task_id: str):
     """
     Consulta el estado de una tarea de transcripción.
     """
-    task = transcription_service.get_task_status(task_id)
+    task = await transcription_service.get_task_status(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
     
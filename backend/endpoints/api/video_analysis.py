@@ -0,0 +1,72 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi.responses import FileResponse
+from services.video_analysis_service import video_analysis_service
+from services.video_service import video_service
+import os
+
+router = APIRouter(
+    prefix="/video-analysis",
+    tags=["Video Analysis"]
+)
+
+@router.post("/video")
+async def analyze_video(
+    file: UploadFile = File(...),
+    sample_fps: float = Form(None)
+):
+    """
+    Sube un video grabado y comienza el análisis de atención en segundo plano.
+    Retorna un task_id para consultar el estado y descargar la línea de tiempo.
+    """
+    temp_path = ""
+    try:
+        # Guardar archivo temporalmente (se copia por bloques, sin cargarlo entero en memoria)
+        temp_path = await video_service.save_upload_locally(file)
+        
+        # Iniciar análisis
+        task_id = await video_analysis_service.start_analysis(temp_path, sample_fps=sample_fps)
+        
+        return {
+            "task_id": task_id,
+            "status": "processing",
+            "message": "Análisis de video iniciado exitosamente"
+        }
+    except Exception as e:
+        if temp_path and os.path.exists(temp_path):
+            try: os.remove(temp_path)
+            except: pass
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/status/{task_id}")
+async def get_video_analysis_status(task_id: str):
+    """
+    Consulta el estado de una tarea de análisis (status, progress, summary, error).
+    """
+    task = await video_analysis_service.get_task_status(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    
+    return task
+
+@router.get("/timeline/{task_id}")
+async def get_video_analysis_timeline(task_id: str):
+    """
+    Descarga la línea de tiempo de un análisis completado en formato JSON Lines:
+    una fila por segundo de video con frames, face_ratio, blinks, mean_ear y attention.
+    """
+    task = await video_analysis_service.get_task_status(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    if task["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"El análisis aún no ha terminado (estado: {task['status']})")
+    
+    timeline_path = video_analysis_service.get_timeline_path(task_id)
+    if not os.path.exists(timeline_path):
+        # Ya se borró (caducó) o la escribió otra máquina con su propio video_analysis_dir
+        raise HTTPException(status_code=404, detail="Línea de tiempo no disponible")
+    
+    return FileResponse(
+        timeline_path,
+        media_type="application/x-ndjson",
+        filename=f"{task_id}.timeline.jsonl"
+    )
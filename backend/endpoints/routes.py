@@ -1,8 +1,8 @@
 from fastapi import FastAPI
 
-from endpoints.api import detect, check, classes, tasks, sessions, video_genai, transcription
+from endpoints.api import detect, check, classes, tasks, sessions, video_genai, transcription, video_analysis
 from endpoints.auth import auth
-from endpoints.websockets import blink_count, blink_detection
+from endpoints.websockets import blink_count, blink_detection, class_live, classroom
 
 
 def register_routes(app: FastAPI) -> None:
@@ -24,6 +24,8 @@ def register_routes(app: FastAPI) -> None:
     # Registrar routers de WebSockets
     app.include_router(blink_count.router)
     app.include_router(blink_detection.router)
+    app.include_router(classroom.router)
+    app.include_router(class_live.router)
     
     # Registrar routers de gestión (Clases, Tareas, Sesiones)
     app.include_router(classes.router)
@@ -35,5 +37,8 @@ def register_routes(app: FastAPI) -> None:
     
     # Registrar router de transcripción
     app.include_router(transcription.router)
+    
+    # Registrar router de análisis offline de videos
+    app.include_router(video_analysis.router)
 
 
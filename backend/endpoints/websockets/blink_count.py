@@ -7,12 +7,28 @@ from fastapi.routing import APIRouter
 
 from core.config import settings
 from endpoints.websockets.connection_manager import ConnectionManager
-from services.blink_counter import get_blink_count
+from services.blink_counter import DEFAULT_KEY, BlinkCountSubscription, get_blink_count, get_blink_counter_store
 
 router = APIRouter()
 
 # Instancia del gestor de conexiones para este WebSocket
-manager = ConnectionManager()
+manager = ConnectionManager("blink_count")
+
+
+async def _watch_disconnect(websocket: WebSocket, subscription: BlinkCountSubscription) -> None:
+    """
+    Lee (y descarta) los mensajes del cliente hasta que se desconecte y entonces
+    cierra la suscripción, lo que despierta al bucle de envío.
+    """
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except Exception:
+        pass
+    finally:
+        subscription.close()
 
 
 @router.websocket("/ws/blink/count")
@@ -21,39 +37,43 @@ async def websocket_blink_count(websocket: WebSocket):
     WebSocket endpoint para recibir actualizaciones en tiempo real del contador de parpadeos.
     
     El cliente se conecta a este endpoint y recibe actualizaciones cuando el contador cambia.
-    Se verifica periódicamente si el contador ha cambiado y se envía la actualización.
+    La conexión no consulta el contador periódicamente: se suscribe a sus cambios
+    y duerme hasta que llega uno. Los cambios se agrupan y cada cliente recibe como
+    mucho una actualización cada blink_count_min_interval segundos (siempre con el
+    valor más reciente).
+    
+    Con ?session_id=<clave> se sigue el contador de esa sesión (la misma clave
+    que usa /ws/detect/blink); sin ella, el contador compartido.
     """
     await manager.connect(websocket)
+    key = websocket.query_params.get("session_id") or DEFAULT_KEY
+    subscription = await get_blink_counter_store().subscribe(key)
+    receiver = asyncio.create_task(_watch_disconnect(websocket, subscription))
     
     try:
         # Enviar el contador inicial inmediatamente
-        initial_count = get_blink_count()
+        initial_count = await get_blink_count(key)
         await manager.send_json_message({"blink_count": initial_count}, websocket)
         
         last_count = initial_count
         
-        # Mantener la conexión activa y enviar actualizaciones cuando cambie el contador
-        while True:
-            # Esperar mensajes del cliente o timeout para verificar cambios
-            try:
-                # Timeout configurable para verificar actualizaciones periódicamente
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=settings.websocket_check_interval)
-                # Si el cliente envía un mensaje, mantener la conexión viva
-            except asyncio.TimeoutError:
-                # Verificar si el contador ha cambiado
-                current_count = get_blink_count()
-                if current_count != last_count:
-                    # Solo enviar si el contador cambió
-                    await manager.send_json_message({"blink_count": current_count}, websocket)
-                    last_count = current_count
-            except WebSocketDisconnect:
-                break
-                
+        # Esperar cambios hasta que el cliente se desconecte
+        while await subscription.wait():
+            current_count = await get_blink_count(key)
+            if current_count != last_count:
+                # Solo enviar si el contador cambió
+                await manager.send_json_message({"blink_count": current_count}, websocket)
+                last_count = current_count
+                # Límite de ritmo: los cambios durante la pausa se envían juntos después
+                await asyncio.sleep(settings.blink_count_min_interval)
+    
     except WebSocketDisconnect:
         pass
     except Exception as e:
         # Manejar cualquier otro error
         pass
     finally:
-        # Asegurarse de remover la conexión cuando se desconecte
+        # Asegurarse de remover la conexión y la suscripción cuando se desconecte
+        receiver.cancel()
+        subscription.close()
         manager.disconnect(websocket)
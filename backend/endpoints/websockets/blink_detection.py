@@ -2,34 +2,192 @@
 WebSocket para detectar parpadeos en tiempo real mediante imágenes enviadas por el cliente.
 """
 import asyncio
-import json
+import uuid
+from typing import Optional
+
+import numpy as np
 from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.routing import APIRouter
 
 from core.config import settings
 from endpoints.websockets.connection_manager import ConnectionManager
-from services.blink_detection_service import BlinkDetectionService
-from services.blink_counter import increment_blink_count
-from utils.image_utils import base64_to_opencv
-from models.schemas import BlinkDetectionResponse
+from services.admission_control import AdmissionRejected, get_admission_controller
+from services.inference_executor import get_inference_executor
+from services.blink_counter import DEFAULT_KEY, get_blink_count, increment_blink_count
+from services.capture_control import CaptureController
+from services.frame_similarity import FrameSimilarityFilter
+from services.landmark_features import evaluate_eye_points, is_valid_ear
+from services.live_attention import get_live_attention_hub
+from services.session_timeline import get_session_timeline, sync_session_timeline
+from utils.frame_receiver import image_from_message, receive_frames
+from utils.frame_slot import LatestFrameSlot
+from utils.image_utils import FrameDecoder
+from utils.ws_recording import WebSocketRecorder
 
 router = APIRouter()
 
 # Instancia del gestor de conexiones para este WebSocket
-manager = ConnectionManager()
+manager = ConnectionManager("blink_detection")
+
+# Respuestas por defecto cuando falla la detección
+_EMPTY_RESULTS = {
+    "blink": {"blinking": False, "left_ear": 0.0, "right_ear": 0.0},
+    "analyze": {
+        "type": "analyze",
+        "detected": False,
+        "coordinates": None,
+        "confidence": 0.0,
+        "blinking": False,
+        "left_ear": 0.0,
+        "right_ear": 0.0
+    }
+}
+
+
+def _text_frame(message, controller: CaptureController) -> Optional[tuple]:
+    """
+    Convierte un mensaje JSON del cliente en el frame que se deja en el slot.
+    
+    Cada frame es una tupla (message_type, image_bytes, data), donde data es la
+    imagen en Base64 o, para "landmarks", el mensaje completo. Un mensaje
+    "hello" con la capacidad "control" activa los mensajes de control y no es
+    un frame (devuelve None).
+    
+    Raises:
+        ValueError: Si el mensaje no contiene la imagen
+    """
+    # Presentación del cliente con sus capacidades
+    if isinstance(message, dict) and message.get("type") == "hello":
+        controller.enabled = "control" in (message.get("capabilities") or [])
+        return None
+    
+    # Landmarks de los ojos calculados en el navegador (sin imagen)
+    if isinstance(message, dict) and message.get("type") == "landmarks":
+        return ("landmarks", None, message)
+    
+    image = image_from_message(message)
+    return (message.get("type", "blink"), None, image)
 
-# Servicios se inicializan de forma "lazy" para evitar errores de MediaPipe al importar
-_blink_detection_service = None
 
-def get_blink_detection_service():
-    """Inicializa el servicio de detección de parpadeo solo cuando se necesita."""
-    global _blink_detection_service
-    if _blink_detection_service is None:
-        _blink_detection_service = BlinkDetectionService(
-            static_image_mode=True,
-            max_num_faces=1
+def _evaluate_landmarks(message: dict) -> dict:
+    """
+    Calcula el EAR y el parpadeo a partir de un mensaje "landmarks".
+    
+    Args:
+        message: Mensaje del cliente con left_eye, right_eye y, si las coordenadas
+                 están normalizadas, width/height (obligatorios: x e y se escalan por separado)
+    
+    Returns:
+        dict: Respuesta (sin seq/dropped)
+    
+    Raises:
+        ValueError: Si los puntos no tienen el formato esperado o son degenerados
+            (coordenadas no finitas o un ojo sin anchura)
+    """
+    left_eye = message.get("left_eye")
+    right_eye = message.get("right_eye")
+    if left_eye is None or right_eye is None:
+        # El cliente no detectó rostro en este frame
+        return {"type": "landmarks", **_EMPTY_RESULTS["blink"]}
+    
+    width = message.get("width")
+    height = message.get("height")
+    if (width is None) != (height is None):
+        raise ValueError("Los campos 'width' y 'height' deben enviarse juntos")
+    
+    try:
+        left = np.asarray(left_eye, dtype=np.float64)
+        right = np.asarray(right_eye, dtype=np.float64)
+        # Coordenadas normalizadas (0-1) a píxeles; sin width/height se asumen píxeles
+        size = np.array([float(width), float(height)]) if width is not None else np.ones(2)
+    except (TypeError, ValueError):
+        raise ValueError("Los campos 'left_eye' y 'right_eye' deben ser listas de 6 puntos [x, y]")
+    if left.shape != (6, 2) or right.shape != (6, 2):
+        raise ValueError("Los campos 'left_eye' y 'right_eye' deben ser listas de 6 puntos [x, y]")
+    if not (np.all(np.isfinite(left)) and np.all(np.isfinite(right))):
+        raise ValueError("Los puntos de 'left_eye' y 'right_eye' deben ser números finitos")
+    if not np.all(np.isfinite(size) & (size > 0)):
+        raise ValueError("Los campos 'width' y 'height' deben ser positivos")
+    if width is None and max(np.abs(left).max(), np.abs(right).max()) <= 1.0:
+        # Normalizadas sin tamaño: el EAR saldría deformado por la relación de aspecto del frame
+        raise ValueError("Las coordenadas normalizadas (0-1) requieren 'width' y 'height' del frame")
+    
+    result = evaluate_eye_points(left * size, right * size)
+    if not is_valid_ear(result.left_ear) or not is_valid_ear(result.right_ear):
+        # Sin un EAR válido no se puede distinguir un parpadeo: no se cuenta como tal
+        raise ValueError("Los puntos de 'left_eye' y 'right_eye' no describen un ojo (EAR nulo o no finito)")
+    return {
+        "type": "landmarks",
+        "blinking": result.blinking,
+        "left_ear": result.left_ear,
+        "right_ear": result.right_ear
+    }
+
+
+def _record_timeline(timeline, payload: dict) -> None:
+    """
+    Añade el resultado de un frame a la línea de tiempo de la sesión.
+    
+    Se considera que hay rostro si la detección devolvió EARs (o detected en
+    "analyze"), y que el frame es atento si hay rostro, no hay parpadeo y, cuando
+    se conoce la orientación de la cabeza, el estudiante mira al frente
+    (session_max_yaw/session_max_pitch: la cámara es la del propio estudiante, no
+    la del aula, así que sus umbrales se ajustan por separado).
+    """
+    face = payload.get("detected", payload["left_ear"] > 0 or payload["right_ear"] > 0)
+    features = payload.get("features")
+    attentive = face and not payload["blinking"] and (
+        features is None or (
+            abs(features["yaw"]) <= settings.session_max_yaw
+            and abs(features["pitch"]) <= settings.session_max_pitch
         )
-    return _blink_detection_service
+    )
+    timeline.append(
+        left_ear=payload["left_ear"],
+        right_ear=payload["right_ear"],
+        face=face,
+        blinking=payload["blinking"],
+        attentive=attentive
+    )
+
+
+async def _detect(message_type: str, img, session_id: str, scale: float) -> dict:
+    """
+    Ejecuta la inferencia de un frame y devuelve la respuesta (sin seq/dropped).
+    
+    El frame pasa por el control de admisión: se rechaza si la cola de
+    inferencia está llena o si el resultado no llega dentro del plazo.
+    
+    Args:
+        message_type: "blink" o "analyze"
+        img: Imagen decodificada (OpenCV BGR)
+        session_id: Sesión de la conexión (Face Mesh en modo streaming)
+        scale: Escala del frame respecto a la imagen original
+    
+    Raises:
+        AdmissionRejected: Si el frame no se admite o vence su plazo
+    """
+    admission = get_admission_controller()
+    admission.check_frame(landmarks=True)
+    
+    if message_type == "analyze":
+        # Detectar rostro y parpadeo en una sola pasada
+        analysis = await admission.run(
+            get_inference_executor().analyze(img, session_id=session_id, scale=scale),
+            landmarks=True
+        )
+        return {"type": "analyze", **jsonable_encoder(analysis)}
+    
+    result = await admission.run(
+        get_inference_executor().detect_blink(img, session_id=session_id),
+        landmarks=True
+    )
+    return {
+        "blinking": result.blinking,
+        "left_ear": result.left_ear,
+        "right_ear": result.right_ear
+    }
 
 
 @router.websocket("/ws/detect/blink")
@@ -37,83 +195,308 @@ async def websocket_blink_detection(websocket: WebSocket):
     """
     WebSocket endpoint para detectar parpadeos en tiempo real.
     
-    El cliente envía imágenes en Base64 a través del WebSocket y recibe
-    la respuesta de detección de parpadeos (blinking, left_ear, right_ear).
+    El cliente envía imágenes a través del WebSocket y recibe la respuesta
+    de detección de parpadeos (blinking, left_ear, right_ear).
     Si se detecta un parpadeo, se incrementa el contador automáticamente.
     
-    Formato de mensaje esperado del cliente:
+    Si el cliente envía frames más rápido de lo que se procesan, solo se
+    procesa el más reciente y los anteriores se descartan. Cada respuesta
+    incluye el número de secuencia del frame procesado (seq, empezando en 1
+    según el orden de llegada) y el total de frames descartados (dropped).
+    
+    Los frames casi idénticos al último procesado (alumno quieto) no pasan por
+    la inferencia: se reutiliza el último resultado (reused=true) y skip_ratio
+    indica la fracción de frames de la conexión resueltos así. Los resultados
+    con parpadeo nunca se reutilizan, para no contar un mismo parpadeo varias veces.
+    
+    Formatos de mensaje aceptados del cliente:
+    - Mensaje binario con los bytes de la imagen (JPEG/WebP/PNG), recomendado
+    - Mensaje de texto JSON (compatibilidad con clientes anteriores):
     {
+        "type": "blink" | "analyze",  # Opcional, por defecto "blink"
         "image": "base64_encoded_image_string"
     }
     
-    Formato de respuesta:
+    Los mensajes binarios usan el tipo indicado en la URL (?type=analyze);
+    por defecto "blink".
+    
+    Modo landmarks: si el cliente ya ejecuta Face Mesh (MediaPipe en el
+    navegador), puede enviar solo los 6 puntos de cada ojo, en el orden de
+    BlinkDetectionService.LEFT_EYE_INDICES / RIGHT_EYE_INDICES. El servidor no
+    decodifica ninguna imagen: solo calcula el EAR, aplica el umbral y cuenta.
+    {
+        "type": "landmarks",
+        "left_eye": [[x, y], ...] | null,   # 6 puntos; null si no hay rostro
+        "right_eye": [[x, y], ...] | null,
+        "width": int,   # Ancho del frame: obligatorio si las coordenadas están normalizadas (0-1)
+        "height": int   # Alto del frame: obligatorio junto con width
+    }
+    Respuesta: {"type": "landmarks", "blinking", "left_ear", "right_ear", "seq", "dropped"}
+    
+    Control adaptativo de la captura (opcional): si el cliente se conecta con
+    ?control=1 o envía {"type": "hello", "capabilities": ["control"]}, el
+    servidor le envía mensajes de control cuando cambian los parámetros de
+    captura recomendados (según la latencia de inferencia, las sesiones
+    activas y si el EAR está cerca del umbral):
     {
+        "type": "control",
+        "fps": int,         # Frames por segundo a capturar
+        "max_side": int,    # Lado mayor (px) de los frames
+        "quality": float    # Calidad JPEG (0-1)
+    }
+    
+    Línea de tiempo de atención (opcional): si el cliente se conecta con
+    ?session_id=<id de una sesión iniciada con /sessions/start>, cada resultado
+    se añade a la línea de tiempo de esa sesión; /sessions/end calcula con ella
+    el nivel de atención y la guarda en la base de datos. Su atención se publica
+    además cada live_publish_interval segundos en el panel del docente
+    (/ws/class/{class_id}/live). Los parpadeos se suman al contador de esa
+    clave (/ws/blink/count?session_id=...); sin session_id, al contador
+    compartido. Con una clave que no es una sesión en curso solo se usa el
+    contador (sin línea de tiempo).
+    
+    Control de admisión: si el servidor ya tiene el máximo de conexiones, envía
+    un mensaje "busy" y cierra la conexión con el código 1013 (reintentar más
+    tarde). Si la cola de inferencia está llena o el resultado de un frame no
+    llega a tiempo, ese frame se responde con "busy" en lugar de encolarlo:
+    {
+        "type": "busy",
+        "reason": "streams" | "queue" | "deadline",
+        "retry_after": float,   # Segundos sugeridos antes de reintentar
+        "degrade": {            # Captura sugerida para reducir la carga
+            "mode": "landmarks", "fps": int, "max_side": int, "quality": float
+        },
+        "seq": int,             # Solo en los frames rechazados
+        "dropped": int
+    }
+    Los mensajes "landmarks" no pasan por la inferencia y no se rechazan.
+    
+    Grabación (diagnóstico): con ws_recording_dir configurado, los mensajes de
+    cada conexión se graban en un archivo .wsrec que se puede reproducir con
+    benchmarks/ws_replay.py.
+    
+    Formato de respuesta para "blink":
+    {
+        "blinking": bool,
+        "left_ear": float,
+        "right_ear": float,
+        "seq": int,
+        "dropped": int,
+        "reused": bool,
+        "skip_ratio": float
+    }
+    
+    Formato de respuesta para "analyze" (rostro y parpadeo en una sola pasada):
+    {
+        "type": "analyze",
+        "detected": bool,
+        "coordinates": {"x": int, "y": int, "w": int, "h": int} | null,
+        "confidence": float,
         "blinking": bool,
         "left_ear": float,
-        "right_ear": float
+        "right_ear": float,
+        "features": {       # null si no hay rostro
+            "mouth_aspect_ratio": float,
+            "yaw": float, "pitch": float, "roll": float,
+            "gaze_x": float, "gaze_y": float
+        },
+        "seq": int,
+        "dropped": int,
+        "reused": bool,
+        "skip_ratio": float
     }
     """
     await manager.connect(websocket)
     
+    # Cada conexión usa su propia instancia de Face Mesh en modo streaming
+    session_id = str(uuid.uuid4())
+    
+    # Admitir la conexión solo si quedan plazas de streaming
+    admission = get_admission_controller()
+    try:
+        admission.open_stream(session_id, landmarks=True)
+    except AdmissionRejected as e:
+        await manager.send_json_message(e.to_dict(), websocket)
+        await manager.close(websocket, code=1013)
+        return
+    
+    # Decodificador propio de la conexión (reduce la resolución y reutiliza buffers)
+    decoder = FrameDecoder(
+        target_side=settings.frame_decode_target_side,
+        max_pixels=settings.max_frame_pixels
+    )
+    
+    # Tipo de respuesta para los frames binarios
+    binary_type = websocket.query_params.get("type", "blink")
+    
+    # Omisión de frames casi idénticos: resultado del último frame procesado
+    similarity = FrameSimilarityFilter(
+        tolerance=settings.frame_similarity_tolerance,
+        max_reuse=settings.frame_similarity_max_reuse
+    )
+    last_results = {}
+    
+    # Mensajes de control de la captura (solo para clientes que los aceptan)
+    controller = CaptureController(enabled=websocket.query_params.get("control") == "1")
+    
+    # Sesión de actividad (si el cliente la indica) y su contador de parpadeos
+    # (sin session_id, el contador compartido)
+    activity_session_id = websocket.query_params.get("session_id")
+    counter_key = activity_session_id or DEFAULT_KEY
+    
+    # Línea de tiempo e instantáneas para el panel en vivo del docente: solo para las
+    # sesiones iniciadas con /sessions/start (cada línea de tiempo reserva su buffer)
+    hub = get_live_attention_hub()
+    live = await hub.publisher(activity_session_id) if activity_session_id else None
+    timeline = await get_session_timeline(activity_session_id) if live is not None else None
+    blink_count = await get_blink_count(counter_key) if live is not None else 0
+    
+    # Grabación de la sesión para reproducirla sin conexión (si está configurada)
+    recorder = None
+    if settings.ws_recording_dir:
+        recorder = WebSocketRecorder.for_connection(
+            settings.ws_recording_dir,
+            websocket.url.path,
+            websocket.url.query
+        )
+    
+    # Recepción en una tarea aparte: solo se conserva el frame más reciente
+    slot = LatestFrameSlot()
+    receiver = asyncio.create_task(receive_frames(
+        websocket,
+        slot,
+        lambda payload: manager.send_json_message(payload, websocket),
+        binary_frame=lambda image_bytes: (binary_type, image_bytes, None),
+        text_frame=lambda message: _text_frame(message, controller),
+        recorder=recorder
+    ))
+    
     try:
         while True:
-            # Recibir mensaje del cliente
-            try:
-                data = await websocket.receive_text()
-                message = json.loads(data)
-                
-                # Validar que el mensaje contenga la imagen
-                if "image" not in message:
-                    await manager.send_json_message({
-                        "error": "El mensaje debe contener el campo 'image' con la imagen en Base64"
-                    }, websocket)
-                    continue
-                
-                # Convertir Base64 a OpenCV
+            item = await slot.get()
+            if item is None:
+                break
+            seq, (message_type, image_bytes, data) = item
+            
+            # Modo landmarks: el EAR se calcula directamente, sin imagen ni inferencia
+            if message_type == "landmarks":
                 try:
-                    img = base64_to_opencv(message["image"])
-                except Exception as e:
+                    payload = _evaluate_landmarks(data)
+                except ValueError as e:
                     await manager.send_json_message({
-                        "error": f"Error al procesar la imagen: {str(e)}"
+                        "error": str(e),
+                        "seq": seq,
+                        "dropped": slot.dropped
                     }, websocket)
                     continue
-                
-                # Detectar parpadeo
+                if payload["blinking"]:
+                    blink_count = await increment_blink_count(counter_key)
+                if timeline is not None:
+                    _record_timeline(timeline, payload)
+                    await sync_session_timeline(activity_session_id, timeline)
+                    if live is not None:
+                        await live.update(timeline, blink_count)
+                await manager.send_json_message({
+                    **payload,
+                    "seq": seq,
+                    "dropped": slot.dropped
+                }, websocket)
+                continue
+            
+            if message_type != "analyze":
+                message_type = "blink"
+            
+            # Convertir la imagen (binaria o Base64) a OpenCV
+            try:
+                if image_bytes is not None:
+                    img = decoder.decode(image_bytes)
+                else:
+                    img = decoder.decode_base64(data)
+            except Exception as e:
+                await manager.send_json_message({
+                    "error": f"Error al procesar la imagen: {str(e)}",
+                    "seq": seq,
+                    "dropped": slot.dropped
+                }, websocket)
+                continue
+            
+            # Si el frame es casi idéntico al último procesado, reutilizar su resultado.
+            # Un parpadeo no se reutiliza: cada frame repetido volvería a contarlo
+            cached = last_results.get(message_type)
+            if cached is None or cached["blinking"]:
+                similarity.reset()
+            reused = similarity.is_duplicate(img)
+            if reused:
+                payload = cached
+            else:
                 try:
-                    result = get_blink_detection_service().detect_blink(img)
-                    
-                    # Incrementar contador si se detecta parpadeo
-                    if result.blinking:
-                        increment_blink_count()
-                    
-                    # Enviar respuesta al cliente
+                    payload = await _detect(message_type, img, session_id, decoder.scale)
+                    # Solo el resultado del frame de referencia sigue siendo válido
+                    last_results = {message_type: payload}
+                except AdmissionRejected as e:
+                    # Servidor saturado: el frame no se procesa y no hay resultado que contar
+                    similarity.reset()
+                    last_results = {}
                     await manager.send_json_message({
-                        "blinking": result.blinking,
-                        "left_ear": result.left_ear,
-                        "right_ear": result.right_ear
+                        **e.to_dict(),
+                        "seq": seq,
+                        "dropped": slot.dropped
                     }, websocket)
-                    
+                    continue
                 except Exception as e:
                     # En caso de error en la detección, enviar valores por defecto
-                    await manager.send_json_message({
-                        "blinking": False,
-                        "left_ear": 0.0,
-                        "right_ear": 0.0,
-                        "error": f"Error en la detección: {str(e)}"
-                    }, websocket)
-                    
-            except json.JSONDecodeError:
-                await manager.send_json_message({
-                    "error": "El mensaje debe ser un JSON válido"
-                }, websocket)
-            except WebSocketDisconnect:
-                break
-                
+                    similarity.reset()
+                    last_results = {}
+                    payload = dict(_EMPTY_RESULTS[message_type])
+                    payload["error"] = f"Error en la detección: {str(e)}"
+            
+            # Incrementar contador si se detecta parpadeo
+            if payload["blinking"]:
+                blink_count = await increment_blink_count(counter_key)
+            if timeline is not None:
+                _record_timeline(timeline, payload)
+                await sync_session_timeline(activity_session_id, timeline)
+                if live is not None:
+                    await live.update(timeline, blink_count)
+            
+            # Enviar respuesta al cliente
+            await manager.send_json_message({
+                **payload,
+                "seq": seq,
+                "dropped": slot.dropped,
+                "reused": reused,
+                "skip_ratio": round(similarity.skip_ratio, 3)
+            }, websocket)
+            
+            # Ajustar la captura del cliente a la carga del servidor
+            executor = get_inference_executor()
+            control = controller.update(
+                latency=executor.latency_ewma,
+                workers=executor.num_workers,
+                active_sessions=manager.get_connection_count(),
+                left_ear=payload["left_ear"],
+                right_ear=payload["right_ear"],
+                blinking=payload["blinking"]
+            )
+            if control is not None:
+                await manager.send_json_message(control, websocket)
+    
     except WebSocketDisconnect:
         pass
     except Exception as e:
         # Manejar cualquier otro error
         pass
     finally:
-        # Asegurarse de remover la conexión cuando se desconecte
+        # Detener la recepción, remover la conexión, liberar su plaza, guardar la línea de tiempo,
+        # salir del panel en vivo y liberar la instancia de Face Mesh
+        receiver.cancel()
         manager.disconnect(websocket)
+        admission.close_stream(session_id)
+        if recorder is not None:
+            recorder.close()
+        # Tras /sessions/end la línea de tiempo ya se guardó y retiró: no volver a crearla
+        if timeline is not None and await hub.is_active(activity_session_id):
+            await sync_session_timeline(activity_session_id, timeline, force=True)
+        if live is not None:
+            await live.close()
+        await get_inference_executor().release_session(session_id)
@@ -0,0 +1,117 @@
+"""
+WebSocket del panel del docente: atención en vivo de todos los estudiantes de una clase.
+"""
+import asyncio
+from typing import Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.routing import APIRouter
+from supabase import create_client, Client
+
+from core.config import settings
+from endpoints.websockets.connection_manager import ConnectionManager
+from services.live_attention import class_room, get_live_attention_hub, task_room
+
+router = APIRouter()
+supabase: Client = create_client(settings.supabase_url, settings.supabase_key)
+
+# Instancia del gestor de conexiones para este WebSocket (una sala por clase o tarea)
+manager = ConnectionManager("class_live")
+
+# Tarea que agrega y difunde cada sala mientras tenga docentes conectados
+_feeds: Dict[str, asyncio.Task] = {}
+
+
+async def _feed_room(room: str) -> None:
+    """
+    Agrega la sala una vez por tick y envía el mismo frame (serializado una sola
+    vez) a todos sus docentes; termina cuando no queda ninguno.
+    """
+    hub = get_live_attention_hub()
+    try:
+        while manager.get_room_size(room):
+            await asyncio.sleep(settings.live_tick_interval)
+            try:
+                frame = await hub.aggregate(room)
+            except Exception as e:
+                print(f"[ClassLive] ⚠️ Error al agregar la sala {room}: {e}")
+                continue
+            await manager.broadcast_json_to_room(room, frame)
+    finally:
+        _feeds.pop(room, None)
+
+
+def _task_class_id(task_id: str) -> Optional[str]:
+    """Clase a la que pertenece una tarea (None si la tarea no existe)."""
+    task = supabase.table("tasks").select("class_id").eq("id", task_id).execute()
+    return task.data[0].get("class_id") if task.data else None
+
+
+@router.websocket("/ws/class/{class_id}/live")
+async def websocket_class_live(websocket: WebSocket, class_id: str):
+    """
+    WebSocket endpoint para seguir en vivo la atención de una clase.
+    
+    Cada live_tick_interval segundos el docente recibe un único frame con todos
+    los estudiantes que están enviando frames a /ws/detect/blink (sesiones
+    iniciadas con /sessions/start); el primero se envía al conectarse. Con
+    ?task_id=<id> solo se incluyen los estudiantes de esa tarea, que debe
+    pertenecer a la clase (si no, se envía un error y se cierra con el código 1008).
+    
+    Formato de cada frame:
+    {
+        "type": "live",
+        "room": "class:<id>",
+        "at": float (segundos Unix),
+        "students": [{
+            "session_id": str,
+            "student_id": str,
+            "face": bool,
+            "attention": float | null (últimos live_recent_seconds segundos),
+            "attention_score": float | null (toda la sesión),
+            "attention_level": "alto" | "medio" | "bajo" | null,
+            "blink_count": int,
+            "updated_at": float
+        }],
+        "summary": {"students": int, "faces": int, "attention": float | null, "levels": {...}}
+    }
+    
+    Los mensajes del cliente se ignoran.
+    """
+    await manager.connect(websocket)
+    task_id = websocket.query_params.get("task_id")
+    if task_id:
+        # La sala de la tarea solo se sirve a través de su propia clase
+        try:
+            task_class_id = await asyncio.get_running_loop().run_in_executor(None, _task_class_id, task_id)
+        except Exception as e:
+            print(f"[ClassLive] ❌ Error al consultar la tarea {task_id}: {e}")
+            await manager.send_json_message({"error": "No se pudo comprobar la tarea"}, websocket)
+            await manager.close(websocket, code=1011)
+            return
+        if task_class_id != class_id:
+            await manager.send_json_message({"error": "La tarea no pertenece a la clase"}, websocket)
+            await manager.close(websocket, code=1008)
+            return
+    room = task_room(task_id) if task_id else class_room(class_id)
+    manager.join(websocket, room)
+    
+    try:
+        # Estado actual sin esperar al siguiente tick
+        await manager.send_json_message(await get_live_attention_hub().aggregate(room), websocket)
+        if room not in _feeds:
+            _feeds[room] = asyncio.create_task(_feed_room(room))
+        
+        # Solo lectura: esperar a que el docente se desconecte
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[ClassLive] ❌ Error en la conexión de la sala {room}: {e}")
+    finally:
+        # Remover la conexión (y de su sala); la tarea de la sala termina sola al quedar vacía
+        manager.disconnect(websocket)
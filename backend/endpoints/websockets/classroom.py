@@ -0,0 +1,154 @@
+"""
+WebSocket del modo aula: una sola cámara gran angular para toda la clase.
+"""
+import asyncio
+import uuid
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.routing import APIRouter
+
+from core.config import settings
+from endpoints.websockets.connection_manager import ConnectionManager
+from services.admission_control import AdmissionRejected, get_admission_controller
+from services.classroom_tracker import ClassroomTracker
+from services.inference_executor import get_inference_executor
+from utils.frame_receiver import image_from_message, receive_frames
+from utils.frame_slot import LatestFrameSlot
+from utils.image_utils import FrameDecoder
+
+router = APIRouter()
+
+# Instancia del gestor de conexiones para este WebSocket
+manager = ConnectionManager("classroom")
+
+
+@router.websocket("/ws/classroom")
+async def websocket_classroom(websocket: WebSocket):
+    """
+    WebSocket endpoint para analizar a toda una clase con una sola cámara.
+    
+    La detección facial de largo alcance localiza todos los rostros del frame
+    y Face Mesh analiza cada uno. Cada rostro recibe un identificador
+    persistente entre frames (seguimiento por IoU y centroides) con su propio
+    estado de parpadeo y atención. Se decodifica un único stream por aula en
+    lugar de uno por estudiante.
+    
+    Como en /ws/detect/blink, solo se procesa el frame más reciente, y el
+    control de admisión puede rechazar la conexión o frames sueltos con un
+    mensaje {"type": "busy", "reason", "retry_after", "degrade"}.
+    
+    Formatos de mensaje aceptados del cliente:
+    - Mensaje binario con los bytes de la imagen (JPEG/WebP/PNG), recomendado
+    - Mensaje de texto JSON: {"image": "base64_encoded_image_string"}
+    
+    Formato de respuesta:
+    {
+        "faces": [
+            {
+                "id": int,                  # Identificador persistente del rostro
+                "coordinates": {"x": int, "y": int, "w": int, "h": int},
+                "blinking": bool,
+                "left_ear": float,
+                "right_ear": float,
+                "blink_count": int,         # Parpadeos de este rostro en la sesión
+                "attentive": bool,          # Mira aproximadamente al frente
+                "attention_ratio": float    # Fracción de frames en que estuvo atento
+            }
+        ],
+        "face_count": int,
+        "seq": int,
+        "dropped": int
+    }
+    """
+    await manager.connect(websocket)
+    
+    # Un aula ocupa una plaza de streaming
+    stream_id = f"classroom-{uuid.uuid4()}"
+    admission = get_admission_controller()
+    try:
+        admission.open_stream(stream_id)
+    except AdmissionRejected as e:
+        await manager.send_json_message(e.to_dict(), websocket)
+        await manager.close(websocket, code=1013)
+        return
+    
+    # Los rostros de un aula son pequeños: se decodifica a mayor resolución
+    decoder = FrameDecoder(
+        target_side=settings.classroom_decode_target_side,
+        max_pixels=settings.max_frame_pixels
+    )
+    tracker = ClassroomTracker()
+    
+    # Recepción en una tarea aparte: solo se conserva el frame más reciente
+    slot = LatestFrameSlot()
+    # Cada frame se guarda como una tupla (image_bytes, image_base64)
+    receiver = asyncio.create_task(receive_frames(
+        websocket,
+        slot,
+        lambda payload: manager.send_json_message(payload, websocket),
+        binary_frame=lambda image_bytes: (image_bytes, None),
+        text_frame=lambda message: (None, image_from_message(message))
+    ))
+    
+    try:
+        while True:
+            item = await slot.get()
+            if item is None:
+                break
+            seq, (image_bytes, image_base64) = item
+            
+            # Convertir la imagen (binaria o Base64) a OpenCV
+            try:
+                if image_bytes is not None:
+                    img = decoder.decode(image_bytes)
+                else:
+                    img = decoder.decode_base64(image_base64)
+            except Exception as e:
+                await manager.send_json_message({
+                    "error": f"Error al procesar la imagen: {str(e)}",
+                    "seq": seq,
+                    "dropped": slot.dropped
+                }, websocket)
+                continue
+            
+            try:
+                admission.check_frame()
+                detections = await admission.run(
+                    get_inference_executor().analyze_classroom(img, scale=decoder.scale)
+                )
+            except AdmissionRejected as e:
+                await manager.send_json_message({
+                    **e.to_dict(),
+                    "seq": seq,
+                    "dropped": slot.dropped
+                }, websocket)
+                continue
+            except Exception as e:
+                await manager.send_json_message({
+                    "faces": [],
+                    "face_count": 0,
+                    "error": f"Error en la detección: {str(e)}",
+                    "seq": seq,
+                    "dropped": slot.dropped
+                }, websocket)
+                continue
+            
+            # Asociar los rostros a sus identidades y actualizar su estado
+            faces = tracker.update(detections)
+            await manager.send_json_message({
+                "faces": [face.to_dict() for face in faces],
+                "face_count": len(faces),
+                "seq": seq,
+                "dropped": slot.dropped
+            }, websocket)
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        # Manejar cualquier otro error
+        pass
+    finally:
+        # Detener la recepción, remover la conexión y liberar su plaza
+        receiver.cancel()
+        manager.disconnect(websocket)
+        admission.close_stream(stream_id)
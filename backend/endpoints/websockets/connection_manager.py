@@ -1,54 +1,173 @@
 """
 Módulo reutilizable para gestionar conexiones WebSocket.
 Proporciona funcionalidades base que pueden ser utilizadas por cualquier WebSocket.
+
+Los envíos no esperan al cliente: cada conexión tiene una cola de salida acotada
+que vacía su propia tarea escritora, así que un cliente lento no retrasa al resto
+(ni al bucle que le envía los resultados). Cuando la cola de un cliente se llena
+se aplica ws_slow_consumer_policy, y un envío que tarda más de ws_send_timeout
+segundos cierra la conexión.
+
+Las conexiones pueden unirse a salas con nombre (por ejemplo "class:<id>" o
+"task:<id>") para recibir solo los mensajes de esa sala (broadcast_to_room).
 """
+import asyncio
 import json
-from typing import Set, Callable, Any, Dict
+from collections import deque
+from typing import Set, Callable, Any, Deque, Dict, Optional
 from fastapi import WebSocket
 
+from core.config import settings
+
+
+# Código de cierre para los clientes desconectados por lentos ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class _Outbox:
+    """
+    Cola de salida de una conexión y su tarea escritora.
+    """
+    
+    __slots__ = ("websocket", "messages", "ready", "idle", "writer", "rooms")
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.messages: Deque[str] = deque()
+        # ready: hay mensajes en la cola; idle: la cola está vacía y no hay envíos en curso
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.writer: Optional[asyncio.Task] = None
+        # Salas a las que pertenece la conexión
+        self.rooms: Set[str] = set()
+
 
 class ConnectionManager:
     """
     Gestor de conexiones WebSocket reutilizable.
-    Maneja el registro, almacenamiento y broadcast a múltiples conexiones.
+    Maneja el registro, almacenamiento y broadcast a múltiples conexiones
+    (todas o las de una sala).
     """
     
-    def __init__(self):
-        """Inicializa el gestor de conexiones."""
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        max_queue: Optional[int] = None,
+        slow_consumer_policy: Optional[str] = None,
+        send_timeout: Optional[float] = None
+    ):
+        """
+        Inicializa el gestor de conexiones.
+        
+        Args:
+            name: Nombre con el que se publican sus métricas (get_connection_stats)
+            max_queue: Mensajes pendientes por conexión (settings.ws_send_queue_size por defecto)
+            slow_consumer_policy: "drop_oldest" o "disconnect" (settings.ws_slow_consumer_policy por defecto)
+            send_timeout: Segundos máximos de un envío (settings.ws_send_timeout por defecto)
+        """
         self.active_connections: Set[WebSocket] = set()
+        self.max_queue = max_queue or settings.ws_send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy or settings.ws_slow_consumer_policy
+        self.send_timeout = send_timeout or settings.ws_send_timeout
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self._outboxes: Dict[WebSocket, _Outbox] = {}
+        self._closing: Set[asyncio.Task] = set()
+        
+        # Métricas
+        self.sent_messages = 0
+        self.dropped_messages = 0
+        self.evicted_connections = 0
+        self.send_errors = 0
+        self.peak_queue_depth = 0
+        
+        if name is not None:
+            _managers[name] = self
     
     async def connect(self, websocket: WebSocket) -> None:
         """
-        Acepta y registra una nueva conexión WebSocket.
+        Acepta y registra una nueva conexión WebSocket y arranca su tarea escritora.
         
         Args:
             websocket: Conexión WebSocket a registrar
         """
         await websocket.accept()
         self.active_connections.add(websocket)
+        outbox = _Outbox(websocket)
+        outbox.writer = asyncio.create_task(self._write(outbox))
+        self._outboxes[websocket] = outbox
     
     def disconnect(self, websocket: WebSocket) -> None:
         """
         Elimina una conexión del registro de conexiones activas.
         
+        Los mensajes que quedaran en su cola se descartan y la conexión sale de sus salas.
+        
         Args:
             websocket: Conexión WebSocket a eliminar
         """
         self.active_connections.discard(websocket)
+        outbox = self._outboxes.pop(websocket, None)
+        if outbox is None:
+            return
+        for room in outbox.rooms:
+            self._discard_member(room, websocket)
+        if outbox.writer is not asyncio.current_task():
+            outbox.writer.cancel()
+    
+    def join(self, websocket: WebSocket, room: str) -> None:
+        """
+        Añade una conexión registrada a una sala.
+        
+        Args:
+            websocket: Conexión WebSocket
+            room: Nombre de la sala (por ejemplo "class:<id>")
+        """
+        outbox = self._outboxes.get(websocket)
+        if outbox is not None:
+            outbox.rooms.add(room)
+            self.rooms.setdefault(room, set()).add(websocket)
+    
+    def leave(self, websocket: WebSocket, room: str) -> None:
+        """
+        Saca una conexión de una sala.
+        
+        Args:
+            websocket: Conexión WebSocket
+            room: Nombre de la sala
+        """
+        outbox = self._outboxes.get(websocket)
+        if outbox is not None:
+            outbox.rooms.discard(room)
+        self._discard_member(room, websocket)
+    
+    async def close(self, websocket: WebSocket, code: int = 1000) -> None:
+        """
+        Envía los mensajes pendientes (como mucho send_timeout segundos),
+        elimina la conexión y la cierra.
+        
+        Args:
+            websocket: Conexión WebSocket a cerrar
+            code: Código de cierre
+        """
+        outbox = self._outboxes.get(websocket)
+        if outbox is not None:
+            try:
+                await asyncio.wait_for(outbox.idle.wait(), self.send_timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.disconnect(websocket)
+        await _close_quietly(websocket, code)
     
     async def send_personal_message(self, message: str, websocket: WebSocket) -> None:
         """
-        Envía un mensaje a una conexión específica.
+        Encola un mensaje para una conexión específica (no espera a que se envíe).
         
         Args:
             message: Mensaje a enviar (debe ser string)
             websocket: Conexión WebSocket destino
         """
-        try:
-            await websocket.send_text(message)
-        except Exception:
-            # Si hay error, eliminar la conexión
-            self.disconnect(websocket)
+        self._enqueue(self._outboxes.get(websocket), message)
     
     async def send_json_message(self, data: Dict[str, Any], websocket: WebSocket) -> None:
         """
@@ -63,29 +182,20 @@ class ConnectionManager:
     
     async def broadcast(self, message: str) -> None:
         """
-        Envía un mensaje a todas las conexiones activas.
+        Encola un mensaje para todas las conexiones activas.
+        
+        Ningún cliente espera a otro: cada cola la vacía su propia tarea escritora.
         
         Args:
             message: Mensaje a enviar (debe ser string)
         """
-        if not self.active_connections:
-            return
-        
-        # Crear una copia de las conexiones para iterar (puede modificarse durante la iteración)
-        disconnected = set()
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # Si hay un error al enviar, marcar la conexión para eliminarla
-                disconnected.add(connection)
-        
-        # Eliminar conexiones desconectadas
-        self.active_connections.difference_update(disconnected)
+        # Copia: una conexión puede eliminarse durante la iteración (política "disconnect")
+        for outbox in list(self._outboxes.values()):
+            self._enqueue(outbox, message)
     
     async def broadcast_json(self, data: Dict[str, Any]) -> None:
         """
-        Envía un mensaje JSON a todas las conexiones activas.
+        Envía un mensaje JSON a todas las conexiones activas (se serializa una sola vez).
         
         Args:
             data: Datos a enviar (serán serializados a JSON)
@@ -93,6 +203,28 @@ class ConnectionManager:
         message = json.dumps(data)
         await self.broadcast(message)
     
+    async def broadcast_to_room(self, room: str, message: str) -> None:
+        """
+        Encola un mensaje para las conexiones de una sala.
+        
+        Args:
+            room: Nombre de la sala
+            message: Mensaje a enviar (debe ser string)
+        """
+        for websocket in list(self.rooms.get(room, ())):
+            self._enqueue(self._outboxes.get(websocket), message)
+    
+    async def broadcast_json_to_room(self, room: str, data: Dict[str, Any]) -> None:
+        """
+        Envía un mensaje JSON a las conexiones de una sala (se serializa una sola vez).
+        
+        Args:
+            room: Nombre de la sala
+            data: Datos a enviar (serán serializados a JSON)
+        """
+        message = json.dumps(data)
+        await self.broadcast_to_room(room, message)
+    
     def get_connection_count(self) -> int:
         """
         Obtiene el número de conexiones activas.
@@ -101,3 +233,135 @@ class ConnectionManager:
             int: Número de conexiones activas
         """
         return len(self.active_connections)
+    
+    def get_room_size(self, room: str) -> int:
+        """
+        Obtiene el número de conexiones de una sala.
+        
+        Returns:
+            int: Número de conexiones en la sala (0 si no existe)
+        """
+        return len(self.rooms.get(room, ()))
+    
+    def get_queue_depth(self, websocket: WebSocket) -> int:
+        """
+        Mensajes pendientes de envío de una conexión.
+        
+        Args:
+            websocket: Conexión WebSocket
+        
+        Returns:
+            int: Mensajes en su cola de salida (0 si no está registrada)
+        """
+        outbox = self._outboxes.get(websocket)
+        return len(outbox.messages) if outbox is not None else 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Métricas de las colas de salida.
+        
+        Returns:
+            dict: Conexiones, salas, mensajes encolados, profundidad máxima actual e histórica,
+                  mensajes enviados y descartados, conexiones expulsadas y errores de envío
+        """
+        depths = [len(outbox.messages) for outbox in self._outboxes.values()]
+        return {
+            "connections": len(self.active_connections),
+            "rooms": len(self.rooms),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "peak_queue_depth": self.peak_queue_depth,
+            "queue_size": self.max_queue,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "sent_messages": self.sent_messages,
+            "dropped_messages": self.dropped_messages,
+            "evicted_connections": self.evicted_connections,
+            "send_errors": self.send_errors
+        }
+    
+    def _discard_member(self, room: str, websocket: WebSocket) -> None:
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(websocket)
+            if not members:
+                del self.rooms[room]
+    
+    def _enqueue(self, outbox: Optional[_Outbox], message: str) -> None:
+        if outbox is None:
+            # Conexión ya eliminada (desconectada o expulsada)
+            return
+        
+        if len(outbox.messages) >= self.max_queue:
+            if self.slow_consumer_policy == "disconnect":
+                self._evict(outbox, "cola de salida llena")
+                return
+            # Degradar: el cliente pierde los mensajes más antiguos, pero recibe los recientes
+            outbox.messages.popleft()
+            self.dropped_messages += 1
+        
+        outbox.messages.append(message)
+        self.peak_queue_depth = max(self.peak_queue_depth, len(outbox.messages))
+        outbox.idle.clear()
+        outbox.ready.set()
+    
+    async def _write(self, outbox: _Outbox) -> None:
+        """
+        Tarea escritora de una conexión: envía los mensajes de su cola en orden.
+        """
+        try:
+            while True:
+                if not outbox.messages:
+                    outbox.idle.set()
+                    outbox.ready.clear()
+                    await outbox.ready.wait()
+                    continue
+                
+                message = outbox.messages.popleft()
+                await asyncio.wait_for(outbox.websocket.send_text(message), self.send_timeout)
+                self.sent_messages += 1
+        except asyncio.TimeoutError:
+            # El cliente no lee sus mensajes
+            self._evict(outbox, f"envío de más de {self.send_timeout} s")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Si hay error al enviar (cliente desconectado), eliminar la conexión
+            self.send_errors += 1
+            self.disconnect(outbox.websocket)
+        finally:
+            outbox.idle.set()
+    
+    def _evict(self, outbox: _Outbox, reason: str) -> None:
+        """
+        Expulsa a un cliente lento: elimina la conexión y la cierra en segundo plano.
+        """
+        self.evicted_connections += 1
+        print(f"[ConnectionManager] ⚠️ Cliente lento desconectado ({reason})")
+        self.disconnect(outbox.websocket)
+        task = asyncio.get_running_loop().create_task(
+            _close_quietly(outbox.websocket, SLOW_CONSUMER_CLOSE_CODE)
+        )
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+
+async def _close_quietly(websocket: WebSocket, code: int) -> None:
+    try:
+        await websocket.close(code=code)
+    except Exception:
+        # La conexión ya estaba cerrada
+        pass
+
+
+# Gestores con nombre, para consultar sus métricas
+_managers: Dict[str, ConnectionManager] = {}
+
+
+def get_connection_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Métricas de las colas de salida de cada gestor de conexiones con nombre.
+    
+    Returns:
+        dict {nombre: métricas de ConnectionManager.get_stats()}
+    """
+    return {name: manager.get_stats() for name, manager in _managers.items()}
@@ -4,6 +4,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from core.config import settings
 from core.exceptions import setup_exception_handlers
 from endpoints.routes import register_routes
+from services.inference_executor import shutdown_inference_executor
+from services.state_backend import shutdown_state_backend
 
 # Crear instancia de FastAPI con configuración
 app = FastAPI(
@@ -31,3 +33,15 @@ setup_exception_handlers(app)
 
 # Registrar todas las rutas
 register_routes(app)
+
+
+@app.on_event("shutdown")
+def stop_inference_executor():
+    """Detiene los procesos de inferencia al apagar el servidor."""
+    shutdown_inference_executor()
+
+
+@app.on_event("shutdown")
+def stop_state_backend():
+    """Cierra la conexión con el backend de estado compartido."""
+    shutdown_state_backend()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -68,3 +68,38 @@ class BlinkDetectionResponse(BaseModel):
     blinking: bool
     left_ear: float
     right_ear: float
+
+
+class BlinkBatchRequest(BaseModel):
+    images: List[str]  # Frames en Base64, en orden de captura
+
+
+class BlinkBatchResponse(BaseModel):
+    """Resultados por frame de un lote y parpadeos agregados"""
+    blinking: List[Optional[bool]]  # None en los frames que no son imágenes válidas
+    left_ear: List[Optional[float]]
+    right_ear: List[Optional[float]]
+    blink_events: List[int]  # Índices de los frames donde empieza cada parpadeo
+    blink_count: int
+    failed_frames: List[int] = []  # Índices de los frames que no se pudieron decodificar
+
+
+class AttentionFeatures(BaseModel):
+    """Métricas adicionales calculadas a partir de los landmarks de Face Mesh"""
+    mouth_aspect_ratio: float
+    yaw: float  # Grados, positivo = rostro girado hacia la derecha de la imagen
+    pitch: float  # Grados, positivo = cabeza hacia arriba
+    roll: float  # Grados, positivo = sentido horario en la imagen
+    gaze_x: float  # Posición horizontal del iris en el ojo (-1 a 1 aprox.)
+    gaze_y: float  # Posición vertical del iris en el ojo (-1 a 1 aprox.)
+
+
+class AttentionAnalysisResponse(BaseModel):
+    """Detección de rostro y de parpadeo de un mismo frame en una sola pasada"""
+    detected: bool
+    coordinates: Optional[Coordinates] = None
+    confidence: float
+    blinking: bool
+    left_ear: float
+    right_ear: float
+    features: Optional[AttentionFeatures] = None  # Solo si se detectó rostro
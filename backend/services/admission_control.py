@@ -0,0 +1,301 @@
+"""
+Control de admisión delante de los servicios de detección.
+
+Limita las conexiones de streaming simultáneas, la profundidad de la cola de
+inferencia, los frames de lotes en curso y el tiempo que se espera el resultado
+de cada frame (o de cada lote). Cuando se alcanza un límite, el trabajo se
+rechaza de inmediato con un mensaje estructurado (ocupado, cuándo reintentar y cómo degradar la captura) en lugar
+de encolarlo: las sesiones admitidas conservan una latencia predecible y las
+demás saben cuándo volver a intentarlo.
+
+El modo landmarks solo se sugiere a quien puede usarlo (la conexión de
+/ws/detect/blink); al resto se le sugieren imágenes más pequeñas y menos fps.
+"""
+import asyncio
+import math
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Set
+
+from core.config import settings
+from services.inference_executor import get_inference_executor
+
+
+# Límites automáticos (configuración en 0) por proceso de inferencia
+_STREAMS_PER_WORKER = 8
+_QUEUE_DEPTH_PER_WORKER = 4
+
+# Captura sugerida a los clientes rechazados por carga: modo landmarks (sin
+# inferencia en el servidor) o, si no está disponible, imágenes pequeñas
+_DEGRADE_MAX_SIDE = 320
+_DEGRADE_QUALITY = 0.6
+
+# Prefijo de las sesiones temporales de los lotes: sus trabajos pendientes no
+# cuentan en la cola de los frames sueltos
+BATCH_SESSION_PREFIX = "batch-"
+
+
+class AdmissionRejected(Exception):
+    """
+    Trabajo rechazado por el control de admisión.
+
+    Attributes:
+        reason: "streams" (demasiadas conexiones), "queue" (cola de inferencia
+            llena), "batch" (demasiados frames de lotes en curso) o "deadline"
+            (el resultado no llegó a tiempo)
+        retry_after: Segundos sugeridos antes de reintentar
+        degrade: Parámetros de captura sugeridos para reducir la carga
+    """
+
+    def __init__(self, reason: str, retry_after: float, degrade: Dict[str, Any]):
+        super().__init__(f"Servidor ocupado ({reason}), reintentar en {retry_after:.1f} s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.degrade = degrade
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Mensaje "busy" que se envía al cliente."""
+        return {
+            "type": "busy",
+            "reason": self.reason,
+            "retry_after": round(self.retry_after, 2),
+            "degrade": self.degrade
+        }
+
+    @property
+    def retry_after_header(self) -> str:
+        """Valor de la cabecera HTTP Retry-After (segundos enteros)."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionController:
+    """
+    Decide qué conexiones y frames pasan a los procesos de inferencia.
+
+    - Conexiones: como máximo max_streams conexiones de streaming a la vez.
+    - Cola: si hay max_queue_depth trabajos pendientes, los frames nuevos se rechazan.
+    - Lotes: los frames de /detect/blink/batch tienen su propio cupo
+      (max_batch_frames) y no cuentan en la cola de los frames sueltos mientras
+      sigan pendientes en el ejecutor (también tras vencer su plazo); un lote
+      solo se admite si esa cola no está llena.
+    - Plazo: si el resultado de un frame tarda más de frame_deadline, se deja de
+      esperar y se responde "busy" (el trabajador termina el frame igualmente).
+      Los frames de un lote se atienden en orden en un mismo trabajador, así que
+      el plazo se aplica al lote entero y crece con su número de frames. El
+      plazo empieza a aplicarse cuando hay latencias medidas (tras la carga de
+      los modelos en los trabajadores).
+    """
+
+    def __init__(
+        self,
+        max_streams: Optional[int] = None,
+        max_queue_depth: Optional[int] = None,
+        frame_deadline: Optional[float] = None,
+        max_batch_frames: Optional[int] = None
+    ):
+        """
+        Args:
+            max_streams: Conexiones de streaming simultáneas (0 = automático según los trabajadores)
+            max_queue_depth: Trabajos pendientes admitidos (0 = automático según los trabajadores)
+            frame_deadline: Segundos máximos de espera por frame (0 = sin plazo)
+            max_batch_frames: Frames de lotes en curso admitidos (0 = automático según los trabajadores)
+        """
+        self._max_streams = settings.admission_max_streams if max_streams is None else max_streams
+        self._max_queue_depth = settings.admission_max_queue_depth if max_queue_depth is None else max_queue_depth
+        self._max_batch_frames = settings.admission_max_batch_frames if max_batch_frames is None else max_batch_frames
+        self.frame_deadline = settings.admission_frame_deadline if frame_deadline is None else frame_deadline
+        self.streams: Set[str] = set()
+        # Frames de los lotes admitidos
+        self.batch_frames = 0
+        self.rejected_streams = 0
+        self.rejected_frames = 0
+        self.rejected_batches = 0
+        self.expired_frames = 0
+
+    @property
+    def max_streams(self) -> int:
+        return self._max_streams or _STREAMS_PER_WORKER * get_inference_executor().num_workers
+
+    @property
+    def max_queue_depth(self) -> int:
+        return self._max_queue_depth or _QUEUE_DEPTH_PER_WORKER * get_inference_executor().num_workers
+
+    @property
+    def max_batch_frames(self) -> int:
+        return self._max_batch_frames or settings.blink_batch_max_frames * get_inference_executor().num_workers
+
+    def open_stream(self, stream_id: str, landmarks: bool = False) -> None:
+        """
+        Admite una conexión de streaming.
+
+        Args:
+            stream_id: Identificador de la conexión
+            landmarks: Si el cliente puede pasar al modo landmarks
+
+        Raises:
+            AdmissionRejected: Si ya hay max_streams conexiones admitidas
+        """
+        if len(self.streams) >= self.max_streams:
+            self.rejected_streams += 1
+            raise AdmissionRejected("streams", settings.admission_stream_retry_after, self._degrade(landmarks))
+        self.streams.add(stream_id)
+
+    def close_stream(self, stream_id: str) -> None:
+        """Libera la plaza de una conexión de streaming."""
+        self.streams.discard(stream_id)
+
+    def check_frame(self, frames: int = 1, landmarks: bool = False) -> None:
+        """
+        Comprueba que la cola de inferencia admite frames nuevos.
+
+        Args:
+            frames: Número de frames que se van a enviar juntos
+            landmarks: Si el cliente puede pasar al modo landmarks
+
+        Raises:
+            AdmissionRejected: Si la cola de inferencia no tiene sitio
+        """
+        if self._queue_depth() + frames > self.max_queue_depth:
+            self.rejected_frames += 1
+            raise AdmissionRejected("queue", self._drain_time(), self._degrade(landmarks))
+
+    def open_batch(self, frames: int) -> None:
+        """
+        Admite un lote de frames y reserva su cupo (liberarlo con close_batch).
+
+        Args:
+            frames: Número de frames del lote
+
+        Raises:
+            AdmissionRejected: Si la cola de inferencia está llena o el lote no cabe
+                en el cupo de frames de lotes en curso
+        """
+        if self._queue_depth() >= self.max_queue_depth:
+            self.rejected_batches += 1
+            raise AdmissionRejected("queue", self._drain_time(), self._degrade())
+        if self.batch_frames + frames > self.max_batch_frames:
+            self.rejected_batches += 1
+            raise AdmissionRejected("batch", self._drain_time(), self._degrade())
+        self.batch_frames += frames
+
+    def close_batch(self, frames: int) -> None:
+        """Libera el cupo de un lote admitido con open_batch."""
+        self.batch_frames = max(0, self.batch_frames - frames)
+
+    async def run(self, job: Awaitable[Any], landmarks: bool = False) -> Any:
+        """
+        Espera el resultado de un trabajo de inferencia con el plazo por frame.
+
+        Args:
+            job: Corrutina del ejecutor de inferencia
+            landmarks: Si el cliente puede pasar al modo landmarks
+
+        Returns:
+            Resultado del trabajo
+
+        Raises:
+            AdmissionRejected: Si el resultado no llega antes de frame_deadline
+        """
+        # Sin latencias medidas los trabajadores aún cargan los modelos: no se aplica el plazo
+        if self.frame_deadline <= 0 or not get_inference_executor().latency_ewma:
+            return await job
+        try:
+            return await asyncio.wait_for(job, timeout=self.frame_deadline)
+        except asyncio.TimeoutError:
+            self.expired_frames += 1
+            raise AdmissionRejected("deadline", self._drain_time(), self._degrade(landmarks))
+
+    async def run_batch(self, jobs: Sequence[Awaitable[Any]]) -> List[Any]:
+        """
+        Espera los resultados de los frames de un lote admitido con open_batch,
+        con un plazo para el lote entero.
+
+        Los frames de un lote van a un mismo trabajador, que los atiende en orden:
+        el último termina unas len(jobs) latencias después de empezar el primero.
+        Por eso el plazo es frame_deadline más la latencia media por cada frame,
+        en lugar del plazo por frame (que vencería en los últimos frames de
+        cualquier lote grande).
+
+        Args:
+            jobs: Corrutinas del ejecutor de inferencia, en orden, de una sesión
+                cuyo identificador empieza por BATCH_SESSION_PREFIX
+
+        Returns:
+            Lista de resultados, en el orden de jobs
+
+        Raises:
+            AdmissionRejected: Si el lote no termina antes de su plazo
+        """
+        batch = asyncio.gather(*jobs)
+        latency = get_inference_executor().latency_ewma
+        # Sin latencias medidas los trabajadores aún cargan los modelos: no se aplica el plazo
+        if self.frame_deadline <= 0 or not latency:
+            return await batch
+        try:
+            return await asyncio.wait_for(batch, timeout=self.frame_deadline + len(jobs) * latency)
+        except asyncio.TimeoutError:
+            self.expired_frames += len(jobs)
+            raise AdmissionRejected("deadline", self._drain_time(), self._degrade())
+
+    def _queue_depth(self) -> int:
+        """
+        Trabajos pendientes que no pertenecen a lotes (los lotes tienen su propio cupo).
+
+        Se cuentan en el ejecutor: un frame de lote cuyo plazo venció sigue
+        ocupando al trabajador hasta que este lo termina o lo descarta.
+        """
+        executor = get_inference_executor()
+        return max(0, executor.get_pending_count() - executor.get_pending_count(BATCH_SESSION_PREFIX))
+
+    def _drain_time(self) -> float:
+        """Tiempo estimado para vaciar la cola actual de inferencia."""
+        executor = get_inference_executor()
+        latency = executor.latency_ewma or self.frame_deadline or 1.0
+        return max(latency, executor.get_pending_count() / max(1, executor.num_workers) * latency)
+
+    def _degrade(self, landmarks: bool = False) -> Dict[str, Any]:
+        """
+        Captura sugerida: el ritmo que la capacidad de inferencia permite por
+        conexión admitida y, si el cliente puede usarlo, el modo landmarks.
+        """
+        executor = get_inference_executor()
+        fps = settings.capture_idle_fps
+        if executor.latency_ewma > 0:
+            capacity = executor.num_workers / executor.latency_ewma * settings.capture_target_utilization
+            fps = capacity / max(1, len(self.streams))
+        degrade = {
+            "fps": int(max(settings.capture_min_fps, min(settings.capture_idle_fps, fps))),
+            "max_side": _DEGRADE_MAX_SIDE,
+            "quality": _DEGRADE_QUALITY
+        }
+        if landmarks:
+            degrade = {"mode": "landmarks", **degrade}
+        return degrade
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado actual y contadores de rechazos."""
+        executor = get_inference_executor()
+        return {
+            "streams": len(self.streams),
+            "max_streams": self.max_streams,
+            "pending": executor.get_pending_count(),
+            "max_queue_depth": self.max_queue_depth,
+            "batch_frames": self.batch_frames,
+            "max_batch_frames": self.max_batch_frames,
+            "frame_deadline": self.frame_deadline,
+            "latency_ewma": round(executor.latency_ewma, 4),
+            "rejected_streams": self.rejected_streams,
+            "rejected_frames": self.rejected_frames,
+            "rejected_batches": self.rejected_batches,
+            "expired_frames": self.expired_frames
+        }
+
+
+# Instancia global, creada de forma "lazy" (los límites automáticos dependen del ejecutor)
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Obtiene el control de admisión global."""
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = AdmissionController()
+    return _admission_controller
@@ -0,0 +1,419 @@
+"""
+Pipeline en cascada para la detección de atención.
+
+Una pasada barata de detección facial (o la región del frame anterior) delimita
+la región de interés (ROI). Face Mesh solo se ejecuta sobre ese recorte reducido,
+y se omite por completo cuando no hay rostro en el frame.
+"""
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.config import settings
+from models.schemas import (
+    AttentionAnalysisResponse,
+    AttentionFeatures,
+    BlinkDetectionResponse,
+    Coordinates,
+    FaceDetectionResponse,
+)
+from services.blink_detection_service import BlinkDetectionService
+from services.face_detection_service import FaceDetectionService
+from services.landmark_features import LandmarkFeatures, blink_from_ears, compute_features, landmarks_to_array, to_pixels
+
+
+# Fracción del tamaño de la ROI que los landmarks pueden acercarse al borde antes de recentrarla
+_ROI_EDGE_TOLERANCE = 0.1
+
+
+def _landmark_box(points: np.ndarray, roi: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    """
+    Caja del rostro a partir de los landmarks normalizados de un recorte, en
+    coordenadas del frame completo.
+
+    Args:
+        points: Array (N, 3) de landmarks normalizados respecto al recorte
+        roi: Región (x, y, w, h) del frame que ocupa el recorte
+    """
+    rx, ry, rw, rh = roi
+    low = points[:, :2].min(axis=0)
+    high = points[:, :2].max(axis=0)
+    x0 = rx + int(max(0.0, float(low[0])) * rw)
+    y0 = ry + int(max(0.0, float(low[1])) * rh)
+    x1 = rx + int(min(1.0, float(high[0])) * rw)
+    y1 = ry + int(min(1.0, float(high[1])) * rh)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+class FrameAnalysis:
+    """
+    Resultado del análisis de un frame: caja del rostro, datos de parpadeo y
+    métricas de los landmarks.
+    """
+
+    __slots__ = ("face_detected", "box", "confidence", "blink", "features")
+
+    def __init__(
+        self,
+        face_detected: bool = False,
+        box: Optional[Tuple[int, int, int, int]] = None,
+        confidence: float = 0.0,
+        blink: Optional[BlinkDetectionResponse] = None,
+        features: Optional[LandmarkFeatures] = None
+    ):
+        self.face_detected = face_detected
+        self.box = box
+        self.confidence = confidence
+        self.blink = blink or BlinkDetectionResponse(blinking=False, left_ear=0.0, right_ear=0.0)
+        self.features = features
+
+    def to_face_response(self) -> FaceDetectionResponse:
+        if not self.face_detected or self.box is None:
+            return FaceDetectionResponse(detected=False, coordinates=None, confidence=0.0)
+        x, y, w, h = self.box
+        return FaceDetectionResponse(
+            detected=True,
+            coordinates=Coordinates(x=x, y=y, w=w, h=h),
+            confidence=self.confidence
+        )
+
+    def to_blink_response(self) -> BlinkDetectionResponse:
+        return self.blink
+
+    def to_analysis_response(self, scale: float = 1.0) -> AttentionAnalysisResponse:
+        """
+        Combina la detección de rostro y de parpadeo en una sola respuesta.
+
+        Args:
+            scale: Factor para llevar la caja a la resolución original de la imagen
+        """
+        coordinates = None
+        if self.face_detected and self.box is not None:
+            x, y, w, h = (int(round(v * scale)) for v in self.box)
+            coordinates = Coordinates(x=x, y=y, w=w, h=h)
+        features = None
+        if coordinates is not None and self.features is not None:
+            features = AttentionFeatures(
+                mouth_aspect_ratio=self.features.mouth_aspect_ratio,
+                yaw=self.features.yaw,
+                pitch=self.features.pitch,
+                roll=self.features.roll,
+                gaze_x=self.features.gaze_x,
+                gaze_y=self.features.gaze_y
+            )
+        return AttentionAnalysisResponse(
+            detected=coordinates is not None,
+            coordinates=coordinates,
+            confidence=self.confidence if coordinates is not None else 0.0,
+            blinking=self.blink.blinking,
+            left_ear=self.blink.left_ear,
+            right_ear=self.blink.right_ear,
+            features=features
+        )
+
+
+class AttentionPipeline:
+    """
+    Cascada detección facial -> Face Mesh sobre la región de interés.
+
+    Con reuse_roi=True (sesiones de streaming) la ROI se conserva entre frames y
+    solo se vuelve a ejecutar la detección facial cuando Face Mesh pierde el rostro.
+    Cada vez que la ROI cambia se reinicia el seguimiento de Face Mesh, porque los
+    landmarks del frame anterior están en coordenadas de otro recorte.
+    """
+
+    def __init__(
+        self,
+        face_detector: FaceDetectionService,
+        blink_detector: BlinkDetectionService,
+        reuse_roi: bool = True,
+        roi_margin: Optional[float] = None,
+        roi_max_side: Optional[int] = None
+    ):
+        """
+        Args:
+            face_detector: Servicio de detección facial usado como compuerta
+            blink_detector: Servicio de Face Mesh para calcular el EAR
+            reuse_roi: Si True, reutiliza la ROI del frame anterior
+            roi_margin: Margen alrededor del rostro (fracción de su tamaño)
+            roi_max_side: Lado mayor máximo del recorte que recibe Face Mesh
+        """
+        self.face_detector = face_detector
+        self.blink_detector = blink_detector
+        self.reuse_roi = reuse_roi
+        self.roi_margin = settings.roi_margin if roi_margin is None else roi_margin
+        self.roi_max_side = settings.roi_max_side if roi_max_side is None else roi_max_side
+        self._roi: Optional[Tuple[int, int, int, int]] = None
+        self._mesh_roi: Optional[Tuple[int, int, int, int]] = None
+        self._confidence = 0.0
+        self._crop_buffer: Optional[np.ndarray] = None
+        self._points_buffer: Optional[np.ndarray] = None
+
+    def reset(self) -> None:
+        """Olvida la ROI del frame anterior (por ejemplo, al cambiar de sesión)."""
+        self._roi = None
+        self._mesh_roi = None
+        self._confidence = 0.0
+
+    def process(self, img: np.ndarray) -> FrameAnalysis:
+        """
+        Analiza un frame.
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+
+        Returns:
+            FrameAnalysis con la caja del rostro (en píxeles de img) y los datos de parpadeo
+        """
+        height, width = img.shape[:2]
+
+        roi = self._roi if self.reuse_roi else None
+        reused = roi is not None
+        if roi is None:
+            roi = self._gate(img)
+            if roi is None:
+                # Sin rostro: no se ejecuta Face Mesh
+                self.reset()
+                return FrameAnalysis()
+
+        analysis = self._analyze_roi(img, roi)
+        if analysis is None and reused:
+            # La ROI reutilizada ya no contiene el rostro: volver a localizarlo
+            roi = self._gate(img)
+            analysis = self._analyze_roi(img, roi) if roi is not None else None
+
+        if analysis is None:
+            self.reset()
+            return FrameAnalysis()
+
+        self._roi = self._next_roi(roi, analysis.box, width, height)
+        return analysis
+
+    def analyze_face(
+        self,
+        img: np.ndarray,
+        box: Tuple[int, int, int, int],
+        confidence: float
+    ) -> Optional[FrameAnalysis]:
+        """
+        Ejecuta Face Mesh sobre un rostro ya localizado (sin usar ni modificar la ROI guardada).
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+            box: Caja (x, y, w, h) del rostro en píxeles de img
+            confidence: Confianza de la detección del rostro
+
+        Returns:
+            FrameAnalysis o None si Face Mesh no encuentra el rostro
+        """
+        height, width = img.shape[:2]
+        roi = self._expand(box, width, height)
+        if roi is None:
+            return None
+        self._confidence = confidence
+        return self._analyze_roi(img, roi)
+
+    def _gate(self, img: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Localiza el rostro con la detección facial y devuelve la ROI ampliada."""
+        face = self.face_detector.locate_face(img)
+        if face is None:
+            return None
+        x, y, w, h, confidence = face
+        self._confidence = confidence
+        height, width = img.shape[:2]
+        return self._expand((x, y, w, h), width, height)
+
+    def _expand(self, box: Tuple[int, int, int, int], width: int, height: int) -> Optional[Tuple[int, int, int, int]]:
+        """Amplía una caja con el margen configurado, la hace cuadrada y la recorta al frame."""
+        x, y, w, h = box
+        side = max(w, h) * (1.0 + 2.0 * self.roi_margin)
+        cx, cy = x + w / 2.0, y + h / 2.0
+        x0 = max(0, int(cx - side / 2.0))
+        y0 = max(0, int(cy - side / 2.0))
+        x1 = min(width, int(cx + side / 2.0))
+        y1 = min(height, int(cy + side / 2.0))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _analyze_roi(self, img: np.ndarray, roi: Tuple[int, int, int, int]) -> Optional[FrameAnalysis]:
+        """Ejecuta Face Mesh sobre el recorte reducido de la ROI."""
+        rx, ry, rw, rh = roi
+        crop = img[ry:ry + rh, rx:rx + rw]
+
+        if self.reuse_roi and roi != self._mesh_roi:
+            # Face Mesh en modo video sigue el rostro en coordenadas del recorte anterior
+            self.blink_detector.reset()
+            self._mesh_roi = roi
+
+        scale = min(1.0, self.roi_max_side / max(rw, rh)) if self.roi_max_side else 1.0
+        if scale < 1.0:
+            shape = (max(1, round(rh * scale)), max(1, round(rw * scale)), 3)
+            if self._crop_buffer is None or self._crop_buffer.shape != shape:
+                self._crop_buffer = np.empty(shape, dtype=np.uint8)
+            crop = cv2.resize(crop, (shape[1], shape[0]), dst=self._crop_buffer, interpolation=cv2.INTER_AREA)
+        else:
+            crop = np.ascontiguousarray(crop)
+
+        face_landmarks = self.blink_detector.detect_landmarks(crop)
+        if face_landmarks is None:
+            return None
+
+        # Todas las métricas salen de un único array con los landmarks
+        points = self._points_buffer = landmarks_to_array(face_landmarks, self._points_buffer)
+        features = compute_features(to_pixels(points, crop.shape))
+        blink = blink_from_ears(features.left_ear, features.right_ear, self.blink_detector.ear_threshold)
+
+        return FrameAnalysis(
+            face_detected=True,
+            box=_landmark_box(points, roi),
+            confidence=self._confidence,
+            blink=blink,
+            features=features
+        )
+
+    def _next_roi(
+        self,
+        roi: Tuple[int, int, int, int],
+        box: Tuple[int, int, int, int],
+        width: int,
+        height: int
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Mantiene la ROI actual mientras el rostro siga bien centrado en ella; si los
+        landmarks se acercan al borde o cambian mucho de tamaño, la recentra sobre ellos.
+        """
+        rx, ry, rw, rh = roi
+        x, y, w, h = box
+        tolerance_x = rw * _ROI_EDGE_TOLERANCE
+        tolerance_y = rh * _ROI_EDGE_TOLERANCE
+        # Un lado de la ROI pegado al borde del frame no puede desplazarse más
+        inside = (
+            (x - rx >= tolerance_x or rx == 0)
+            and (y - ry >= tolerance_y or ry == 0)
+            and (rx + rw - (x + w) >= tolerance_x or rx + rw >= width)
+            and (ry + rh - (y + h) >= tolerance_y or ry + rh >= height)
+        )
+        expected = max(rw, rh) / (1.0 + 2.0 * self.roi_margin)
+        size_ratio = max(w, h) / expected if expected else 0.0
+        if inside and 0.6 <= size_ratio <= 1.4:
+            return roi
+        return self._expand(box, width, height)
+
+
+class AttentionPipelinePool:
+    """
+    Pool de pipelines en modo streaming (Face Mesh con static_image_mode=False).
+
+    Cada sesión (por ejemplo, una conexión WebSocket) toma un pipeline propio para
+    aprovechar el seguimiento de landmarks y la ROI entre frames, y lo devuelve al
+    terminar para que otra sesión lo reutilice sin volver a construir el grafo de MediaPipe.
+    """
+
+    def __init__(self, face_detector: FaceDetectionService, max_idle: int = 8):
+        """
+        Args:
+            face_detector: Servicio de detección facial compartido por todos los pipelines
+            max_idle: Número máximo de pipelines libres que se conservan para reutilizar
+        """
+        self.face_detector = face_detector
+        self.max_idle = max_idle
+        self._idle: list = []
+        self._sessions: dict = {}
+
+    def checkout(self, session_id: str) -> AttentionPipeline:
+        """
+        Obtiene el pipeline asignado a una sesión, tomándolo del pool si aún no tiene uno.
+
+        Args:
+            session_id: Identificador de la sesión
+
+        Returns:
+            AttentionPipeline en modo streaming
+        """
+        pipeline = self._sessions.get(session_id)
+        if pipeline is None:
+            if self._idle:
+                pipeline = self._idle.pop()
+            else:
+                pipeline = AttentionPipeline(
+                    self.face_detector,
+                    BlinkDetectionService(static_image_mode=False, max_num_faces=1)
+                )
+            self._sessions[session_id] = pipeline
+        return pipeline
+
+    def release(self, session_id: str) -> None:
+        """
+        Devuelve al pool el pipeline asignado a una sesión.
+
+        Antes se reinicia su Face Mesh, para que la siguiente sesión no empiece
+        siguiendo el rostro de la anterior.
+
+        Args:
+            session_id: Identificador de la sesión
+        """
+        pipeline = self._sessions.pop(session_id, None)
+        if pipeline is None:
+            return
+        pipeline.reset()
+        if len(self._idle) < self.max_idle:
+            pipeline.blink_detector.reset()
+            self._idle.append(pipeline)
+        else:
+            pipeline.blink_detector.face_mesh.close()
+
+    def get_active_count(self) -> int:
+        """
+        Obtiene el número de sesiones con un pipeline asignado.
+
+        Returns:
+            int: Número de sesiones activas
+        """
+        return len(self._sessions)
+
+
+class MultiFaceAnalyzer:
+    """
+    Análisis de varios rostros por frame para el modo aula (una cámara para toda la clase).
+
+    En un plano general los rostros ocupan poco del frame y el detector interno de
+    Face Mesh (de corto alcance) no los encuentra, así que la cascada usa la
+    detección facial de largo alcance para localizar todos los rostros y ejecuta
+    Face Mesh sobre el recorte reducido de cada uno.
+    """
+
+    def __init__(self, max_num_faces: Optional[int] = None):
+        """
+        Args:
+            max_num_faces: Número máximo de rostros por frame (por defecto, el de la configuración)
+        """
+        self.max_num_faces = settings.classroom_max_faces if max_num_faces is None else max_num_faces
+        face_detector = FaceDetectionService(
+            model_selection=1,
+            min_detection_confidence=settings.face_detection_min_confidence
+        )
+        self.pipeline = AttentionPipeline(
+            face_detector,
+            BlinkDetectionService(static_image_mode=True, max_num_faces=1),
+            reuse_roi=False
+        )
+
+    def process(self, img: np.ndarray) -> List[FrameAnalysis]:
+        """
+        Analiza todos los rostros de un frame.
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+
+        Returns:
+            Lista de FrameAnalysis, uno por rostro con landmarks (caja en píxeles de img)
+        """
+        faces = self.pipeline.face_detector.locate_faces(img)[:self.max_num_faces]
+        analyses = []
+        for x, y, w, h, confidence in faces:
+            analysis = self.pipeline.analyze_face(img, (x, y, w, h), confidence)
+            if analysis is not None:
+                analyses.append(analysis)
+        return analyses
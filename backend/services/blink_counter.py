@@ -1,37 +1,285 @@
 """
-Módulo para gestionar el contador global de parpadeos.
-Proporciona funciones para incrementar, resetear y consultar el contador.
+Módulo para gestionar los contadores de parpadeos por sesión.
+
+Cada sesión (o estudiante) tiene su propio contador, identificado por una clave;
+los clientes que no indican clave comparten el contador DEFAULT_KEY, como el
+antiguo contador global. Los contadores se guardan en el backend de estado
+(services/state_backend.py), así que todos los procesos de uvicorn ven los
+mismos valores. La memoria está acotada: los contadores sin parpadeos durante
+blink_counter_ttl segundos caducan y, si se supera blink_counter_max_keys, se
+descartan los actualizados hace más tiempo.
+
+Los cambios se publican a los suscriptores de cada clave (subscribe): en lugar
+de consultar el contador periódicamente, esperan a que cambie. Los incrementos
+y borrados hechos en el propio proceso se avisan al instante. Además, una única
+tarea por proceso consulta cada state_poll_interval segundos los contadores que
+tienen suscriptores para detectar los cambios de otros procesos y los
+contadores descartados por caducidad o por exceso de claves, que el backend
+elimina sin avisar.
 """
+import asyncio
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from core.config import settings
+from services.state_backend import StateNamespace, get_state_backend
+
+
+DEFAULT_KEY = "global"
+
+# Registro de un contador: [parpadeos, último parpadeo (s Unix), tasa acumulada, instante de la tasa]
+_COUNT, _LAST_BLINK, _RATE, _RATE_AT = range(4)
+
+
+def _add_blink(record: Optional[Sequence[float]], now: float, rate_window: float) -> List[float]:
+    """
+    Nuevo registro tras un parpadeo.
+
+    La tasa es una media con decaimiento exponencial: cada parpadeo suma 1 y el
+    acumulado decae con constante de tiempo rate_window, así que no hace falta
+    guardar los instantes de los parpadeos.
+    """
+    if record is None:
+        return [1, now, 1.0, now]
+    return [record[_COUNT] + 1, now, _decayed_rate(record, now, rate_window) + 1.0, now]
+
+
+def _decayed_rate(record: Sequence[float], now: float, rate_window: float) -> float:
+    return record[_RATE] * math.exp(-max(0.0, now - record[_RATE_AT]) / rate_window)
+
+
+def _record_to_dict(record: Optional[Sequence[float]], now: float, rate_window: float) -> Dict[str, Optional[float]]:
+    if record is None:
+        return {"blink_count": 0, "last_blink_at": None, "blink_rate": 0.0}
+    return {
+        "blink_count": int(record[_COUNT]),
+        "last_blink_at": record[_LAST_BLINK],
+        # Parpadeos por minuto en la ventana reciente
+        "blink_rate": round(_decayed_rate(record, now, rate_window) * 60.0 / rate_window, 2)
+    }
+
+
+class BlinkCountSubscription:
+    """
+    Suscripción a los cambios del contador de una clave.
+
+    Los avisos se agrupan: varios cambios antes de wait() despiertan una sola vez,
+    y el suscriptor lee entonces el valor más reciente.
+    """
+
+    __slots__ = ("key", "closed", "_store", "_event")
+
+    def __init__(self, store: "BlinkCounterStore", key: str):
+        self.key = key
+        self.closed = False
+        self._store = store
+        self._event = asyncio.Event()
+
+    async def wait(self) -> bool:
+        """
+        Espera al siguiente cambio del contador.
+
+        Returns:
+            bool: False si la suscripción se ha cerrado
+        """
+        await self._event.wait()
+        self._event.clear()
+        return not self.closed
+
+    def notify(self) -> None:
+        self._event.set()
+
+    def close(self) -> None:
+        """Cancela la suscripción y despierta a quien esté esperando."""
+        if not self.closed:
+            self.closed = True
+            self._store.unsubscribe(self)
+            self._event.set()
+
+
+class BlinkCounterStore:
+    """
+    Contadores de parpadeos por clave sobre un espacio de nombres del backend de estado.
+    """
+
+    def __init__(
+        self,
+        counters: StateNamespace,
+        rate_window: float = 60.0,
+        poll_interval: float = 0.5
+    ):
+        """
+        Args:
+            counters: Espacio de nombres donde se guardan los registros (con su TTL y máximo de claves)
+            rate_window: Constante de tiempo (s) de la tasa de parpadeos
+            poll_interval: Segundos entre consultas de los contadores con suscriptores
+        """
+        self.counters = counters
+        self.rate_window = rate_window
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[str, Set[BlinkCountSubscription]] = {}
+        # Último valor visto de cada clave con suscriptores (para detectar los cambios de otros procesos)
+        self._known: Dict[str, int] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    async def increment(self, key: str = DEFAULT_KEY, now: Optional[float] = None) -> int:
+        """
+        Suma un parpadeo al contador de una clave (creándolo si no existe).
+
+        Returns:
+            int: El nuevo valor del contador
+        """
+        now = time.time() if now is None else now
+        record = await self.counters.aupdate(key, lambda current: _add_blink(current, now, self.rate_window))
+        self._notify(key, int(record[_COUNT]))
+        return int(record[_COUNT])
+
+    async def get(self, key: str = DEFAULT_KEY) -> int:
+        """Valor del contador de una clave (0 si no existe o ha caducado). No renueva su uso."""
+        record = await self.counters.aget(key)
+        return int(record[_COUNT]) if record is not None else 0
+
+    async def reset(self, key: str = DEFAULT_KEY) -> None:
+        """Elimina el contador de una clave."""
+        # Se avisa aunque el contador ya hubiera caducado: el suscriptor puede conservar su último valor
+        await self.counters.adelete(key)
+        self._notify(key, 0)
+
+    async def snapshot(self, keys: Optional[Iterable[str]] = None, now: Optional[float] = None) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Estado de varios contadores a la vez (para paneles).
+
+        Args:
+            keys: Claves a consultar (por defecto, todas las activas); las
+                  inexistentes aparecen con el contador a 0
+
+        Returns:
+            dict {clave: {"blink_count", "last_blink_at", "blink_rate"}}
+        """
+        now = time.time() if now is None else now
+        if keys is None:
+            records = await self.counters.aitems()
+            return {key: _record_to_dict(record, now, self.rate_window) for key, record in records.items()}
+
+        keys = list(keys)
+        records = await self.counters.aget_many(keys)
+        return {key: _record_to_dict(records.get(key), now, self.rate_window) for key in keys}
+
+    async def subscribe(self, key: str = DEFAULT_KEY) -> BlinkCountSubscription:
+        """
+        Registra un suscriptor a los cambios del contador de una clave.
+
+        Returns:
+            BlinkCountSubscription (cerrarla con close() al terminar)
+        """
+        if key not in self._subscribers:
+            # Valor de partida leído antes de registrarse: un cambio durante la
+            # lectura se detecta en la siguiente consulta
+            baseline = await self.get(key)
+            self._known.setdefault(key, baseline)
+        subscription = BlinkCountSubscription(self, key)
+        self._subscribers.setdefault(key, set()).add(subscription)
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription: BlinkCountSubscription) -> None:
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
+                self._known.pop(subscription.key, None)
 
-_blink_count: int = 0
+    def get_subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
 
+    def _notify(self, key: str, count: Optional[int] = None) -> None:
+        # El valor ya avisado no se vuelve a avisar en la siguiente consulta
+        if count is not None and key in self._known:
+            self._known[key] = count
+        for subscription in self._subscribers.get(key, ()):
+            subscription.notify()
 
-def increment_blink_count() -> int:
+    async def _poll(self) -> None:
+        """
+        Detecta los cambios hechos por otros procesos y los contadores
+        descartados por el backend (caducados o sobrantes, que pasan a 0): una
+        consulta por ronda para todas las claves con suscriptores en este proceso.
+        """
+        try:
+            while self._subscribers:
+                await asyncio.sleep(self.poll_interval)
+                keys = list(self._subscribers)
+                try:
+                    records = await self.counters.aget_many(keys)
+                except Exception as e:
+                    print(f"[BlinkCounter] ⚠️ Error al consultar los contadores: {e}")
+                    continue
+                for key in keys:
+                    record = records.get(key)
+                    count = int(record[_COUNT]) if record is not None else 0
+                    if key in self._known and self._known[key] != count:
+                        self._notify(key, count)
+        finally:
+            self._poller = None
+
+
+# Instancia global (lazy)
+_store: Optional[BlinkCounterStore] = None
+
+
+def get_blink_counter_store() -> BlinkCounterStore:
+    """
+    Obtiene la instancia global de los contadores de parpadeos (se crea en el primer uso).
+    """
+    global _store
+    if _store is None:
+        backend = get_state_backend()
+        _store = BlinkCounterStore(
+            backend.namespace(
+                "blink_counts",
+                ttl=settings.blink_counter_ttl,
+                max_keys=settings.blink_counter_max_keys
+            ),
+            rate_window=settings.blink_rate_window,
+            poll_interval=settings.state_poll_interval
+        )
+    return _store
+
+
+async def increment_blink_count(key: str = DEFAULT_KEY) -> int:
     """
-    Incrementa el contador global de parpadeos en 1.
-    
+    Incrementa en 1 el contador de parpadeos de una sesión.
+
+    Args:
+        key: Clave de la sesión (por defecto, el contador compartido)
+
     Returns:
         int: El nuevo valor del contador después del incremento
     """
-    global _blink_count
-    _blink_count += 1
-    return _blink_count
+    return await get_blink_counter_store().increment(key)
 
 
-def reset_blink_count() -> None:
+async def reset_blink_count(key: str = DEFAULT_KEY) -> None:
     """
-    Resetea el contador global de parpadeos a 0.
+    Resetea a 0 el contador de parpadeos de una sesión.
+
+    Args:
+        key: Clave de la sesión (por defecto, el contador compartido)
     """
-    global _blink_count
-    _blink_count = 0
+    await get_blink_counter_store().reset(key)
 
 
-def get_blink_count() -> int:
+async def get_blink_count(key: str = DEFAULT_KEY) -> int:
     """
-    Obtiene el valor actual del contador global de parpadeos.
-    
+    Obtiene el valor actual del contador de parpadeos de una sesión.
+
+    Args:
+        key: Clave de la sesión (por defecto, el contador compartido)
+
     Returns:
         int: El valor actual del contador
     """
-    return _blink_count
-
+    return await get_blink_counter_store().get(key)
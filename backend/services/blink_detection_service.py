@@ -1,9 +1,19 @@
-import cv2
+from typing import Any, Optional
+
 import mediapipe as mp
 import numpy as np
 
 from core.config import settings
 from models.schemas import BlinkDetectionResponse
+from services.landmark_features import (
+    LEFT_EYE_INDICES,
+    RIGHT_EYE_INDICES,
+    blink_from_ears,
+    eye_aspect_ratios,
+    landmarks_to_array,
+    to_pixels,
+)
+from utils.image_utils import bgr_to_rgb
 
 
 class BlinkDetectionService:
@@ -17,30 +27,52 @@ class BlinkDetectionService:
     # Ojo izquierdo (desde la perspectiva de la persona)
     # MediaPipe índices: 33 (arriba), 7 (esq_sup_izq), 163 (esq_sup_der), 
     #                    144 (abajo), 153 (esq_inf_izq), 158 (esq_inf_der)
-    LEFT_EYE_INDICES = [33, 7, 163, 144, 153, 158]
+    LEFT_EYE_INDICES = list(LEFT_EYE_INDICES)
     # Ojo derecho (desde la perspectiva de la persona)
     # MediaPipe índices: 362 (arriba), 382 (esq_sup_izq), 381 (esq_sup_der),
     #                    380 (abajo), 374 (esq_inf_izq), 390 (esq_inf_der)
-    RIGHT_EYE_INDICES = [362, 382, 381, 380, 374, 390]
+    RIGHT_EYE_INDICES = list(RIGHT_EYE_INDICES)
     
-    def __init__(self, static_image_mode: bool = True, max_num_faces: int = 1):
+    def __init__(
+        self,
+        static_image_mode: bool = True,
+        max_num_faces: int = 1,
+        min_detection_confidence: Optional[float] = None,
+        min_tracking_confidence: Optional[float] = None,
+        ear_threshold: Optional[float] = None
+    ):
         """
         Inicializa el servicio de detección de parpadeos usando MediaPipe Face Mesh.
         
         Args:
             static_image_mode: Si True, procesa imágenes estáticas. Si False, procesa video.
             max_num_faces: Número máximo de rostros a detectar
+            min_detection_confidence: Confianza mínima de detección (por defecto, la de la configuración)
+            min_tracking_confidence: Confianza mínima de seguimiento (por defecto, la de la configuración)
+            ear_threshold: Umbral EAR (por defecto, el de la configuración)
         """
+        if min_detection_confidence is None:
+            min_detection_confidence = settings.face_mesh_min_detection_confidence
+        if min_tracking_confidence is None:
+            min_tracking_confidence = settings.face_mesh_min_tracking_confidence
         mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = mp_face_mesh.FaceMesh(
             static_image_mode=static_image_mode,
             max_num_faces=max_num_faces,
             refine_landmarks=True,
-            min_detection_confidence=settings.face_mesh_min_detection_confidence,
-            min_tracking_confidence=settings.face_mesh_min_tracking_confidence
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
         )
-        self.ear_threshold = settings.ear_threshold
+        self.ear_threshold = settings.ear_threshold if ear_threshold is None else ear_threshold
+        self._rgb_buffer = None
+        self._points_buffer = None
     
+    def reset(self) -> None:
+        """
+        Reinicia el grafo de Face Mesh: en modo video olvida el rostro que estaba
+        siguiendo (por ejemplo, antes de reutilizar la instancia en otra sesión).
+        """
+        self.face_mesh.reset()
     
     def detect_blink(self, img: np.ndarray) -> BlinkDetectionResponse:
         """
@@ -54,14 +86,10 @@ class BlinkDetectionService:
         """
         try:
             print(f"[BlinkDetection] Procesando imagen...")
-            # Convertir BGR a RGB (MediaPipe usa RGB)
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # Procesar con Face Mesh
-            results = self.face_mesh.process(img_rgb)
+            face_landmarks = self.detect_landmarks(img)
             
             # Verificar si se detectó algún rostro
-            if not results.multi_face_landmarks or len(results.multi_face_landmarks) == 0:
+            if face_landmarks is None:
                 # No se detectó rostro, retornar valores por defecto
                 print("[BlinkDetection] ❌ No se detectaron landmarks faciales")
                 return BlinkDetectionResponse(
@@ -70,28 +98,9 @@ class BlinkDetectionService:
                     right_ear=0.0
                 )
             
-            # Obtener el primer rostro detectado
-            face_landmarks = results.multi_face_landmarks[0]
-            
-            # Calcular EAR para cada ojo
-            left_ear = self._calculate_ear_from_landmarks(
-                face_landmarks, self.LEFT_EYE_INDICES, img.shape
-            )
-            right_ear = self._calculate_ear_from_landmarks(
-                face_landmarks, self.RIGHT_EYE_INDICES, img.shape
-            )
-            
-            # Determinar si hay parpadeo (EAR promedio menor al umbral)
-            avg_ear = (left_ear + right_ear) / 2.0
-            blinking = avg_ear < self.ear_threshold
-            
-            print(f"[BlinkDetection] EAR: L={left_ear:.3f} R={right_ear:.3f} | Parpadeando: {blinking}")
-            
-            return BlinkDetectionResponse(
-                blinking=blinking,
-                left_ear=left_ear,
-                right_ear=right_ear
-            )
+            result = self.evaluate_landmarks(face_landmarks, img.shape)
+            print(f"[BlinkDetection] EAR: L={result.left_ear:.3f} R={result.right_ear:.3f} | Parpadeando: {result.blinking}")
+            return result
             
         except Exception as e:
             # En caso de error, retornar valores por defecto
@@ -102,65 +111,53 @@ class BlinkDetectionService:
                 right_ear=0.0
             )
     
-    def _calculate_ear_from_landmarks(
-        self, 
-        face_landmarks: any, 
-        eye_indices: list, 
-        img_shape: tuple
-    ) -> float:
+    def detect_landmarks(self, img: np.ndarray) -> Optional[Any]:
         """
-        Calcula EAR desde los landmarks de MediaPipe.
-        
-        EAR = (|p2-p6| + |p3-p5|) / (2 * |p1-p4|)
-        
-        Los índices en eye_indices están ordenados como: [p1, p2, p3, p4, p5, p6]
-        donde:
-        - p1: punto superior del ojo (arriba)
-        - p2: esquina superior izquierda
-        - p3: esquina superior derecha
-        - p4: punto inferior del ojo (abajo)
-        - p5: esquina inferior izquierda
-        - p6: esquina inferior derecha
+        Ejecuta Face Mesh sobre una imagen.
         
         Args:
-            face_landmarks: Objeto de landmarks de MediaPipe
-            eye_indices: Lista de 6 índices de landmarks para el ojo [p1, p2, p3, p4, p5, p6]
-            img_shape: Tupla (height, width) de la imagen
+            img: Imagen en formato numpy array (OpenCV BGR)
             
         Returns:
-            float: Valor EAR calculado
+            Landmarks del primer rostro detectado o None si no hay rostro
         """
-        h, w = img_shape[:2]
-        
-        # Obtener coordenadas de los 6 puntos del ojo
-        points = []
-        for idx in eye_indices:
-            landmark = face_landmarks.landmark[idx]
-            # MediaPipe retorna coordenadas normalizadas (0-1)
-            x = landmark.x * w
-            y = landmark.y * h
-            points.append(np.array([x, y]))
+        # Convertir BGR a RGB (MediaPipe usa RGB) reutilizando el buffer del frame anterior
+        img_rgb = self._rgb_buffer = bgr_to_rgb(img, self._rgb_buffer)
         
-        # EAR = (|p2-p6| + |p3-p5|) / (2 * |p1-p4|)
-        # p1 = points[0] (arriba)
-        # p2 = points[1] (esquina sup izq)
-        # p3 = points[2] (esquina sup der)
-        # p4 = points[3] (abajo)
-        # p5 = points[4] (esquina inf izq)
-        # p6 = points[5] (esquina inf der)
+        # Procesar con Face Mesh
+        results = self.face_mesh.process(img_rgb)
+        if not results.multi_face_landmarks:
+            return None
         
-        # Distancia vertical: entre p1 (arriba) y p4 (abajo)
-        vertical_dist = np.linalg.norm(points[0] - points[3])
-        
-        # Distancia horizontal superior: entre p2 y p6
-        horizontal_dist_1 = np.linalg.norm(points[1] - points[5])
+        # Obtener el primer rostro detectado
+        return results.multi_face_landmarks[0]
+    
+    def evaluate_landmarks(self, face_landmarks: Any, img_shape: tuple) -> BlinkDetectionResponse:
+        """
+        Calcula el EAR de ambos ojos y determina si hay parpadeo.
         
-        # Distancia horizontal inferior: entre p3 y p5
-        horizontal_dist_2 = np.linalg.norm(points[2] - points[4])
+        Args:
+            face_landmarks: Landmarks de MediaPipe (normalizados respecto a la imagen procesada)
+            img_shape: Forma (height, width) de la imagen procesada
+            
+        Returns:
+            BlinkDetectionResponse con información sobre el parpadeo
+        """
+        # Convertir los landmarks a un único array contiguo (reutilizando el del frame anterior)
+        self._points_buffer = landmarks_to_array(face_landmarks, self._points_buffer)
+        return self.evaluate_points(to_pixels(self._points_buffer, img_shape))
+    
+    def evaluate_points(self, points: np.ndarray) -> BlinkDetectionResponse:
+        """
+        Calcula el EAR de ambos ojos (de forma vectorizada) y determina si hay parpadeo.
         
-        # Calcular EAR
-        if vertical_dist == 0:
-            return 0.0
+        Args:
+            points: Array (N, 2|3) de landmarks de Face Mesh en píxeles
+            
+        Returns:
+            BlinkDetectionResponse con información sobre el parpadeo
+        """
+        left_ear, right_ear = (float(ear) for ear in eye_aspect_ratios(points))
         
-        ear = (horizontal_dist_1 + horizontal_dist_2) / (2.0 * vertical_dist)
-        return float(ear)
+        # Determinar si hay parpadeo (EAR promedio menor al umbral)
+        return blink_from_ears(left_ear, right_ear, self.ear_threshold)
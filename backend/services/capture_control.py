@@ -0,0 +1,101 @@
+"""
+Control adaptativo de la captura de los clientes de /ws/detect/blink.
+
+El servidor indica a cada cliente a qué ritmo, resolución y calidad JPEG debe
+capturar, según la latencia de inferencia medida, el número de sesiones activas
+y el estado de la sesión (ojos abiertos de forma estable o cerca del umbral).
+"""
+import time
+from typing import Optional
+
+from core.config import settings
+
+
+# Escalones de degradación: (lado mayor en px, calidad JPEG)
+_CAPTURE_LEVELS = (
+    (640, 0.8),
+    (480, 0.7),
+    (320, 0.6),
+)
+
+
+class CaptureController:
+    """
+    Calcula los parámetros de captura de una conexión y decide cuándo enviarlos.
+
+    El presupuesto de frames por segundo de cada sesión se reparte a partes iguales
+    entre las sesiones activas a partir de la capacidad estimada de los trabajadores
+    (número de trabajadores / latencia media). Si el presupuesto no alcanza el ritmo
+    deseado, además de bajar los fps se reduce la resolución y la calidad.
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        Args:
+            enabled: Si el cliente acepta mensajes de control
+        """
+        self.enabled = enabled
+        self._current: Optional[dict] = None
+        self._last_sent = 0.0
+        self._active_until = 0.0
+
+    def update(
+        self,
+        latency: float,
+        workers: int,
+        active_sessions: int,
+        left_ear: float,
+        right_ear: float,
+        blinking: bool
+    ) -> Optional[dict]:
+        """
+        Actualiza el estado de la sesión con el último resultado.
+
+        Args:
+            latency: Latencia media de inferencia en segundos (0 = sin medidas)
+            workers: Número de procesos de inferencia
+            active_sessions: Número de conexiones activas
+            left_ear: EAR del ojo izquierdo del último frame
+            right_ear: EAR del ojo derecho del último frame
+            blinking: Si el último frame es un parpadeo
+
+        Returns:
+            Mensaje de control a enviar al cliente o None si no hay cambios
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+
+        # Cerca del umbral (o parpadeando) se captura a ritmo completo durante un tiempo
+        threshold = settings.ear_threshold
+        detected = left_ear > 0.0 or right_ear > 0.0
+        near = detected and (
+            abs(left_ear - threshold) <= threshold * settings.capture_threshold_margin
+            or abs(right_ear - threshold) <= threshold * settings.capture_threshold_margin
+        )
+        if blinking or near:
+            self._active_until = now + settings.capture_active_hold
+        desired = settings.capture_max_fps if now < self._active_until else settings.capture_idle_fps
+
+        # Capacidad de los trabajadores repartida entre las sesiones activas
+        budget = float(desired)
+        if latency > 0.0:
+            capacity = max(1, workers) / latency * settings.capture_target_utilization
+            budget = capacity / max(1, active_sessions)
+
+        fps = int(max(settings.capture_min_fps, min(desired, budget)))
+        ratio = budget / desired
+        level = 0 if ratio >= 1.0 else 1 if ratio >= 0.5 else 2
+        max_side, quality = _CAPTURE_LEVELS[level]
+
+        control = {"type": "control", "fps": fps, "max_side": max_side, "quality": quality}
+        if control == self._current:
+            return None
+        # Limitar la frecuencia de los cambios, salvo el primer mensaje
+        if self._current is not None and now - self._last_sent < settings.capture_control_interval:
+            return None
+
+        self._current = control
+        self._last_sent = now
+        return control
@@ -0,0 +1,196 @@
+"""
+Seguimiento de identidades y estado por rostro para el modo aula.
+
+Una sola cámara enfoca a toda la clase; cada rostro detectado se asocia a una
+identidad estable entre frames mediante un seguidor barato de IoU con respaldo
+por distancia entre centroides, y cada identidad acumula su propio estado de
+parpadeo y atención.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from models.schemas import AttentionAnalysisResponse
+
+
+# Distancia máxima entre centroides (fracción del tamaño del rostro) para asociar sin solapamiento
+_CENTROID_MATCH_RATIO = 0.5
+
+
+class ClassroomFace:
+    """
+    Identidad de un rostro del aula y su estado acumulado.
+    """
+
+    __slots__ = (
+        "face_id", "box", "missed", "blinking", "blink_count", "left_ear", "right_ear",
+        "attentive", "frames", "attentive_frames"
+    )
+
+    def __init__(self, face_id: int, box: Tuple[int, int, int, int]):
+        self.face_id = face_id
+        self.box = box
+        self.missed = 0
+        self.blinking = False
+        self.blink_count = 0
+        self.left_ear = 0.0
+        self.right_ear = 0.0
+        self.attentive = False
+        self.frames = 0
+        self.attentive_frames = 0
+
+    def observe(self, analysis: AttentionAnalysisResponse) -> None:
+        """
+        Actualiza el estado con la detección del frame actual.
+
+        Un parpadeo se cuenta al pasar de ojos abiertos a cerrados. El rostro se
+        considera atento si mira aproximadamente al frente (yaw y pitch acotados).
+        """
+        coordinates = analysis.coordinates
+        self.box = (coordinates.x, coordinates.y, coordinates.w, coordinates.h)
+        self.missed = 0
+        if analysis.blinking and not self.blinking:
+            self.blink_count += 1
+        self.blinking = analysis.blinking
+        self.left_ear = analysis.left_ear
+        self.right_ear = analysis.right_ear
+
+        features = analysis.features
+        self.attentive = features is not None and (
+            abs(features.yaw) <= settings.classroom_max_yaw
+            and abs(features.pitch) <= settings.classroom_max_pitch
+        )
+        self.frames += 1
+        if self.attentive:
+            self.attentive_frames += 1
+
+    def to_dict(self) -> dict:
+        x, y, w, h = self.box
+        return {
+            "id": self.face_id,
+            "coordinates": {"x": x, "y": y, "w": w, "h": h},
+            "blinking": self.blinking,
+            "left_ear": self.left_ear,
+            "right_ear": self.right_ear,
+            "blink_count": self.blink_count,
+            "attentive": self.attentive,
+            "attention_ratio": self.attentive_frames / self.frames if self.frames else 0.0
+        }
+
+
+def _iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU entre cada par de cajas (x, y, w, h) de dos arrays (A, 4) y (B, 4)."""
+    a0 = boxes_a[:, None, :2]
+    a1 = a0 + boxes_a[:, None, 2:]
+    b0 = boxes_b[None, :, :2]
+    b1 = b0 + boxes_b[None, :, 2:]
+    overlap = np.clip(np.minimum(a1, b1) - np.maximum(a0, b0), 0, None).prod(axis=-1)
+    union = boxes_a[:, None, 2:].prod(axis=-1) + boxes_b[None, :, 2:].prod(axis=-1) - overlap
+    return np.where(union > 0, overlap / np.maximum(union, 1e-9), 0.0)
+
+
+class ClassroomTracker:
+    """
+    Asigna identidades persistentes a los rostros detectados en cada frame.
+
+    La asociación es voraz: primero por IoU (de mayor a menor) y, para los rostros
+    que quedan sin pareja, por cercanía de centroides. Las identidades que no se
+    ven durante max_missed frames se olvidan.
+    """
+
+    def __init__(self, iou_threshold: Optional[float] = None, max_missed: Optional[int] = None):
+        """
+        Args:
+            iou_threshold: IoU mínimo para asociar un rostro a una identidad
+            max_missed: Frames sin ver un rostro antes de olvidar su identidad
+        """
+        self.iou_threshold = settings.classroom_iou_threshold if iou_threshold is None else iou_threshold
+        self.max_missed = settings.classroom_max_missed if max_missed is None else max_missed
+        self.faces: Dict[int, ClassroomFace] = {}
+        self._next_id = 1
+
+    def update(self, detections: List[AttentionAnalysisResponse]) -> List[ClassroomFace]:
+        """
+        Asocia las detecciones de un frame a las identidades conocidas.
+
+        Args:
+            detections: Rostros detectados en el frame (con coordinates)
+
+        Returns:
+            Lista de identidades visibles en el frame
+        """
+        detections = [d for d in detections if d.coordinates is not None]
+        tracks = list(self.faces.values())
+        matches = self._match(tracks, detections)
+
+        visible = []
+        matched_detections = set()
+        for track_index, detection_index in matches:
+            face = tracks[track_index]
+            face.observe(detections[detection_index])
+            matched_detections.add(detection_index)
+            visible.append(face)
+
+        # Identidades no vistas en este frame
+        seen = {face.face_id for face in visible}
+        for face in tracks:
+            if face.face_id not in seen:
+                face.missed += 1
+                if face.missed > self.max_missed:
+                    del self.faces[face.face_id]
+
+        # Rostros nuevos
+        for index, detection in enumerate(detections):
+            if index in matched_detections:
+                continue
+            c = detection.coordinates
+            face = ClassroomFace(self._next_id, (c.x, c.y, c.w, c.h))
+            self._next_id += 1
+            face.observe(detection)
+            self.faces[face.face_id] = face
+            visible.append(face)
+
+        return visible
+
+    def _match(self, tracks: List[ClassroomFace], detections: List[AttentionAnalysisResponse]) -> List[Tuple[int, int]]:
+        """Empareja identidades y detecciones; devuelve pares (índice_identidad, índice_detección)."""
+        if not tracks or not detections:
+            return []
+
+        track_boxes = np.array([face.box for face in tracks], dtype=np.float64)
+        detection_boxes = np.array(
+            [(d.coordinates.x, d.coordinates.y, d.coordinates.w, d.coordinates.h) for d in detections],
+            dtype=np.float64
+        )
+
+        matches = []
+        used_tracks = set()
+        used_detections = set()
+
+        # Asociación por IoU
+        iou = _iou_matrix(track_boxes, detection_boxes)
+        for flat in np.argsort(-iou, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if iou[t, d] < self.iou_threshold:
+                break
+            if t in used_tracks or d in used_detections:
+                continue
+            matches.append((t, d))
+            used_tracks.add(t)
+            used_detections.add(d)
+
+        # Respaldo por distancia entre centroides (movimientos rápidos o rostros pequeños)
+        track_centers = track_boxes[:, :2] + track_boxes[:, 2:] / 2.0
+        detection_centers = detection_boxes[:, :2] + detection_boxes[:, 2:] / 2.0
+        distance = np.linalg.norm(track_centers[:, None, :] - detection_centers[None, :, :], axis=-1)
+        limit = track_boxes[:, 2:].max(axis=1)[:, None] * _CENTROID_MATCH_RATIO
+        for flat in np.argsort(distance, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if t in used_tracks or d in used_detections or distance[t, d] > limit[t, 0]:
+                continue
+            matches.append((t, d))
+            used_tracks.add(t)
+            used_detections.add(d)
+
+        return matches
@@ -1,8 +1,10 @@
-import cv2
+from typing import List, Optional, Tuple
+
 import mediapipe as mp
 import numpy as np
 
 from models.schemas import Coordinates, FaceDetectionResponse
+from utils.image_utils import bgr_to_rgb
 
 
 class FaceDetectionService:
@@ -19,6 +21,7 @@ class FaceDetectionService:
             model_selection=model_selection,
             min_detection_confidence=min_detection_confidence
         )
+        self._rgb_buffer = None
 
     def detect_face(self, img: np.ndarray) -> FaceDetectionResponse:
         """
@@ -33,36 +36,18 @@ class FaceDetectionService:
         try:
             print(f"[FaceDetection] Procesando imagen de tamaño: {img.shape if img is not None else 'None'}")
             
-            # Convertir BGR a RGB (MediaPipe usa RGB)
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-            # Detectar rostros
-            results = self.face_detection.process(img_rgb)
+            face = self.locate_face(img)
             
-            print(f"[FaceDetection] Detecciones: {len(results.detections) if results.detections else 0}")
-
             # Verificar si se detectó algún rostro
-            if results.detections and len(results.detections) > 0:
-                # Obtener el primer rostro detectado (el más confiable)
-                detection = results.detections[0]
-                confidence = detection.score[0]
-
-                # Obtener bounding box (MediaPipe retorna coordenadas normalizadas 0-1)
-                bbox = detection.location_data.relative_bounding_box
-                h, w = img.shape[:2]
-
-                # Convertir coordenadas normalizadas a píxeles
-                x = int(bbox.xmin * w)
-                y = int(bbox.ymin * h)
-                width = int(bbox.width * w)
-                height = int(bbox.height * h)
+            if face is not None:
+                x, y, width, height, confidence = face
                 
                 print(f"[FaceDetection] ✅ Rostro detectado con confianza: {confidence:.2f}")
 
                 return FaceDetectionResponse(
                     detected=True,
                     coordinates=Coordinates(x=x, y=y, w=width, h=height),
-                    confidence=float(confidence),
+                    confidence=confidence,
                 )
             else:
                 # No se detectó ningún rostro
@@ -78,3 +63,53 @@ class FaceDetectionService:
                 detected=False, coordinates=None, confidence=0.0
             )
 
+    def locate_face(self, img: np.ndarray) -> Optional[Tuple[int, int, int, int, float]]:
+        """
+        Localiza el rostro más confiable de una imagen.
+        
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+            
+        Returns:
+            Tupla (x, y, w, h, confidence) en píxeles o None si no hay rostro
+        """
+        faces = self.locate_faces(img)
+
+        # Obtener el primer rostro detectado (el más confiable)
+        return faces[0] if faces else None
+
+    def locate_faces(self, img: np.ndarray) -> List[Tuple[int, int, int, int, float]]:
+        """
+        Localiza todos los rostros de una imagen.
+        
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+            
+        Returns:
+            Lista de tuplas (x, y, w, h, confidence) en píxeles, de mayor a menor confianza
+        """
+        # Convertir BGR a RGB (MediaPipe usa RGB) reutilizando el buffer del frame anterior
+        img_rgb = self._rgb_buffer = bgr_to_rgb(img, self._rgb_buffer)
+
+        # Detectar rostros
+        results = self.face_detection.process(img_rgb)
+        if not results.detections:
+            return []
+
+        h, w = img.shape[:2]
+        faces = []
+        for detection in results.detections:
+            # Obtener bounding box (MediaPipe retorna coordenadas normalizadas 0-1)
+            bbox = detection.location_data.relative_bounding_box
+
+            # Convertir coordenadas normalizadas a píxeles
+            faces.append((
+                int(bbox.xmin * w),
+                int(bbox.ymin * h),
+                int(bbox.width * w),
+                int(bbox.height * h),
+                float(detection.score[0]),
+            ))
+        # MediaPipe no garantiza el orden; los llamadores (p. ej. ClassroomTracker) dependen de él
+        faces.sort(key=lambda face: face[4], reverse=True)
+        return faces
@@ -0,0 +1,86 @@
+"""
+Detección de frames casi idénticos para omitir inferencias redundantes.
+
+Cuando el estudiante está quieto, frames consecutivos de la webcam son
+prácticamente iguales y repetir Face Mesh sobre ellos no aporta información.
+"""
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+# Ancho (en celdas) de la miniatura usada para comparar frames
+_THUMBNAIL_WIDTH = 32
+
+
+class FrameSimilarityFilter:
+    """
+    Compara cada frame con el último frame procesado mediante una miniatura en
+    escala de grises: cada celda de la miniatura es la media de una región del
+    frame, y dos frames se consideran casi idénticos si ninguna celda difiere
+    más de la tolerancia. Usar el máximo por celda (y no la media global) evita
+    pasar por alto cambios pequeños pero relevantes, como el cierre de los ojos.
+
+    La comparación se hace contra el último frame procesado (no contra el
+    anterior), de modo que una deriva lenta acaba forzando una nueva inferencia.
+    """
+
+    def __init__(self, tolerance: float = 4.0, max_reuse: int = 15):
+        """
+        Args:
+            tolerance: Diferencia máxima por celda, en niveles de gris (0 = desactivado)
+            max_reuse: Máximo de frames consecutivos que pueden reutilizar un resultado
+        """
+        self.tolerance = tolerance
+        self.max_reuse = max_reuse
+        self._reference: Optional[np.ndarray] = None
+        self._reuse_streak = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def is_duplicate(self, img: np.ndarray) -> bool:
+        """
+        Indica si el frame es casi idéntico al último frame procesado.
+
+        Si no lo es, el frame pasa a ser la nueva referencia.
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+
+        Returns:
+            bool: True si puede reutilizarse el resultado anterior
+        """
+        self.checked += 1
+        if self.tolerance <= 0:
+            return False
+
+        height, width = img.shape[:2]
+        thumb_height = max(1, round(height * _THUMBNAIL_WIDTH / width))
+        small = cv2.resize(img, (_THUMBNAIL_WIDTH, thumb_height), interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+        reference = self._reference
+        if (
+            reference is not None
+            and reference.shape == thumbnail.shape
+            and self._reuse_streak < self.max_reuse
+            and int(np.abs(thumbnail - reference).max()) <= self.tolerance
+        ):
+            self._reuse_streak += 1
+            self.skipped += 1
+            return True
+
+        self._reference = thumbnail
+        self._reuse_streak = 0
+        return False
+
+    def reset(self) -> None:
+        """Olvida la referencia (por ejemplo, si la inferencia del frame falló)."""
+        self._reference = None
+        self._reuse_streak = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        """Fracción de frames comprobados cuyo resultado se reutilizó."""
+        return self.skipped / self.checked if self.checked else 0.0
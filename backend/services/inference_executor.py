@@ -0,0 +1,623 @@
+"""
+Ejecutor de inferencia basado en un pool de procesos trabajadores.
+
+Cada proceso mantiene sus propios grafos de MediaPipe (Face Detection y Face Mesh)
+y recibe los frames a través de memoria compartida, por lo que la inferencia no
+bloquea el loop de asyncio del servidor. Los resultados se entregan como futuros
+awaitables.
+"""
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from models.schemas import AttentionAnalysisResponse, BlinkDetectionResponse, FaceDetectionResponse
+
+
+# Número máximo de segmentos de memoria compartida que cada trabajador mantiene abiertos
+_WORKER_ATTACH_CACHE_SIZE = 16
+
+# Número máximo de segmentos libres que el proceso principal conserva para reutilizar
+_MAX_FREE_SEGMENTS = 32
+
+# Peso de cada nueva medida en la media móvil exponencial de la latencia de inferencia
+_LATENCY_EWMA_ALPHA = 0.1
+
+# Segundos entre dos comprobaciones de que los trabajadores siguen vivos
+_WORKER_CHECK_INTERVAL = 0.5
+
+
+class _WorkerState:
+    """
+    Estado propio de cada proceso trabajador: servicios de MediaPipe y segmentos adjuntos.
+    """
+
+    def __init__(self):
+        self._face_detection_service = None
+        self._attention_pipeline = None
+        self._attention_pipeline_pool = None
+        self._classroom_analyzer = None
+        self._attached: "OrderedDict[str, shared_memory.SharedMemory]" = OrderedDict()
+
+    def face_detection_service(self):
+        if self._face_detection_service is None:
+            from services.face_detection_service import FaceDetectionService
+            self._face_detection_service = FaceDetectionService(
+                model_selection=settings.face_detection_model_selection,
+                min_detection_confidence=settings.face_detection_min_confidence
+            )
+        return self._face_detection_service
+
+    def attention_pipeline(self):
+        """Pipeline sin estado entre frames (Face Mesh estático) para peticiones sueltas."""
+        if self._attention_pipeline is None:
+            from services.attention_pipeline import AttentionPipeline
+            from services.blink_detection_service import BlinkDetectionService
+            self._attention_pipeline = AttentionPipeline(
+                self.face_detection_service(),
+                BlinkDetectionService(static_image_mode=True, max_num_faces=1),
+                reuse_roi=False
+            )
+        return self._attention_pipeline
+
+    def attention_pipeline_pool(self):
+        """Pool de pipelines en modo streaming para las sesiones."""
+        if self._attention_pipeline_pool is None:
+            from services.attention_pipeline import AttentionPipelinePool
+            self._attention_pipeline_pool = AttentionPipelinePool(
+                self.face_detection_service(),
+                max_idle=settings.face_mesh_pool_size
+            )
+        return self._attention_pipeline_pool
+
+    def pipeline_for(self, session_id: Optional[str]):
+        if session_id is not None:
+            # Sesión de streaming: pipeline propio con seguimiento y ROI entre frames
+            return self.attention_pipeline_pool().checkout(session_id)
+        return self.attention_pipeline()
+
+    def classroom_analyzer(self):
+        """Analizador multi-rostro del modo aula (sin estado entre frames)."""
+        if self._classroom_analyzer is None:
+            from services.attention_pipeline import MultiFaceAnalyzer
+            self._classroom_analyzer = MultiFaceAnalyzer()
+        return self._classroom_analyzer
+
+    def attach(self, name: str) -> shared_memory.SharedMemory:
+        """Adjunta (o reutiliza) un segmento de memoria compartida creado por el proceso principal."""
+        shm = self._attached.get(name)
+        if shm is not None:
+            self._attached.move_to_end(name)
+            return shm
+
+        shm = shared_memory.SharedMemory(name=name)
+        self._attached[name] = shm
+        while len(self._attached) > _WORKER_ATTACH_CACHE_SIZE:
+            _, oldest = self._attached.popitem(last=False)
+            oldest.close()
+        return shm
+
+    def run(self, task: str, img: Optional[np.ndarray], session_id: Optional[str], kwargs: Dict[str, Any]) -> Any:
+        if task == "face":
+            return self.face_detection_service().detect_face(img)
+        if task == "blink":
+            return self.pipeline_for(session_id).process(img).to_blink_response()
+        if task == "analyze":
+            analysis = self.pipeline_for(session_id).process(img)
+            return analysis.to_analysis_response(kwargs.get("scale", 1.0))
+        if task == "classroom":
+            scale = kwargs.get("scale", 1.0)
+            return [
+                analysis.to_analysis_response(scale)
+                for analysis in self.classroom_analyzer().process(img)
+            ]
+        if task == "video_segment":
+            from services.video_analysis_service import analyze_video_segment
+            # Pipeline en modo streaming: los frames de un segmento son consecutivos
+            pool = self.attention_pipeline_pool()
+            segment_id = f"video-segment:{kwargs['path']}:{kwargs['start_second']}"
+            pipeline = pool.checkout(segment_id)
+            try:
+                return analyze_video_segment(
+                    kwargs["path"],
+                    kwargs["start_second"],
+                    kwargs["end_second"],
+                    kwargs["sample_fps"],
+                    pipeline,
+                    target_side=settings.frame_decode_target_side
+                )
+            finally:
+                pool.release(segment_id)
+        if task == "release":
+            if self._attention_pipeline_pool is not None:
+                self._attention_pipeline_pool.release(session_id)
+            return None
+        raise ValueError(f"Tarea de inferencia desconocida: {task}")
+
+    def close(self) -> None:
+        for shm in self._attached.values():
+            shm.close()
+        self._attached.clear()
+
+
+def _drain_cancelled(cancels: "mp.Queue", cancelled: set) -> None:
+    """Añade a cancelled los identificadores de trabajo cancelados recibidos hasta ahora."""
+    try:
+        while True:
+            cancelled.add(cancels.get_nowait())
+    except queue.Empty:
+        pass
+
+
+def _worker_main(jobs: "mp.Queue", cancels: "mp.Queue", results: "mp.Queue") -> None:
+    """
+    Bucle principal de un proceso trabajador.
+
+    Cada trabajo es una tupla (job_id, task, frame_ref, session_id, kwargs) donde
+    frame_ref es (nombre_segmento, shape, dtype) o None si la tarea no requiere imagen.
+    Los trabajos cuyo identificador llega por cancels (nadie espera ya su resultado)
+    se descartan sin procesarlos y se responden con (job_id, None, None).
+    """
+    # El proceso principal se encarga de detener a los trabajadores
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    state = _WorkerState()
+    cancelled: set = set()
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+
+            job_id, task, frame_ref, session_id, kwargs = job
+            _drain_cancelled(cancels, cancelled)
+            if cancelled:
+                skip = job_id in cancelled
+                # Los trabajos llegan en orden: las cancelaciones anteriores ya no sirven
+                cancelled = {cancelled_id for cancelled_id in cancelled if cancelled_id > job_id}
+                # Liberar una sesión no se descarta nunca (su pipeline debe volver al pool)
+                if skip and task != "release":
+                    results.put((job_id, None, None))
+                    continue
+
+            img = None
+            try:
+                if frame_ref is not None:
+                    name, shape, dtype = frame_ref
+                    shm = state.attach(name)
+                    img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                result = state.run(task, img, session_id, kwargs)
+                results.put((job_id, True, result))
+            except Exception as e:
+                results.put((job_id, False, f"{type(e).__name__}: {e}"))
+            finally:
+                # Liberar la vista sobre el segmento antes de que pueda cerrarse
+                del img
+    finally:
+        state.close()
+
+
+class _Worker:
+    """Proceso trabajador junto con su cola de trabajos y su carga actual."""
+
+    def __init__(self, ctx, results: "mp.Queue"):
+        self.jobs = ctx.Queue()
+        self.cancels = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.jobs, self.cancels, results),
+            daemon=True
+        )
+        self.pending: set = set()
+        self.sessions: set = set()
+        self.completed = 0
+
+    def start(self) -> None:
+        self.process.start()
+
+
+class InferenceExecutor:
+    """
+    Pool de procesos de inferencia con entrega de frames por memoria compartida.
+
+    Uso:
+        executor = get_inference_executor()
+        result = await executor.detect_blink(img)
+    """
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """
+        Args:
+            num_workers: Número de procesos trabajadores. Si es None o 0 se usa el número de núcleos.
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self._ctx = mp.get_context("spawn")
+        self._results: Optional["mp.Queue"] = None
+        self._workers: List[_Worker] = []
+        self._pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future, Optional[shared_memory.SharedMemory], _Worker, float, Optional[str]]] = {}
+        self._free_segments: List[shared_memory.SharedMemory] = []
+        self._affinity: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._listener: Optional[threading.Thread] = None
+        self._running = False
+        # Latencia media (s) de los trabajos con frame, suavizada exponencialmente
+        self.latency_ewma = 0.0
+
+    def start(self) -> None:
+        """Arranca los procesos trabajadores y el hilo que recoge los resultados."""
+        if self._running:
+            return
+        self._results = self._ctx.Queue()
+        self._workers = [self._spawn_worker() for _ in range(self.num_workers)]
+        self._running = True
+        self._listener = threading.Thread(
+            target=self._collect_results,
+            name="inference-results",
+            daemon=True
+        )
+        self._listener.start()
+        print(f"[InferenceExecutor] ✅ {self.num_workers} procesos de inferencia iniciados")
+
+    def shutdown(self) -> None:
+        """Detiene los trabajadores, cancela los trabajos pendientes y libera la memoria compartida."""
+        if not self._running:
+            return
+        self._running = False
+
+        for worker in self._workers:
+            try:
+                worker.jobs.put(None)
+            except Exception:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+
+        with self._lock:
+            pending = list(self._pending.keys())
+        for job_id in pending:
+            self._finish(job_id, False, "El ejecutor de inferencia se ha detenido")
+
+        with self._lock:
+            for shm in self._free_segments:
+                self._destroy_segment(shm)
+            self._free_segments.clear()
+        self._workers = []
+        self._affinity.clear()
+
+    async def submit(
+        self,
+        task: str,
+        img: Optional[np.ndarray] = None,
+        session_id: Optional[str] = None,
+        **kwargs: Any
+    ) -> Any:
+        """
+        Envía un trabajo a un proceso trabajador y espera su resultado.
+
+        Los trabajos con session_id se envían siempre al mismo trabajador, que
+        conserva el estado de seguimiento de esa sesión entre frames.
+
+        Args:
+            task: Nombre de la tarea ("face", "blink", "analyze", "classroom", "video_segment", "release")
+            img: Imagen en formato numpy array (OpenCV BGR) o None
+            session_id: Identificador de la sesión de streaming o None
+            **kwargs: Parámetros adicionales de la tarea
+
+        Si la espera se cancela (por ejemplo, al vencer el plazo del control de
+        admisión), se avisa al trabajador para que descarte el trabajo si aún no
+        lo ha empezado.
+
+        Returns:
+            Resultado devuelto por el trabajador
+
+        Raises:
+            RuntimeError: Si el trabajador no pudo procesar el frame
+        """
+        if not self._running:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job_id = next(self._job_ids)
+
+        shm = None
+        frame_ref = None
+        if img is not None:
+            img = np.ascontiguousarray(img)
+            shm = self._acquire_segment(img.nbytes)
+            np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+            frame_ref = (shm.name, img.shape, img.dtype.str)
+
+        with self._lock:
+            worker = self._pick_worker(session_id)
+            worker.pending.add(job_id)
+            self._pending[job_id] = (loop, future, shm, worker, time.perf_counter(), session_id)
+
+        worker.jobs.put((job_id, task, frame_ref, session_id, kwargs))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._cancel(job_id)
+            raise
+
+    async def detect_face(self, img: np.ndarray) -> FaceDetectionResponse:
+        """Ejecuta FaceDetectionService.detect_face en un proceso trabajador."""
+        return await self.submit("face", img)
+
+    async def detect_blink(self, img: np.ndarray, session_id: Optional[str] = None) -> BlinkDetectionResponse:
+        """
+        Ejecuta la detección de parpadeo en un proceso trabajador.
+
+        La detección pasa por la cascada detección facial -> Face Mesh sobre la ROI.
+        Sin session_id se usa el pipeline estático compartido del trabajador; con
+        session_id se usa un pipeline en modo streaming reservado para esa sesión.
+        """
+        return await self.submit("blink", img, session_id=session_id)
+
+    async def analyze(
+        self,
+        img: np.ndarray,
+        session_id: Optional[str] = None,
+        scale: float = 1.0
+    ) -> AttentionAnalysisResponse:
+        """
+        Ejecuta en una sola pasada la detección de rostro y de parpadeo.
+
+        La caja del rostro se obtiene de los landmarks de Face Mesh.
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+            session_id: Identificador de la sesión de streaming o None
+            scale: Factor para llevar la caja a la resolución original de la imagen
+        """
+        return await self.submit("analyze", img, session_id=session_id, scale=scale)
+
+    async def analyze_classroom(self, img: np.ndarray, scale: float = 1.0) -> List[AttentionAnalysisResponse]:
+        """
+        Analiza todos los rostros de un frame del aula.
+
+        El análisis no guarda estado entre frames (la identidad de cada rostro se
+        sigue en el proceso principal), por lo que cada frame va al trabajador
+        con menos carga.
+
+        Args:
+            img: Imagen en formato numpy array (OpenCV BGR)
+            scale: Factor para llevar las cajas a la resolución original de la imagen
+        """
+        return await self.submit("classroom", img, scale=scale)
+
+    async def release_session(self, session_id: str) -> None:
+        """
+        Libera los recursos de una sesión de streaming (su pipeline vuelve al pool).
+
+        Args:
+            session_id: Identificador de la sesión
+        """
+        if not self._running or session_id not in self._affinity:
+            return
+        try:
+            await self.submit("release", session_id=session_id)
+        except RuntimeError:
+            pass
+        finally:
+            with self._lock:
+                index = self._affinity.pop(session_id, None)
+                if index is not None and index < len(self._workers):
+                    self._workers[index].sessions.discard(session_id)
+
+    def get_pending_count(self, session_prefix: Optional[str] = None) -> int:
+        """
+        Obtiene el número de trabajos enviados que aún no tienen resultado.
+
+        Args:
+            session_prefix: Si se indica, solo cuenta los trabajos de sesiones cuyo
+                identificador empieza por este prefijo
+
+        Returns:
+            int: Número de trabajos pendientes
+        """
+        with self._lock:
+            if session_prefix is None:
+                return len(self._pending)
+            return sum(
+                1 for entry in self._pending.values()
+                if entry[5] is not None and entry[5].startswith(session_prefix)
+            )
+
+    def _cancel(self, job_id: int) -> None:
+        """
+        Avisa al trabajador de un trabajo cuyo resultado ya no se espera. El trabajo
+        sigue pendiente (y su segmento reservado) hasta que el trabajador responde.
+        """
+        with self._lock:
+            entry = self._pending.get(job_id)
+        if entry is None:
+            return
+        try:
+            entry[3].cancels.put(job_id)
+        except Exception:
+            pass
+
+    def _spawn_worker(self) -> _Worker:
+        worker = _Worker(self._ctx, self._results)
+        worker.start()
+        return worker
+
+    def _pick_worker(self, session_id: Optional[str] = None) -> _Worker:
+        """
+        Elige el trabajador para un trabajo (requiere self._lock).
+
+        Las sesiones quedan asignadas al trabajador que procesó su primer frame; los
+        trabajos sin sesión van al trabajador con menos carga.
+        """
+        if session_id is None:
+            return min(self._workers, key=lambda w: len(w.pending))
+
+        index = self._affinity.get(session_id)
+        if index is None:
+            index = min(
+                range(len(self._workers)),
+                key=lambda i: (len(self._workers[i].sessions), len(self._workers[i].pending))
+            )
+            self._affinity[session_id] = index
+            self._workers[index].sessions.add(session_id)
+        return self._workers[index]
+
+    def _acquire_segment(self, nbytes: int) -> shared_memory.SharedMemory:
+        """Obtiene un segmento libre con capacidad suficiente o crea uno nuevo."""
+        with self._lock:
+            for i, shm in enumerate(self._free_segments):
+                if shm.size >= nbytes:
+                    return self._free_segments.pop(i)
+        return shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+
+    def _release_segment(self, shm: shared_memory.SharedMemory) -> None:
+        """Devuelve un segmento al pool de libres (requiere self._lock)."""
+        if self._running and len(self._free_segments) < _MAX_FREE_SEGMENTS:
+            self._free_segments.append(shm)
+        else:
+            self._destroy_segment(shm)
+
+    @staticmethod
+    def _destroy_segment(shm: shared_memory.SharedMemory) -> None:
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception:
+            pass
+
+    def _finish(self, job_id: int, ok: Optional[bool], payload: Any) -> None:
+        """
+        Resuelve el futuro de un trabajo desde el hilo de resultados (ok=None: el
+        trabajador lo descartó porque se canceló).
+        """
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+            if entry is None:
+                return
+            loop, future, shm, worker, started, _ = entry
+            worker.pending.discard(job_id)
+            if shm is not None:
+                self._release_segment(shm)
+                # Latencia de extremo a extremo (cola + inferencia) de los trabajos con frame;
+                # el primer trabajo de cada proceso incluye la carga de los modelos y no cuenta
+                if ok and worker.completed:
+                    latency = time.perf_counter() - started
+                    if self.latency_ewma:
+                        latency = self.latency_ewma + _LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+                    self.latency_ewma = latency
+            if ok is not None:
+                worker.completed += 1
+
+        def _resolve():
+            if future.done():
+                return
+            if ok is None:
+                future.cancel()
+            elif ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+        try:
+            loop.call_soon_threadsafe(_resolve)
+        except RuntimeError:
+            # El loop ya está cerrado
+            pass
+
+    def _collect_results(self) -> None:
+        """
+        Hilo que recoge los resultados de los trabajadores y vigila que sigan vivos.
+
+        La vigilancia va por tiempo y no solo cuando no llegan resultados: con otros
+        trabajadores produciendo sin parar, un trabajador caído también se detecta.
+        """
+        next_check = time.monotonic() + _WORKER_CHECK_INTERVAL
+        while self._running:
+            try:
+                job_id, ok, payload = self._results.get(timeout=_WORKER_CHECK_INTERVAL)
+                self._finish(job_id, ok, payload)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                break
+
+            now = time.monotonic()
+            if now >= next_check:
+                self._check_workers()
+                next_check = now + _WORKER_CHECK_INTERVAL
+
+    def _check_workers(self) -> None:
+        """
+        Reemplaza los trabajadores caídos, falla sus trabajos pendientes y reasigna
+        sus sesiones (su siguiente frame va al trabajador vivo con menos carga).
+        """
+        for i, worker in enumerate(list(self._workers)):
+            if worker.process.is_alive() or not self._running:
+                continue
+            print(f"[InferenceExecutor] ⚠️ Trabajador {i} terminó inesperadamente, reiniciando...")
+            # Arrancar el proceso es lento: no se bloquea a submit mientras tanto
+            replacement = self._spawn_worker()
+            with self._lock:
+                lost = list(worker.pending)
+                # El estado de seguimiento de sus sesiones se perdió con el proceso
+                for session_id in worker.sessions:
+                    self._affinity.pop(session_id, None)
+                self._workers[i] = replacement
+            for job_id in lost:
+                self._finish(job_id, False, "El proceso de inferencia terminó inesperadamente")
+
+
+# Instancia global, creada de forma "lazy" para no lanzar procesos al importar
+_inference_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Obtiene (e inicia si es necesario) el ejecutor de inferencia global."""
+    global _inference_executor
+    if _inference_executor is None:
+        _inference_executor = InferenceExecutor(num_workers=settings.inference_workers)
+        _inference_executor.start()
+    return _inference_executor
+
+
+# Ejecutor propio del análisis offline de videos: sus segmentos (de hasta
+# video_segment_seconds de video cada uno) no ocupan a los trabajadores de tiempo
+# real ni cuentan en la cola que vigila el control de admisión
+_video_analysis_executor: Optional[InferenceExecutor] = None
+
+
+def get_video_analysis_executor() -> InferenceExecutor:
+    """Obtiene (e inicia si es necesario) el ejecutor de inferencia del análisis de videos."""
+    global _video_analysis_executor
+    if _video_analysis_executor is None:
+        _video_analysis_executor = InferenceExecutor(num_workers=settings.video_analysis_workers or 1)
+        _video_analysis_executor.start()
+    return _video_analysis_executor
+
+
+def shutdown_inference_executor() -> None:
+    """Detiene los ejecutores de inferencia globales que fueron iniciados."""
+    global _inference_executor, _video_analysis_executor
+    if _inference_executor is not None:
+        _inference_executor.shutdown()
+        _inference_executor = None
+    if _video_analysis_executor is not None:
+        _video_analysis_executor.shutdown()
+        _video_analysis_executor = None
@@ -0,0 +1,257 @@
+"""
+Cálculo de métricas de atención a partir de landmarks faciales.
+
+Este módulo no depende de MediaPipe: sirve tanto para los landmarks que produce
+Face Mesh en los trabajadores como para los puntos que envían los clientes que
+ejecutan Face Mesh en el navegador.
+
+Todas las funciones trabajan sobre arrays NumPy con dimensiones iniciales
+arbitrarias, de modo que un frame (478, 3) y una pila de frames (F, 478, 3) se
+procesan con las mismas operaciones vectorizadas.
+"""
+import itertools
+import math
+import operator
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from core.config import settings
+from models.schemas import BlinkDetectionResponse
+
+
+# Índices de Face Mesh para el EAR, ordenados como [p1, p2, p3, p4, p5, p6]
+# (ver BlinkDetectionService.LEFT_EYE_INDICES / RIGHT_EYE_INDICES)
+LEFT_EYE_INDICES = (33, 7, 163, 144, 153, 158)
+RIGHT_EYE_INDICES = (362, 382, 381, 380, 374, 390)
+_EYE_INDICES = np.array([LEFT_EYE_INDICES, RIGHT_EYE_INDICES])
+
+# Boca: comisuras (61, 291) y tres pares labio superior/inferior interiores
+_MOUTH_CORNERS = np.array([61, 291])
+_MOUTH_VERTICAL = np.array([[81, 178], [13, 14], [311, 402]])
+
+# Ejes del rostro para la orientación de la cabeza: mejillas (234 -> 454) y frente -> mentón (10 -> 152)
+_FACE_ACROSS = np.array([234, 454])
+_FACE_DOWN = np.array([10, 152])
+
+# Iris (requiere refine_landmarks=True): centro del iris, comisuras y párpados de cada ojo
+_IRIS_CENTERS = np.array([468, 473])
+_IRIS_EYE_CORNERS = np.array([[33, 133], [362, 263]])
+_IRIS_EYE_LIDS = np.array([[159, 145], [386, 374]])
+
+# Número de landmarks de Face Mesh con refinamiento del iris
+NUM_REFINED_LANDMARKS = 478
+
+_XYZ = operator.attrgetter("x", "y", "z")
+
+
+class LandmarkFeatures:
+    """
+    Métricas de atención de uno o varios frames.
+
+    Cada atributo es un float (un frame) o un array con las dimensiones iniciales
+    de los landmarks de entrada (pila de frames).
+    """
+
+    __slots__ = ("left_ear", "right_ear", "mouth_aspect_ratio", "yaw", "pitch", "roll", "gaze_x", "gaze_y")
+
+    def __init__(self, **values: Any):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def landmarks_to_array(face_landmarks: Any, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Convierte los landmarks de MediaPipe en un array contiguo (N, 3) de float32.
+
+    Args:
+        face_landmarks: Landmarks de un rostro (NormalizedLandmarkList)
+        out: Array de una llamada anterior a reutilizar si tiene la forma adecuada
+
+    Returns:
+        np.ndarray: Coordenadas normalizadas (x, y, z) de cada landmark
+    """
+    points = face_landmarks.landmark
+    count = len(points)
+    coords = itertools.chain.from_iterable(map(_XYZ, points))
+    if out is None or out.shape != (count, 3) or out.dtype != np.float32:
+        return np.fromiter(coords, dtype=np.float32, count=count * 3).reshape(count, 3)
+    out.reshape(-1)[:] = np.fromiter(coords, dtype=np.float32, count=count * 3)
+    return out
+
+
+def to_pixels(landmarks: np.ndarray, img_shape: tuple) -> np.ndarray:
+    """
+    Escala landmarks normalizados a píxeles. Face Mesh expresa z aproximadamente
+    en la misma escala que x, por lo que z se escala con el ancho.
+
+    Args:
+        landmarks: Array (..., N, 3) o (..., N, 2) de coordenadas normalizadas
+        img_shape: Forma (height, width) de la imagen procesada
+
+    Returns:
+        np.ndarray: Landmarks en píxeles (float64)
+    """
+    h, w = img_shape[:2]
+    scale = np.array([w, h, w][:landmarks.shape[-1]], dtype=np.float64)
+    return landmarks * scale
+
+
+def eye_aspect_ratio(points: np.ndarray) -> np.ndarray:
+    """
+    Calcula EAR a partir de los 6 puntos de uno o varios ojos en píxeles.
+
+    EAR = (|p2-p6| + |p3-p5|) / (2 * |p1-p4|)
+
+    Args:
+        points: Array (..., 6, 2) ordenado como [p1, p2, p3, p4, p5, p6]
+
+    Returns:
+        np.ndarray: EAR con las dimensiones iniciales de points (0.0 si p1 y p4 coinciden)
+    """
+    points = points[..., :2]
+    vertical_dist = np.linalg.norm(points[..., 0, :] - points[..., 3, :], axis=-1)
+    horizontal_dist_1 = np.linalg.norm(points[..., 1, :] - points[..., 5, :], axis=-1)
+    horizontal_dist_2 = np.linalg.norm(points[..., 2, :] - points[..., 4, :], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ear = (horizontal_dist_1 + horizontal_dist_2) / (2.0 * vertical_dist)
+    return np.where(vertical_dist > 0, ear, 0.0)
+
+
+def eye_aspect_ratios(landmarks: np.ndarray) -> np.ndarray:
+    """
+    Calcula el EAR de ambos ojos a partir de landmarks de Face Mesh en píxeles.
+
+    Args:
+        landmarks: Array (..., N, 2|3) en píxeles
+
+    Returns:
+        np.ndarray: Array (..., 2) con el EAR izquierdo y derecho
+    """
+    return eye_aspect_ratio(landmarks[..., _EYE_INDICES, :])
+
+
+def compute_features(landmarks: np.ndarray) -> LandmarkFeatures:
+    """
+    Calcula en una sola pasada vectorizada el EAR de ambos ojos, la apertura de
+    la boca (MAR), la orientación de la cabeza y la desviación de la mirada.
+
+    - yaw: giro horizontal en grados (positivo = rostro girado hacia la derecha de la imagen)
+    - pitch: inclinación vertical en grados (positivo = cabeza hacia arriba)
+    - roll: inclinación lateral en grados (positivo = sentido horario en la imagen)
+    - gaze_x / gaze_y: posición del iris respecto al centro del ojo, aproximadamente
+      en [-1, 1] (positivo = derecha / abajo en la imagen); 0.0 sin landmarks de iris
+
+    Args:
+        landmarks: Array (..., N, 3) de landmarks en píxeles (ver to_pixels)
+
+    Returns:
+        LandmarkFeatures con floats (un frame) o arrays (pila de frames)
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    ears = eye_aspect_ratios(landmarks)
+
+    # MAR = media de las aperturas verticales / distancia entre comisuras
+    mouth = landmarks[..., :2]
+    mouth_width = np.linalg.norm(mouth[..., _MOUTH_CORNERS[0], :] - mouth[..., _MOUTH_CORNERS[1], :], axis=-1)
+    openings = np.linalg.norm(
+        mouth[..., _MOUTH_VERTICAL[:, 0], :] - mouth[..., _MOUTH_VERTICAL[:, 1], :], axis=-1
+    ).mean(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mar = np.where(mouth_width > 0, openings / mouth_width, 0.0)
+
+    # Orientación: base ortonormal (derecha, abajo, normal) del plano del rostro
+    right = landmarks[..., _FACE_ACROSS[1], :] - landmarks[..., _FACE_ACROSS[0], :]
+    down = landmarks[..., _FACE_DOWN[1], :] - landmarks[..., _FACE_DOWN[0], :]
+    right = right / np.maximum(np.linalg.norm(right, axis=-1, keepdims=True), 1e-9)
+    down = down - (down * right).sum(axis=-1, keepdims=True) * right
+    down = down / np.maximum(np.linalg.norm(down, axis=-1, keepdims=True), 1e-9)
+    normal = np.cross(right, down)
+    yaw = np.degrees(np.arctan2(-normal[..., 0], normal[..., 2]))
+    pitch = np.degrees(np.arctan2(normal[..., 1], np.hypot(normal[..., 0], normal[..., 2])))
+    roll = np.degrees(np.arctan2(right[..., 1], right[..., 0]))
+
+    # Mirada: desplazamiento del iris respecto al centro del ojo, promediado entre ambos ojos
+    if landmarks.shape[-2] >= NUM_REFINED_LANDMARKS:
+        iris = landmarks[..., _IRIS_CENTERS, :2]
+        corners = landmarks[..., _IRIS_EYE_CORNERS, :2]
+        lids = landmarks[..., _IRIS_EYE_LIDS, :2]
+        eye_center = corners.mean(axis=-2)
+        half_width = np.maximum(np.linalg.norm(corners[..., 1, :] - corners[..., 0, :], axis=-1) / 2.0, 1e-9)
+        half_height = np.maximum(np.abs(lids[..., 1, 1] - lids[..., 0, 1]) / 2.0, 1e-9)
+        gaze_x = ((iris[..., 0] - eye_center[..., 0]) / half_width).mean(axis=-1)
+        gaze_y = ((iris[..., 1] - lids.mean(axis=-2)[..., 1]) / half_height).mean(axis=-1)
+    else:
+        gaze_x = gaze_y = np.zeros(landmarks.shape[:-2])
+
+    values = {
+        "left_ear": ears[..., 0],
+        "right_ear": ears[..., 1],
+        "mouth_aspect_ratio": mar,
+        "yaw": yaw,
+        "pitch": pitch,
+        "roll": roll,
+        "gaze_x": gaze_x,
+        "gaze_y": gaze_y,
+    }
+    if landmarks.ndim == 2:
+        values = {name: float(value) for name, value in values.items()}
+    return LandmarkFeatures(**values)
+
+
+def evaluate_eye_points(
+    left_eye: np.ndarray,
+    right_eye: np.ndarray,
+    ear_threshold: Optional[float] = None
+) -> BlinkDetectionResponse:
+    """
+    Calcula el EAR de ambos ojos y determina si hay parpadeo (EAR promedio menor al umbral).
+
+    Args:
+        left_eye: Array (6, 2) del ojo izquierdo en píxeles
+        right_eye: Array (6, 2) del ojo derecho en píxeles
+        ear_threshold: Umbral EAR (por defecto, el de la configuración)
+
+    Returns:
+        BlinkDetectionResponse con información sobre el parpadeo
+    """
+    left_ear, right_ear = (float(ear) for ear in eye_aspect_ratio(np.stack([left_eye, right_eye])))
+    return blink_from_ears(left_ear, right_ear, ear_threshold)
+
+
+def is_valid_ear(ear: float) -> bool:
+    """Si un EAR puede venir de un ojo real (finito y positivo)."""
+    return math.isfinite(ear) and ear > 0.0
+
+
+def blink_from_ears(
+    left_ear: float,
+    right_ear: float,
+    ear_threshold: Optional[float] = None
+) -> BlinkDetectionResponse:
+    """
+    Aplica el umbral al EAR promedio de ambos ojos.
+
+    Un EAR nulo o no finito sale de puntos degenerados (comisuras coincidentes o
+    coordenadas inválidas), no de un ojo cerrado: se responde como sin rostro.
+
+    Args:
+        left_ear: EAR del ojo izquierdo
+        right_ear: EAR del ojo derecho
+        ear_threshold: Umbral EAR (por defecto, el de la configuración)
+
+    Returns:
+        BlinkDetectionResponse con información sobre el parpadeo
+    """
+    if not is_valid_ear(left_ear) or not is_valid_ear(right_ear):
+        return BlinkDetectionResponse(blinking=False, left_ear=0.0, right_ear=0.0)
+    if ear_threshold is None:
+        ear_threshold = settings.ear_threshold
+    return BlinkDetectionResponse(
+        blinking=(left_ear + right_ear) / 2.0 < ear_threshold,
+        left_ear=left_ear,
+        right_ear=right_ear
+    )
@@ -0,0 +1,249 @@
+"""
+Atención en vivo de los estudiantes agrupada por salas para el panel del docente.
+
+Cada sesión de actividad pertenece a la sala de su clase ("class:<id>") y a la
+de su tarea ("task:<id>"). Mientras el estudiante envía frames a
+/ws/detect/blink, su conexión publica cada live_publish_interval segundos una
+instantánea compacta de su atención en esas salas. /ws/class/{class_id}/live
+agrega la sala una sola vez por tick (aggregate) y envía el mismo frame a todos
+los docentes conectados.
+
+Las salas y las sesiones se guardan en el backend de estado
+(services/state_backend.py), así que los estudiantes y los docentes pueden
+estar conectados a procesos de uvicorn distintos. Cada instantánea es una
+clave propia ("<sala>:<session_id>"): publicar escribe solo la de la sesión,
+sin reescribir la sala entera, y caduca sola si el estudiante deja de publicar.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.config import settings
+from services.session_timeline import SessionTimeline
+from services.state_backend import StateNamespace, get_state_backend
+
+
+def class_room(class_id: str) -> str:
+    """Nombre de la sala de una clase."""
+    return f"class:{class_id}"
+
+
+def task_room(task_id: str) -> str:
+    """Nombre de la sala de una tarea."""
+    return f"task:{task_id}"
+
+
+def _room_key(room: str, session_id: str) -> str:
+    """Clave de la instantánea de una sesión en una sala."""
+    return f"{room}:{session_id}"
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class LiveAttentionPublisher:
+    """
+    Publica la instantánea de atención de una sesión en sus salas, como mucho
+    una vez cada interval segundos.
+    """
+
+    def __init__(self, hub: "LiveAttentionHub", session_id: str, session: Dict[str, Any], interval: float = 1.0):
+        """
+        Args:
+            hub: Salas donde se publica
+            session_id: Identificador de la sesión de actividad
+            session: Registro de la sesión (student_id, task_id, class_id)
+            interval: Segundos mínimos entre dos publicaciones
+        """
+        self.hub = hub
+        self.session_id = session_id
+        self.session = session
+        self.student_id = session.get("student_id")
+        self.rooms = hub.rooms_of(session)
+        self.interval = interval
+        self.published_at = 0.0
+        self.touched_at = 0.0
+        self.ended = False
+
+    async def update(self, timeline: SessionTimeline, blink_count: int, now: Optional[float] = None) -> bool:
+        """
+        Publica la instantánea si ha pasado el intervalo desde la anterior.
+
+        Args:
+            timeline: Línea de tiempo de la sesión
+            blink_count: Parpadeos de la sesión
+
+        Returns:
+            bool: Si se publicó (nunca tras finalizar la sesión con /sessions/end)
+        """
+        now = time.monotonic() if now is None else now
+        if self.ended or now - self.published_at < self.interval:
+            return False
+        self.published_at = now
+        # El registro de la sesión caduca: se renueva mientras el estudiante siga
+        # conectado, salvo que la sesión ya se haya finalizado
+        ttl = self.hub.sessions.ttl
+        if ttl > 0 and now - self.touched_at >= ttl / 2:
+            self.touched_at = now
+            if not await self.hub.is_active(self.session_id):
+                self.ended = True
+                return False
+            await self.hub.sessions.aset(self.session_id, self.session)
+        await self.hub.publish(self.rooms, self.session_id, {
+            "student_id": self.student_id,
+            "face": timeline.face_present(),
+            "attention": _round(timeline.recent_attention(self.hub.recent_seconds)),
+            "attention_score": _round(timeline.attention_score()),
+            "attention_level": timeline.attention_level(),
+            "blink_count": blink_count
+        })
+        return True
+
+    async def close(self) -> None:
+        """Retira la sesión de sus salas (al desconectarse el estudiante)."""
+        await self.hub.withdraw(self.rooms, self.session_id)
+
+
+class LiveAttentionHub:
+    """
+    Registro de las sesiones en curso y de las instantáneas de cada sala.
+    """
+
+    def __init__(
+        self,
+        sessions: StateNamespace,
+        rooms: StateNamespace,
+        student_timeout: float = 10.0,
+        recent_seconds: int = 10
+    ):
+        """
+        Args:
+            sessions: Espacio de nombres {session_id: {"student_id", "task_id", "class_id"}}
+            rooms: Espacio de nombres {"<sala>:<session_id>": instantánea}
+            student_timeout: Segundos sin instantáneas antes de quitar a un estudiante de la sala
+            recent_seconds: Segundos de la atención reciente de cada instantánea
+        """
+        self.sessions = sessions
+        self.rooms = rooms
+        self.student_timeout = student_timeout
+        self.recent_seconds = recent_seconds
+
+    async def register_session(self, session_id: str, student_id: str, task_id: str, class_id: Optional[str] = None) -> None:
+        """
+        Registra una sesión de actividad y sus salas (al iniciarla).
+
+        Args:
+            session_id: Identificador de la sesión (activity_sessions.id)
+            student_id: Estudiante de la sesión
+            task_id: Tarea de la sesión
+            class_id: Clase de la tarea (None si no se conoce: solo sala de la tarea)
+        """
+        await self.sessions.aset(session_id, {"student_id": student_id, "task_id": task_id, "class_id": class_id})
+
+    async def end_session(self, session_id: str) -> None:
+        """Elimina el registro de una sesión y la retira de sus salas (al finalizarla)."""
+        session = await self.sessions.adelete(session_id)
+        if session is not None:
+            await self.withdraw(self.rooms_of(session), session_id)
+
+    async def is_active(self, session_id: str) -> bool:
+        """Si la sesión está registrada (iniciada y aún no finalizada)."""
+        return await self.sessions.aget(session_id) is not None
+
+    async def publisher(self, session_id: str, interval: Optional[float] = None) -> Optional[LiveAttentionPublisher]:
+        """
+        Crea el publicador de una sesión registrada.
+
+        Returns:
+            LiveAttentionPublisher, o None si la sesión no se registró con /sessions/start
+        """
+        session = await self.sessions.aget(session_id)
+        if session is None:
+            return None
+        return LiveAttentionPublisher(
+            self,
+            session_id,
+            session,
+            settings.live_publish_interval if interval is None else interval
+        )
+
+    @staticmethod
+    def rooms_of(session: Dict[str, Any]) -> List[str]:
+        """Salas de una sesión registrada."""
+        rooms = [task_room(session["task_id"])]
+        if session.get("class_id"):
+            rooms.append(class_room(session["class_id"]))
+        return rooms
+
+    async def publish(self, rooms: Iterable[str], session_id: str, snapshot: Dict[str, Any]) -> None:
+        """
+        Guarda la instantánea de una sesión en sus salas (sustituye a la anterior).
+        """
+        entry = {**snapshot, "updated_at": time.time()}
+        for room in rooms:
+            await self.rooms.aset(_room_key(room, session_id), entry)
+
+    async def withdraw(self, rooms: Iterable[str], session_id: str) -> None:
+        """Quita una sesión de sus salas."""
+        for room in rooms:
+            await self.rooms.adelete(_room_key(room, session_id))
+
+    async def aggregate(self, room: str, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Frame del panel en vivo de una sala: las instantáneas de todos sus
+        estudiantes y el resumen de la sala.
+
+        Returns:
+            dict {"type": "live", "room", "at", "students": [...], "summary": {...}}
+        """
+        now = time.time() if now is None else now
+        prefix = _room_key(room, "")
+        students = {
+            key[len(prefix):]: snapshot
+            for key, snapshot in (await self.rooms.aitems(prefix)).items()
+            # Descartar a los estudiantes que dejaron de publicar sin retirarse
+            if now - snapshot["updated_at"] <= self.student_timeout
+        }
+        rows = [
+            {"session_id": session_id, **snapshot}
+            for session_id, snapshot in sorted(students.items(), key=lambda item: str(item[1].get("student_id")))
+        ]
+
+        attention = [row["attention"] for row in rows if row.get("attention") is not None]
+        levels = {"alto": 0, "medio": 0, "bajo": 0}
+        for row in rows:
+            if row.get("attention_level") in levels:
+                levels[row["attention_level"]] += 1
+
+        return {
+            "type": "live",
+            "room": room,
+            "at": now,
+            "students": rows,
+            "summary": {
+                "students": len(rows),
+                "faces": sum(1 for row in rows if row.get("face")),
+                "attention": _round(sum(attention) / len(attention)) if attention else None,
+                "levels": levels
+            }
+        }
+
+
+# Instancia global (lazy)
+_hub: Optional[LiveAttentionHub] = None
+
+
+def get_live_attention_hub() -> LiveAttentionHub:
+    """
+    Obtiene la instancia global de las salas en vivo (se crea en el primer uso).
+    """
+    global _hub
+    if _hub is None:
+        backend = get_state_backend()
+        _hub = LiveAttentionHub(
+            backend.namespace("live_sessions", ttl=settings.session_timeline_ttl),
+            backend.namespace("live_rooms", ttl=settings.live_student_timeout),
+            student_timeout=settings.live_student_timeout,
+            recent_seconds=settings.live_recent_seconds
+        )
+    return _hub
@@ -0,0 +1,340 @@
+"""
+Línea de tiempo compacta de la atención de cada sesión de estudio.
+
+Los resultados de cada frame se guardan en un buffer circular de campos de
+ancho fijo y se agregan por segundo en O(1). Con los agregados se calcula el
+nivel de atención en el servidor y se persiste la línea de tiempo al finalizar
+la sesión (/sessions/end).
+
+Con un backend de estado compartido (state_backend "sqlite" o "redis") cada
+línea de tiempo se copia periódicamente al backend, de modo que /sessions/end o
+una reconexión atendidos por otro proceso de uvicorn la encuentran.
+"""
+import base64
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from core.config import settings
+from services.state_backend import StateNamespace, get_state_backend
+
+
+# Bits del campo flags de cada frame
+FLAG_FACE = 1
+FLAG_BLINK = 2
+FLAG_ATTENTIVE = 4
+
+# Frame: delta de tiempo respecto al frame anterior (ms), EARs y flags (9 bytes por frame)
+FRAME_DTYPE = np.dtype([
+    ("dt_ms", np.uint32),
+    ("left_ear", np.float16),
+    ("right_ear", np.float16),
+    ("flags", np.uint8),
+])
+
+# Agregado por segundo de la sesión (18 bytes por segundo)
+SECOND_DTYPE = np.dtype([
+    ("second", np.uint32),
+    ("frames", np.uint16),
+    ("faces", np.uint16),
+    ("blinks", np.uint16),
+    ("attentive", np.uint16),
+    ("ear_sum", np.float32),
+])
+
+
+def attention_level_from_score(score: float) -> str:
+    """
+    Convierte un puntaje de atención (0-1) en el nivel 'alto', 'medio' o 'bajo'.
+    """
+    if score > settings.attention_high_threshold:
+        return "alto"
+    if score >= settings.attention_medium_threshold:
+        return "medio"
+    return "bajo"
+
+
+class SessionTimeline:
+    """
+    Buffer circular de frames y de agregados por segundo de una sesión.
+
+    La memoria es fija: session_timeline_frames frames recientes y
+    session_timeline_seconds segundos agregados (los más antiguos se
+    sobrescriben). Los totales de toda la sesión se acumulan aparte, por lo que
+    el nivel de atención cubre la sesión completa aunque el buffer haya dado la vuelta.
+    """
+
+    def __init__(self, max_frames: Optional[int] = None, max_seconds: Optional[int] = None):
+        """
+        Args:
+            max_frames: Capacidad del buffer de frames
+            max_seconds: Capacidad del buffer de agregados por segundo
+        """
+        self.frames = np.zeros(max_frames or settings.session_timeline_frames, dtype=FRAME_DTYPE)
+        self.seconds = np.zeros(max_seconds or settings.session_timeline_seconds, dtype=SECOND_DTYPE)
+        self.frame_count = 0
+        self.second_count = 0
+        self.started_at: Optional[float] = None
+        self.updated_at = time.monotonic()
+        self._last_at = 0.0
+        self._blinking = False
+        # Totales de la sesión completa: suma de la atención de cada segundo cerrado
+        self._attention_sum = 0.0
+        self._closed_seconds = 0
+        # Última copia al backend de estado (time.monotonic())
+        self.synced_at = 0.0
+
+    def append(
+        self,
+        left_ear: float,
+        right_ear: float,
+        face: bool,
+        blinking: bool,
+        attentive: bool,
+        timestamp: Optional[float] = None
+    ) -> None:
+        """
+        Registra el resultado de un frame y actualiza el agregado de su segundo.
+
+        Args:
+            left_ear: EAR del ojo izquierdo
+            right_ear: EAR del ojo derecho
+            face: Si se detectó rostro
+            blinking: Si el frame es un parpadeo (EAR promedio bajo el umbral)
+            attentive: Si el estudiante está mirando la pantalla en este frame
+            timestamp: Instante del frame (time.monotonic() por defecto)
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.started_at is None:
+            self.started_at = self._last_at = now
+        self.updated_at = now
+
+        frame = self.frames[self.frame_count % len(self.frames)]
+        frame["dt_ms"] = min(int((now - self._last_at) * 1000), 0xFFFFFFFF)
+        frame["left_ear"] = left_ear
+        frame["right_ear"] = right_ear
+        frame["flags"] = (FLAG_FACE if face else 0) | (FLAG_BLINK if blinking else 0) | (FLAG_ATTENTIVE if attentive else 0)
+        self.frame_count += 1
+        self._last_at = now
+
+        # Agregado del segundo actual (se abre uno nuevo al cambiar de segundo)
+        second = int(now - self.started_at)
+        row = self.seconds[(self.second_count - 1) % len(self.seconds)] if self.second_count else None
+        if row is None or row["second"] != second:
+            if row is not None:
+                self._close_second(row)
+            row = self.seconds[self.second_count % len(self.seconds)]
+            row["second"] = second
+            row["frames"] = row["faces"] = row["blinks"] = row["attentive"] = 0
+            row["ear_sum"] = 0.0
+            self.second_count += 1
+
+        row["frames"] += 1
+        if face:
+            row["faces"] += 1
+            row["ear_sum"] += (left_ear + right_ear) / 2.0
+        if attentive:
+            row["attentive"] += 1
+        # Un parpadeo se cuenta al pasar de ojos abiertos a cerrados
+        if blinking and not self._blinking:
+            row["blinks"] += 1
+        self._blinking = blinking
+
+    def _close_second(self, row: np.void) -> None:
+        self._attention_sum += row["attentive"] / row["frames"]
+        self._closed_seconds += 1
+
+    def attention_score(self) -> Optional[float]:
+        """
+        Puntaje de atención de la sesión: media de la atención de cada segundo con datos.
+
+        Returns:
+            float entre 0 y 1, o None si la sesión no tiene frames
+        """
+        if not self.second_count:
+            return None
+        # Incluir el segundo en curso
+        row = self.seconds[(self.second_count - 1) % len(self.seconds)]
+        total = self._attention_sum + row["attentive"] / row["frames"]
+        return float(total / (self._closed_seconds + 1))
+
+    def attention_level(self) -> Optional[str]:
+        """Nivel de atención ('alto', 'medio', 'bajo') o None si no hay frames."""
+        score = self.attention_score()
+        return attention_level_from_score(score) if score is not None else None
+
+    def recent_attention(self, seconds: int) -> Optional[float]:
+        """
+        Atención media de los últimos segundos con datos (incluido el segundo en curso).
+
+        Args:
+            seconds: Número de segundos a promediar
+
+        Returns:
+            float entre 0 y 1, o None si la sesión no tiene frames
+        """
+        count = min(seconds, self.second_count, len(self.seconds))
+        if not count:
+            return None
+        rows = self.seconds[np.arange(self.second_count - count, self.second_count) % len(self.seconds)]
+        return float(np.mean(rows["attentive"] / rows["frames"]))
+
+    def face_present(self) -> bool:
+        """Si se detectó rostro en el último frame."""
+        if not self.frame_count:
+            return False
+        return bool(self.frames[(self.frame_count - 1) % len(self.frames)]["flags"] & FLAG_FACE)
+
+    def _chronological_seconds(self) -> np.ndarray:
+        capacity = len(self.seconds)
+        if self.second_count <= capacity:
+            return self.seconds[:self.second_count]
+        start = self.second_count % capacity
+        return np.concatenate([self.seconds[start:], self.seconds[:start]])
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """
+        Agregados por segundo conservados en el buffer, en orden cronológico.
+
+        Returns:
+            Lista de filas {"second", "frames", "face_ratio", "blinks", "mean_ear", "attention"}
+        """
+        rows = self._chronological_seconds()
+
+        frames = rows["frames"].astype(np.float64)
+        faces = rows["faces"].astype(np.float64)
+        face_ratio = np.round(faces / frames, 3)
+        mean_ear = np.round(np.divide(rows["ear_sum"], faces, out=np.zeros_like(faces), where=faces > 0), 3)
+        attention = np.round(rows["attentive"] / frames, 3)
+        return [
+            {
+                "second": int(second),
+                "frames": int(count),
+                "face_ratio": float(ratio),
+                "blinks": int(blinks),
+                "mean_ear": float(ear),
+                "attention": float(level)
+            }
+            for second, count, ratio, blinks, ear, level in zip(
+                rows["second"], rows["frames"], face_ratio, rows["blinks"], mean_ear, attention
+            )
+        ]
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Estado serializable a JSON para el backend de estado: los agregados por
+        segundo (comprimidos) y los totales de la sesión. El buffer de frames no se copia.
+        """
+        rows = self._chronological_seconds()
+        return {
+            "seconds": base64.b64encode(zlib.compress(rows.tobytes())).decode("ascii"),
+            "frame_count": self.frame_count,
+            "attention_sum": self._attention_sum,
+            "closed_seconds": self._closed_seconds
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "SessionTimeline":
+        """
+        Reconstruye una línea de tiempo guardada con to_state().
+
+        Los frames nuevos se agregan a partir del segundo siguiente al último guardado.
+        """
+        timeline = cls()
+        rows = np.frombuffer(zlib.decompress(base64.b64decode(state["seconds"])), dtype=SECOND_DTYPE)
+        rows = rows[-len(timeline.seconds):]
+        timeline.seconds[:len(rows)] = rows
+        timeline.second_count = len(rows)
+        timeline.frame_count = state["frame_count"]
+        timeline._attention_sum = state["attention_sum"]
+        timeline._closed_seconds = state["closed_seconds"]
+        if len(rows):
+            timeline.started_at = timeline._last_at = time.monotonic() - (int(rows[-1]["second"]) + 1)
+        return timeline
+
+
+# Líneas de tiempo de las sesiones en curso, por id de sesión de actividad
+_timelines: Dict[str, SessionTimeline] = {}
+
+
+async def get_session_timeline(session_id: str) -> SessionTimeline:
+    """
+    Obtiene (o crea) la línea de tiempo de una sesión de actividad.
+
+    Al crear una nueva se descartan las que llevan más de session_timeline_ttl
+    segundos sin recibir frames (sesiones que nunca se finalizaron).
+
+    Args:
+        session_id: Identificador de la sesión de actividad (activity_sessions.id)
+    """
+    timeline = _timelines.get(session_id)
+    if timeline is None:
+        now = time.monotonic()
+        for key in [key for key, value in _timelines.items() if now - value.updated_at > settings.session_timeline_ttl]:
+            del _timelines[key]
+        # Reconexión atendida por otro proceso: continuar la línea de tiempo guardada
+        state = await _stored_timelines().aget(session_id) if get_state_backend().shared else None
+        timeline = _timelines.setdefault(session_id, SessionTimeline.from_state(state) if state else SessionTimeline())
+    return timeline
+
+
+def _stored_timelines() -> StateNamespace:
+    return get_state_backend().namespace("session_timelines", ttl=settings.session_timeline_ttl)
+
+
+async def sync_session_timeline(session_id: str, timeline: SessionTimeline, force: bool = False) -> None:
+    """
+    Copia la línea de tiempo al backend de estado compartido, como mucho cada
+    session_state_sync_interval segundos (no hace nada con el backend en memoria).
+
+    Args:
+        session_id: Identificador de la sesión de actividad
+        timeline: Línea de tiempo de la sesión
+        force: Copiar aunque no haya pasado el intervalo (al desconectarse el cliente)
+    """
+    if not get_state_backend().shared:
+        return
+    now = time.monotonic()
+    if not force and now - timeline.synced_at < settings.session_state_sync_interval:
+        return
+    timeline.synced_at = now
+    await _stored_timelines().aset(session_id, timeline.to_state())
+
+
+async def find_session_timeline(session_id: str) -> Optional[SessionTimeline]:
+    """
+    Obtiene la línea de tiempo de una sesión sin retirarla (para guardarla antes
+    de llamar a pop_session_timeline).
+
+    Con un backend compartido, si otro proceso recibió frames más recientes, se
+    usa la copia guardada.
+
+    Returns:
+        SessionTimeline o None si la sesión no recibió frames
+    """
+    timeline = _timelines.get(session_id)
+    if get_state_backend().shared:
+        state = await _stored_timelines().aget(session_id)
+        if state and (timeline is None or state["frame_count"] > timeline.frame_count):
+            timeline = SessionTimeline.from_state(state)
+    return timeline
+
+
+async def pop_session_timeline(session_id: str) -> Optional[SessionTimeline]:
+    """
+    Retira la línea de tiempo de una sesión (al finalizarla).
+
+    Con un backend compartido también se retira la copia guardada y, si otro
+    proceso recibió frames más recientes, se usa esa copia.
+
+    Returns:
+        SessionTimeline o None si la sesión no recibió frames
+    """
+    timeline = _timelines.pop(session_id, None)
+    if get_state_backend().shared:
+        state = await _stored_timelines().adelete(session_id)
+        if state and (timeline is None or state["frame_count"] > timeline.frame_count):
+            timeline = SessionTimeline.from_state(state)
+    return timeline
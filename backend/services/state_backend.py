@@ -0,0 +1,586 @@
+"""
+Almacén del estado que deben compartir los procesos de uvicorn (contadores de
+parpadeos, estado de las transcripciones y líneas de tiempo de las sesiones).
+
+Backends (configuración state_backend):
+- "memory": diccionarios del propio proceso (por defecto). Solo sirve con un
+  único proceso de uvicorn.
+- "sqlite": archivo SQLite en modo WAL compartido por todos los procesos de la
+  máquina (uvicorn --workers N).
+- "redis": servidor Redis o compatible (requiere el paquete redis); también
+  sirve para varias máquinas.
+
+El estado se agrupa en espacios de nombres con caducidad por inactividad (ttl:
+segundos desde la última escritura) y, opcionalmente, un máximo de claves (se
+descartan las escritas hace más tiempo). Los valores deben poder serializarse
+a JSON; el backend en memoria los guarda tal cual, así que no deben
+modificarse después de guardarlos (update recibe el valor actual y devuelve uno nuevo).
+
+Desde el loop de asyncio se usan las variantes async (aget, aupdate...): con
+SQLite y Redis la operación se ejecuta en un hilo del pool de E/S del estado
+(state_io_threads) y no bloquea al resto de conexiones; en memoria se ejecuta
+directamente.
+"""
+import abc
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.config import settings
+
+
+class StateNamespace(abc.ABC):
+    """
+    Espacio de nombres de un backend: claves con valores JSON, TTL y máximo de claves.
+    """
+
+    # Las operaciones hacen E/S (archivo o red): las variantes async las ejecutan en otro hilo
+    blocking = True
+
+    def __init__(self, name: str, ttl: float = 0.0, max_keys: int = 0):
+        """
+        Args:
+            name: Nombre del espacio (por ejemplo "blink_counts")
+            ttl: Segundos sin escrituras antes de descartar una clave (0 = sin caducidad)
+            max_keys: Número máximo de claves (0 = sin límite)
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_keys = max_keys
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Valor de una clave o None si no existe o ha caducado (no renueva su TTL)."""
+
+    @abc.abstractmethod
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Valores de varias claves (las inexistentes no aparecen)."""
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        """Guarda el valor de una clave y renueva su TTL."""
+
+    @abc.abstractmethod
+    def update(self, key: str, fn: Callable[[Optional[Any]], Any]) -> Any:
+        """
+        Lectura-modificación-escritura atómica (también entre procesos).
+
+        Args:
+            key: Clave a actualizar
+            fn: Recibe el valor actual (None si no existe) y devuelve el nuevo
+
+        Returns:
+            El nuevo valor
+        """
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> Optional[Any]:
+        """Elimina una clave y devuelve su último valor (None si no existía)."""
+
+    @abc.abstractmethod
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        """
+        Claves vigentes con sus valores.
+
+        Args:
+            prefix: Solo las claves que empiezan por este prefijo (por defecto, todas)
+        """
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await self._offload(self.get, key)
+
+    async def aget_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        return await self._offload(self.get_many, list(keys))
+
+    async def aset(self, key: str, value: Any) -> None:
+        await self._offload(self.set, key, value)
+
+    async def aupdate(self, key: str, fn: Callable[[Optional[Any]], Any]) -> Any:
+        return await self._offload(self.update, key, fn)
+
+    async def adelete(self, key: str) -> Optional[Any]:
+        return await self._offload(self.delete, key)
+
+    async def aitems(self, prefix: str = "") -> Dict[str, Any]:
+        return await self._offload(self.items, prefix)
+
+    async def _offload(self, method: Callable[..., Any], *args: Any) -> Any:
+        if not self.blocking:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(_io_executor(), method, *args)
+
+    def _expires_at(self, now: float) -> Optional[float]:
+        return now + self.ttl if self.ttl > 0 else None
+
+
+class MemoryNamespace(StateNamespace):
+    """
+    Espacio de nombres en memoria: un OrderedDict ordenado por última escritura,
+    de modo que las claves caducadas o sobrantes siempre están al principio.
+    """
+
+    blocking = False
+
+    def __init__(self, name: str, ttl: float = 0.0, max_keys: int = 0):
+        super().__init__(name, ttl, max_keys)
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        # Las transcripciones escriben desde su propio hilo
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._lookup(key, time.time())
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            values = {key: self._lookup(key, now) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, time.time())
+
+    def update(self, key: str, fn: Callable[[Optional[Any]], Any]) -> Any:
+        now = time.time()
+        with self._lock:
+            value = fn(self._lookup(key, now))
+            self._store(key, value, now)
+            return value
+
+    def delete(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._lookup(key, time.time())
+            self._entries.pop(key, None)
+            return value
+
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        with self._lock:
+            self._evict(time.time())
+            return {key: value for key, (value, _) in self._entries.items() if key.startswith(prefix)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str, now: float) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            self.evicted += 1
+            return None
+        return value
+
+    def _store(self, key: str, value: Any, now: float) -> None:
+        self._entries[key] = (value, self._expires_at(now))
+        self._entries.move_to_end(key)
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            expired = expires_at is not None and expires_at <= now
+            if not expired and not (self.max_keys and len(self._entries) > self.max_keys):
+                break
+            del self._entries[key]
+            self.evicted += 1
+
+
+_UPSERT = (
+    "INSERT INTO state (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)"
+    " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value,"
+    " updated_at = excluded.updated_at, expires_at = excluded.expires_at"
+)
+
+
+def _rollback(connection: sqlite3.Connection) -> None:
+    """Deshace la transacción en curso sin ocultar el error que la interrumpió."""
+    try:
+        connection.execute("ROLLBACK")
+    except sqlite3.Error:
+        pass
+
+
+class SQLiteNamespace(StateNamespace):
+    """
+    Espacio de nombres en la tabla state de un archivo SQLite compartido.
+    """
+
+    # Escrituras entre dos limpiezas de claves caducadas o sobrantes
+    PRUNE_EVERY = 256
+
+    def __init__(self, backend: "SQLiteStateBackend", name: str, ttl: float = 0.0, max_keys: int = 0):
+        super().__init__(name, ttl, max_keys)
+        self._backend = backend
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._backend.connection().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (self.name, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        values: Dict[str, Any] = {}
+        connection = self._backend.connection()
+        now = time.time()
+        # Límite de parámetros de SQLite por consulta
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = connection.execute(
+                f"SELECT key, value FROM state WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (self.name, *chunk, now)
+            ).fetchall()
+            values.update((key, json.loads(value)) for key, value in rows)
+        return values
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        self._backend.connection().execute(
+            _UPSERT,
+            (self.name, key, json.dumps(value), now, self._expires_at(now))
+        )
+        self._after_write()
+
+    def update(self, key: str, fn: Callable[[Optional[Any]], Any]) -> Any:
+        connection = self._backend.connection()
+        now = time.time()
+        # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer: ningún otro proceso intercala su actualización
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.name, key, now)
+            ).fetchone()
+            value = fn(json.loads(row[0]) if row else None)
+            connection.execute(
+                _UPSERT,
+                (self.name, key, json.dumps(value), now, self._expires_at(now))
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            _rollback(connection)
+            raise
+        self._after_write()
+        return value
+
+    def delete(self, key: str) -> Optional[Any]:
+        connection = self._backend.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?",
+                (self.name, key)
+            ).fetchone()
+            connection.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (self.name, key))
+            connection.execute("COMMIT")
+        except BaseException:
+            _rollback(connection)
+            raise
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        if not prefix:
+            rows = self._backend.connection().execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.name, time.time())
+            ).fetchall()
+        else:
+            # Rango [prefijo, prefijo siguiente): usa el índice de la clave primaria
+            rows = self._backend.connection().execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND key >= ? AND key < ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (self.name, prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1), time.time())
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _after_write(self) -> None:
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        """Elimina las claves caducadas y las que exceden max_keys (las escritas hace más tiempo)."""
+        connection = self._backend.connection()
+        connection.execute(
+            "DELETE FROM state WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.name, time.time())
+        )
+        if self.max_keys > 0:
+            connection.execute(
+                "DELETE FROM state WHERE namespace = ? AND key IN ("
+                " SELECT key FROM state WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.name, self.name, self.max_keys)
+            )
+
+
+class RedisNamespace(StateNamespace):
+    """
+    Espacio de nombres en Redis: una clave "<prefijo>:<espacio>:<clave>" por valor.
+
+    La caducidad usa el TTL de Redis; max_keys no se aplica (la memoria se acota
+    con el TTL y la política maxmemory del servidor).
+    """
+
+    def __init__(self, backend: "RedisStateBackend", name: str, ttl: float = 0.0, max_keys: int = 0):
+        super().__init__(name, ttl, max_keys)
+        self._client = backend.client
+        self._prefix = f"{backend.prefix}:{name}:"
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(self._prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._client.mget([self._prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key: str, value: Any) -> None:
+        self._client.set(self._prefix + key, json.dumps(value), px=self._ttl_ms())
+
+    def update(self, key: str, fn: Callable[[Optional[Any]], Any]) -> Any:
+        from redis.exceptions import WatchError
+
+        name = self._prefix + key
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    # WATCH: si otro proceso modifica la clave antes de EXEC, se reintenta
+                    pipe.watch(name)
+                    current = pipe.get(name)
+                    value = fn(json.loads(current) if current is not None else None)
+                    pipe.multi()
+                    pipe.set(name, json.dumps(value), px=self._ttl_ms())
+                    pipe.execute()
+                    return value
+                except WatchError:
+                    continue
+
+    def delete(self, key: str) -> Optional[Any]:
+        name = self._prefix + key
+        with self._client.pipeline() as pipe:
+            pipe.get(name)
+            pipe.delete(name)
+            value, _ = pipe.execute()
+        return json.loads(value) if value is not None else None
+
+    def items(self, prefix: str = "") -> Dict[str, Any]:
+        pattern = self._prefix + re.sub(r"([\\*?\[\]])", r"\\\1", prefix) + "*"
+        names = list(self._client.scan_iter(match=pattern, count=500))
+        if not names:
+            return {}
+        prefix_length = len(self._prefix)
+        values = self._client.mget(names)
+        return {
+            (name.decode() if isinstance(name, bytes) else name)[prefix_length:]: json.loads(value)
+            for name, value in zip(names, values) if value is not None
+        }
+
+    def _ttl_ms(self) -> Optional[int]:
+        return int(self.ttl * 1000) if self.ttl > 0 else None
+
+
+class StateBackend(abc.ABC):
+    """
+    Backend de estado: crea (y reutiliza) los espacios de nombres.
+
+    Attributes:
+        shared: True si el estado es visible desde otros procesos
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._namespaces: Dict[str, StateNamespace] = {}
+
+    def namespace(self, name: str, ttl: float = 0.0, max_keys: int = 0) -> StateNamespace:
+        """
+        Obtiene un espacio de nombres (la primera llamada fija su ttl y max_keys).
+
+        Args:
+            name: Nombre del espacio
+            ttl: Segundos sin escrituras antes de descartar una clave (0 = sin caducidad)
+            max_keys: Número máximo de claves (0 = sin límite)
+        """
+        namespace = self._namespaces.get(name)
+        if namespace is None:
+            namespace = self._namespaces[name] = self._create_namespace(name, ttl, max_keys)
+        return namespace
+
+    @abc.abstractmethod
+    def _create_namespace(self, name: str, ttl: float, max_keys: int) -> StateNamespace:
+        """Crea el espacio de nombres propio del backend."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """Estado en la memoria del proceso (un único proceso de uvicorn)."""
+
+    def _create_namespace(self, name: str, ttl: float, max_keys: int) -> StateNamespace:
+        return MemoryNamespace(name, ttl, max_keys)
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Estado en un archivo SQLite en modo WAL: los lectores no bloquean al escritor
+    y todos los procesos de la máquina ven los mismos datos. Cada hilo usa su
+    propia conexión; close() las cierra todas.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Archivo de la base de datos (se crea si no existe)
+        """
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS state_updated ON state (namespace, updated_at)")
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (en modo autocommit; las transacciones son explícitas)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            # En WAL, synchronous=NORMAL no sincroniza el disco en cada commit
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _create_namespace(self, name: str, ttl: float, max_keys: int) -> StateNamespace:
+        return SQLiteNamespace(self, name, ttl, max_keys)
+
+    def close(self) -> None:
+        """Cierra las conexiones de todos los hilos (los hilos que sigan usando el backend abren otra)."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+
+class RedisStateBackend(StateBackend):
+    """Estado en un servidor Redis o compatible (paquete opcional redis)."""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "attention"):
+        """
+        Args:
+            url: URL del servidor (por ejemplo "redis://localhost:6379/0")
+            prefix: Prefijo de todas las claves
+
+        Raises:
+            RuntimeError: Si el paquete redis no está instalado
+        """
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("El backend de estado 'redis' requiere el paquete redis (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _create_namespace(self, name: str, ttl: float, max_keys: int) -> StateNamespace:
+        return RedisNamespace(self, name, ttl, max_keys)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def create_state_backend(kind: str) -> StateBackend:
+    """
+    Crea un backend de estado según su nombre.
+
+    Args:
+        kind: "memory", "sqlite" o "redis"
+
+    Raises:
+        ValueError: Si el tipo de backend no existe
+    """
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(settings.state_sqlite_path)
+    if kind == "redis":
+        return RedisStateBackend(settings.state_redis_url, settings.state_redis_prefix)
+    raise ValueError(f"Backend de estado desconocido: {kind} (memory, sqlite o redis)")
+
+
+# Instancia global (lazy)
+_backend: Optional[StateBackend] = None
+
+# Hilos donde se ejecutan las variantes async de los backends con E/S (lazy)
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _io_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, settings.state_io_threads), thread_name_prefix="state-io")
+    return _executor
+
+
+def get_state_backend() -> StateBackend:
+    """
+    Obtiene el backend de estado configurado (se crea en el primer uso).
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_state_backend(settings.state_backend)
+        print(f"[StateBackend] ✅ Estado compartido en backend '{settings.state_backend}'")
+    return _backend
+
+
+def shutdown_state_backend() -> None:
+    """
+    Cierra el backend de estado (al apagar la aplicación).
+    """
+    global _backend, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _backend is not None:
+        _backend.close()
+        _backend = None
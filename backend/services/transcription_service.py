@@ -4,6 +4,9 @@ import uuid
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+from core.config import settings
+from services.state_backend import StateNamespace, get_state_backend
+
 # Asegurar que ffmpeg esté en el PATH
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FFMPEG_BIN = os.path.join(BASE_DIR, "bin") # backend/bin
@@ -14,9 +17,19 @@ if os.path.exists(FFMPEG_BIN) and FFMPEG_BIN not in os.environ["PATH"]:
 class TranscriptionService:
     def __init__(self):
         self.model = None
-        self.tasks = {} # Almacenamiento en memoria: {task_id: {"status": "pending"|"processing"|"completed"|"failed", "text": ..., "error": ...}}
+        self._tasks = None # Backend de estado: {task_id: {"status": "pending"|"processing"|"completed"|"failed", "text": ..., "error": ...}}
         self.executor = ThreadPoolExecutor(max_workers=1) # Solo una transcripción a la vez para no saturar CPU/GPU
 
+    @property
+    def tasks(self) -> StateNamespace:
+        # Estado de las tareas en el backend compartido: cualquier proceso de uvicorn puede consultarlo
+        if self._tasks is None:
+            self._tasks = get_state_backend().namespace("transcription_jobs", ttl=settings.transcription_job_ttl)
+        return self._tasks
+
+    def _update_task(self, task_id: str, **fields):
+        self.tasks.update(task_id, lambda task: {**(task or {}), **fields})
+
     def load_model(self):
         if not self.model:
             print("[TranscriptionService] 📥 Cargando modelo Whisper 'base'...")
@@ -26,7 +39,7 @@ class TranscriptionService:
 
     def _run_transcription(self, task_id: str, video_path: str):
         try:
-            self.tasks[task_id]["status"] = "processing"
+            self._update_task(task_id, status="processing")
             print(f"[TranscriptionService] 🎙️ Iniciando transcripción para tarea {task_id}...")
             
             # Cargar modelo si no existe (lazy loading en el hilo del worker o antes)
@@ -38,14 +51,12 @@ class TranscriptionService:
             result = self.model.transcribe(video_path, fp16=False) # fp16=False para compatibilidad CPU si no hay CUDA
             text = result["text"].strip()
             
-            self.tasks[task_id]["status"] = "completed"
-            self.tasks[task_id]["text"] = text
+            self._update_task(task_id, status="completed", text=text)
             print(f"[TranscriptionService] ✅ Transcripción completada para {task_id}")
             
         except Exception as e:
             print(f"[TranscriptionService] ❌ Error en transcripción {task_id}: {e}")
-            self.tasks[task_id]["status"] = "failed"
-            self.tasks[task_id]["error"] = str(e)
+            self._update_task(task_id, status="failed", error=str(e))
         finally:
             # Limpieza del archivo temporal
             if os.path.exists(video_path):
@@ -54,9 +65,9 @@ class TranscriptionService:
                 except:
                     pass
 
-    def start_transcription(self, video_path: str) -> str:
+    async def start_transcription(self, video_path: str) -> str:
         task_id = str(uuid.uuid4())
-        self.tasks[task_id] = {"status": "pending", "text": None}
+        await self.tasks.aset(task_id, {"status": "pending", "text": None})
         
         # Ejecutar en background (ThreadPool) para no bloquear el loop de asyncio
         # FastAPI BackgroundTasks ejecuta en threadpool por defecto, pero aquí lo gestionamos manualmente 
@@ -68,7 +79,7 @@ class TranscriptionService:
         
         return task_id
 
-    def get_task_status(self, task_id: str):
-        return self.tasks.get(task_id, None)
+    async def get_task_status(self, task_id: str):
+        return await self.tasks.aget(task_id)
 
 transcription_service = TranscriptionService()
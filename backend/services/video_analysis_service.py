@@ -0,0 +1,411 @@
+"""
+Análisis offline de la atención en videos grabados.
+
+El video se divide en segmentos de duración fija que los procesos de inferencia
+del análisis analizan en paralelo: cada trabajador abre el archivo con
+cv2.VideoCapture, se sitúa al inicio de su segmento y lo recorre frame a frame,
+decodificando solo los frames muestreados. Estos procesos forman un pool propio
+(video_analysis_workers), separado del de tiempo real, para que un análisis no
+retrase los frames en vivo ni llene la cola que vigila el control de admisión. El resultado es una línea de tiempo con una fila por
+segundo de video que se escribe en disco a medida que llegan los segmentos, de
+modo que la memoria usada no depende de la duración del video.
+
+Uso desde la línea de comandos (desde backend/):
+    python -m services.video_analysis_service video.mp4 --output timeline.jsonl
+"""
+import asyncio
+import inspect
+import json
+import math
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from core.config import settings
+from services.state_backend import StateNamespace, get_state_backend
+
+
+# Sufijo de los archivos de línea de tiempo en video_analysis_dir
+_TIMELINE_SUFFIX = ".timeline.jsonl"
+
+
+def _is_attentive(analysis: Any) -> bool:
+    """Un frame es atento si hay rostro y mira aproximadamente al frente."""
+    features = analysis.features
+    return bool(analysis.face_detected) and features is not None and (
+        abs(features.yaw) <= settings.classroom_max_yaw
+        and abs(features.pitch) <= settings.classroom_max_pitch
+    )
+
+
+def analyze_video_segment(
+    video_path: str,
+    start_second: int,
+    end_second: Optional[int],
+    sample_fps: float,
+    pipeline: Any,
+    target_side: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Analiza un segmento de un video y devuelve su línea de tiempo por segundo.
+
+    Se ejecuta en un proceso trabajador: pipeline es un AttentionPipeline en modo
+    streaming (con ROI entre frames) reservado para el segmento.
+
+    Los frames muestreados siguen una rejilla común a todo el video. Un segmento
+    que no empieza en 0 analiza primero el último frame muestreado del segmento
+    anterior, solo para partir de su estado de parpadeo (y de su ROI): ese frame
+    no entra en las filas, y un parpadeo que cruza el límite se cuenta una vez.
+
+    Args:
+        video_path: Ruta del archivo de video
+        start_second: Segundo de inicio del segmento
+        end_second: Segundo final (exclusivo) o None para llegar al final del video
+        sample_fps: Frames por segundo que se analizan
+        pipeline: Pipeline de atención del trabajador
+        target_side: Lado mayor al que se reducen los frames antes de analizarlos (0 = sin reducir)
+
+    Returns:
+        Lista de filas {"second", "frames", "face_ratio", "blinks", "mean_ear", "attention"}
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el video: {video_path}")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        start_frame = int(round(start_second * fps))
+        end_frame = int(round(end_second * fps)) if end_second is not None else None
+
+        # Cada cuántos frames de video se analiza uno (al menos uno por frame)
+        step = max(1.0, fps / sample_fps) if sample_fps > 0 else 1.0
+        # Primer frame de la rejilla de muestreo (frames int(k * step)) dentro del segmento
+        first_sample = math.ceil(start_frame / step - 1e-9)
+        next_sample = first_sample * step
+
+        rows: List[Dict[str, Any]] = []
+        current = None
+        blinking = False
+        resized: Optional[np.ndarray] = None
+
+        def fit(img: np.ndarray) -> np.ndarray:
+            nonlocal resized
+            if target_side and max(img.shape[:2]) > target_side:
+                scale = target_side / max(img.shape[:2])
+                shape = (max(1, round(img.shape[0] * scale)), max(1, round(img.shape[1] * scale)), 3)
+                if resized is None or resized.shape != shape:
+                    resized = np.empty(shape, dtype=np.uint8)
+                img = cv2.resize(img, (shape[1], shape[0]), dst=resized, interpolation=cv2.INTER_AREA)
+            return img
+
+        frame_index = start_frame
+        if first_sample > 0:
+            # Último frame muestreado por el segmento anterior: fija el estado inicial
+            lead_frame = int((first_sample - 1) * step)
+            capture.set(cv2.CAP_PROP_POS_FRAMES, lead_frame)
+            ok, img = capture.read()
+            if ok:
+                blinking = pipeline.process(fit(img)).blink.blinking
+                frame_index = lead_frame + 1
+            else:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        while end_frame is None or frame_index < end_frame:
+            if frame_index < int(next_sample):
+                # Frame no muestreado: avanzar sin convertirlo a imagen
+                if not capture.grab():
+                    break
+                frame_index += 1
+                continue
+
+            ok, img = capture.read()
+            if not ok:
+                break
+            second = int(frame_index / fps)
+            frame_index += 1
+            next_sample += step
+
+            analysis = pipeline.process(fit(img))
+
+            if current is None or current["second"] != second:
+                current = {"second": second, "frames": 0, "faces": 0, "blinks": 0, "ear_sum": 0.0, "attentive": 0}
+                rows.append(current)
+            current["frames"] += 1
+            if analysis.face_detected:
+                current["faces"] += 1
+                current["ear_sum"] += (analysis.blink.left_ear + analysis.blink.right_ear) / 2.0
+            if _is_attentive(analysis):
+                current["attentive"] += 1
+
+            # Un parpadeo se cuenta al pasar de ojos abiertos a cerrados
+            if analysis.blink.blinking and not blinking:
+                current["blinks"] += 1
+            blinking = analysis.blink.blinking
+    finally:
+        capture.release()
+
+    return [
+        {
+            "second": row["second"],
+            "frames": row["frames"],
+            "face_ratio": round(row["faces"] / row["frames"], 3),
+            "blinks": row["blinks"],
+            "mean_ear": round(row["ear_sum"] / row["faces"], 3) if row["faces"] else 0.0,
+            "attention": round(row["attentive"] / row["frames"], 3)
+        }
+        for row in rows
+    ]
+
+
+def read_video_duration(video_path: str) -> Optional[float]:
+    """
+    Obtiene la duración de un video en segundos a partir de su cabecera.
+
+    Returns:
+        Duración en segundos o None si el contenedor no la indica
+
+    Raises:
+        ValueError: Si el archivo no se puede abrir como video
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el video: {video_path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        capture.release()
+    if fps <= 0 or frame_count <= 0:
+        return None
+    return frame_count / fps
+
+
+async def analyze_video(
+    video_path: str,
+    output_path: str,
+    sample_fps: Optional[float] = None,
+    on_progress: Optional[Callable[[float], Any]] = None
+) -> Dict[str, Any]:
+    """
+    Analiza un video completo repartiendo sus segmentos entre los procesos de
+    inferencia del análisis y escribe la línea de tiempo (una fila JSON por
+    segundo) en output_path.
+
+    Como máximo hay dos segmentos en curso por trabajador, y las filas se escriben
+    en orden en cuanto llega cada segmento.
+
+    Args:
+        video_path: Ruta del archivo de video
+        output_path: Ruta del archivo JSON Lines de salida
+        sample_fps: Frames por segundo que se analizan (por defecto, el de la configuración)
+        on_progress: Callback opcional con la fracción procesada (0-1); puede ser una corrutina
+
+    Returns:
+        dict: Resumen del análisis (segundos, frames, parpadeos, atención media...)
+    """
+    from services.inference_executor import get_video_analysis_executor
+
+    sample_fps = settings.video_sample_fps if sample_fps is None else sample_fps
+    duration = read_video_duration(video_path)
+
+    # Segmentos de video_segment_seconds; sin duración conocida se procesa de una vez
+    segment_seconds = max(1, settings.video_segment_seconds)
+    if duration is None:
+        segments = [(0, None)]
+    else:
+        total = max(1, math.ceil(duration))
+        segments = [(start, min(start + segment_seconds, total)) for start in range(0, total, segment_seconds)]
+
+    executor = get_video_analysis_executor()
+    window = max(1, executor.num_workers * 2)
+    summary = {"seconds": 0, "frames": 0, "blinks": 0, "face_seconds": 0, "attention": 0.0}
+    attention_sum = 0.0
+
+    def submit(segment):
+        start, end = segment
+        return asyncio.ensure_future(executor.submit(
+            "video_segment",
+            path=os.path.abspath(video_path),
+            start_second=start,
+            end_second=end,
+            sample_fps=sample_fps
+        ))
+
+    pending = deque()
+    done = 0
+    try:
+        with open(output_path, "w", encoding="utf-8") as output:
+            for segment in segments:
+                pending.append(submit(segment))
+                if len(pending) < window:
+                    continue
+                rows = await pending.popleft()
+                done += 1
+                attention_sum += _write_rows(output, rows, summary)
+                await _report_progress(on_progress, done / len(segments))
+
+            while pending:
+                rows = await pending.popleft()
+                done += 1
+                attention_sum += _write_rows(output, rows, summary)
+                await _report_progress(on_progress, done / len(segments))
+    finally:
+        for future in pending:
+            future.cancel()
+
+    if summary["seconds"]:
+        summary["attention"] = round(attention_sum / summary["seconds"], 3)
+    return summary
+
+
+async def _report_progress(on_progress: Optional[Callable[[float], Any]], progress: float) -> None:
+    if on_progress is not None:
+        result = on_progress(progress)
+        if inspect.isawaitable(result):
+            await result
+
+
+def _write_rows(output, rows: List[Dict[str, Any]], summary: Dict[str, Any]) -> float:
+    """Escribe las filas de un segmento, actualiza el resumen y devuelve la suma de su atención."""
+    attention_sum = 0.0
+    for row in rows:
+        output.write(json.dumps(row) + "\n")
+        summary["seconds"] += 1
+        summary["frames"] += row["frames"]
+        summary["blinks"] += row["blinks"]
+        if row["face_ratio"] > 0:
+            summary["face_seconds"] += 1
+        attention_sum += row["attention"]
+    return attention_sum
+
+
+class VideoAnalysisService:
+    """
+    Tareas de análisis de video en segundo plano, consultables por task_id.
+
+    El estado de las tareas se guarda en el backend de estado (cualquier proceso
+    de uvicorn puede consultarlo) y caduca a los video_analysis_job_ttl segundos;
+    las líneas de tiempo se borran del disco cuando caduca su tarea, y la de un
+    análisis fallido, en cuanto falla.
+    """
+
+    def __init__(self):
+        self._tasks: Optional[StateNamespace] = None  # {task_id: {"status": "pending"|"processing"|"completed"|"failed", ...}}
+        self._running: set = set()
+        os.makedirs(settings.video_analysis_dir, exist_ok=True)
+
+    @property
+    def tasks(self) -> StateNamespace:
+        if self._tasks is None:
+            self._tasks = get_state_backend().namespace("video_analysis_jobs", ttl=settings.video_analysis_job_ttl)
+        return self._tasks
+
+    async def _update_task(self, task_id: str, **fields) -> None:
+        await self.tasks.aupdate(task_id, lambda task: {**(task or {}), **fields})
+
+    async def start_analysis(self, video_path: str, sample_fps: Optional[float] = None) -> str:
+        """
+        Inicia el análisis de un video en segundo plano (requiere un loop de asyncio en marcha).
+
+        El archivo de video se elimina al terminar.
+
+        Args:
+            video_path: Ruta del archivo de video
+            sample_fps: Frames por segundo que se analizan (por defecto, el de la configuración)
+
+        Returns:
+            str: Identificador de la tarea
+        """
+        self._remove_expired_timelines()
+        task_id = str(uuid.uuid4())
+        await self.tasks.aset(task_id, {"status": "pending", "progress": 0.0, "summary": None, "error": None})
+        task = asyncio.create_task(self._run_analysis(task_id, video_path, sample_fps))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task_id
+
+    async def _run_analysis(self, task_id: str, video_path: str, sample_fps: Optional[float]) -> None:
+        timeline_path = self.get_timeline_path(task_id)
+        try:
+            await self._update_task(task_id, status="processing")
+            print(f"[VideoAnalysis] 🎞️ Iniciando análisis para tarea {task_id}...")
+            summary = await analyze_video(
+                video_path,
+                timeline_path,
+                sample_fps=sample_fps,
+                on_progress=lambda progress: self._update_task(task_id, progress=round(progress, 3))
+            )
+            await self._update_task(task_id, status="completed", summary=summary)
+            print(f"[VideoAnalysis] ✅ Análisis completado para {task_id}")
+        except Exception as e:
+            print(f"[VideoAnalysis] ❌ Error en análisis {task_id}: {e}")
+            await self._update_task(task_id, status="failed", error=str(e))
+            # La línea de tiempo parcial no se puede descargar
+            _remove_file(timeline_path)
+        finally:
+            # Limpieza del archivo temporal
+            _remove_file(video_path)
+
+    def _remove_expired_timelines(self) -> None:
+        """Borra las líneas de tiempo de las tareas que ya caducaron."""
+        expires_before = time.time() - settings.video_analysis_job_ttl
+        try:
+            names = os.listdir(settings.video_analysis_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(settings.video_analysis_dir, name)
+            try:
+                if name.endswith(_TIMELINE_SUFFIX) and os.path.getmtime(path) < expires_before:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    async def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await self.tasks.aget(task_id)
+
+    def get_timeline_path(self, task_id: str) -> str:
+        """Ruta del archivo JSON Lines con la línea de tiempo de una tarea."""
+        return os.path.join(settings.video_analysis_dir, f"{task_id}{_TIMELINE_SUFFIX}")
+
+
+def _remove_file(path: str) -> None:
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+video_analysis_service = VideoAnalysisService()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from services.inference_executor import shutdown_inference_executor
+
+    parser = argparse.ArgumentParser(description="Analiza la atención en un video grabado")
+    parser.add_argument("video", help="Ruta del archivo de video")
+    parser.add_argument("--output", default=None, help="Archivo JSON Lines de salida (por defecto, <video>.timeline.jsonl)")
+    parser.add_argument("--sample-fps", type=float, default=None, help="Frames por segundo que se analizan")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.splitext(args.video)[0] + ".timeline.jsonl"
+    try:
+        result = asyncio.run(analyze_video(
+            args.video,
+            output_path,
+            sample_fps=args.sample_fps,
+            on_progress=lambda progress: print(f"\r[VideoAnalysis] {progress:.0%}", end="", flush=True)
+        ))
+        print()
+        print(json.dumps(result, indent=2))
+        print(f"[VideoAnalysis] ✅ Línea de tiempo escrita en {output_path}")
+    finally:
+        shutdown_inference_executor()
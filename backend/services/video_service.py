@@ -1,5 +1,6 @@
 import os
 import shutil
+import uuid
 from fastapi import UploadFile
 from core.config import settings
 # import moviepy.editor as mp # Commented out until really needed to avoid import errors if install fails
@@ -13,8 +14,14 @@ class VideoService:
     async def save_upload_locally(self, file: UploadFile) -> str:
         """
         Saves an uploaded file to a temporary local path.
+        The file gets a unique name (only the client's extension is kept), so
+        concurrent uploads never overwrite each other and the client's filename
+        cannot point outside upload_dir.
         """
-        file_path = os.path.join(self.upload_dir, file.filename)
+        extension = os.path.splitext(os.path.basename(file.filename or ""))[1].lower()
+        if not extension[1:].isalnum():
+            extension = ""
+        file_path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}{extension}")
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         return file_path
@@ -0,0 +1,40 @@
+"""
+Configuración común de las pruebas.
+
+Se ejecutan desde backend/ (python -m pytest -q) y no necesitan Supabase, los
+modelos ni los procesos de inferencia.
+"""
+import os
+
+# La configuración exige las credenciales de Supabase aunque las pruebas no las usen
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+import pytest
+
+from services import state_backend
+
+
+def _install_backend(monkeypatch, backend: state_backend.StateBackend):
+    monkeypatch.setattr(state_backend, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def memory_backend(monkeypatch):
+    """Backend de estado global en memoria, nuevo en cada prueba."""
+    yield _install_backend(monkeypatch, state_backend.MemoryStateBackend())
+    state_backend.shutdown_state_backend()
+
+
+@pytest.fixture
+def sqlite_backend(monkeypatch, tmp_path):
+    """Backend de estado global en un archivo SQLite temporal."""
+    yield _install_backend(monkeypatch, state_backend.SQLiteStateBackend(str(tmp_path / "state.sqlite3")))
+    state_backend.shutdown_state_backend()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request):
+    """Backend de estado global: la prueba se ejecuta con cada tipo."""
+    return request.getfixturevalue(f"{request.param}_backend")
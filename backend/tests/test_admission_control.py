@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+
+from services import admission_control
+from services.admission_control import AdmissionController, AdmissionRejected
+
+
+class FakeExecutor:
+    """Ejecutor de inferencia con carga fijada por la prueba."""
+
+    def __init__(self, num_workers: int = 2):
+        self.num_workers = num_workers
+        self.latency_ewma = 0.0
+        self.pending = 0
+        self.batch_pending = 0
+
+    def get_pending_count(self, session_prefix=None) -> int:
+        if session_prefix == admission_control.BATCH_SESSION_PREFIX:
+            return self.batch_pending
+        return self.pending
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = FakeExecutor()
+    monkeypatch.setattr(admission_control, "get_inference_executor", lambda: executor)
+    return executor
+
+
+def _controller(**kwargs) -> AdmissionController:
+    limits = {"max_streams": 2, "max_queue_depth": 4, "frame_deadline": 0.1, "max_batch_frames": 10}
+    return AdmissionController(**{**limits, **kwargs})
+
+
+async def _sleep(seconds: float, result=None):
+    await asyncio.sleep(seconds)
+    return result
+
+
+def test_automatic_limits_scale_with_workers(executor):
+    controller = AdmissionController(max_streams=0, max_queue_depth=0, max_batch_frames=0)
+
+    assert controller.max_streams == 8 * executor.num_workers
+    assert controller.max_queue_depth == 4 * executor.num_workers
+    assert controller.max_batch_frames == admission_control.settings.blink_batch_max_frames * executor.num_workers
+
+
+def test_streams_limit(executor):
+    controller = _controller()
+    controller.open_stream("a")
+    controller.open_stream("b")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.open_stream("c")
+    assert rejected.value.reason == "streams"
+    assert controller.rejected_streams == 1
+
+    controller.close_stream("a")
+    controller.open_stream("c")
+    assert controller.streams == {"b", "c"}
+
+
+def test_queue_limit(executor):
+    controller = _controller()
+    executor.pending = 3
+    controller.check_frame()
+
+    executor.pending = 4
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check_frame(landmarks=True)
+
+    message = rejected.value.to_dict()
+    assert message["type"] == "busy" and message["reason"] == "queue"
+    assert message["retry_after"] > 0
+    assert message["degrade"]["mode"] == "landmarks"
+    assert int(rejected.value.retry_after_header) >= 1
+    assert controller.rejected_frames == 1
+
+
+def test_batch_quota_is_reserved_until_closed(executor):
+    controller = _controller()
+    controller.open_batch(6)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.open_batch(6)
+    assert rejected.value.reason == "batch"
+
+    controller.close_batch(6)
+    controller.open_batch(10)
+    assert controller.batch_frames == 10
+    assert controller.rejected_batches == 1
+
+
+def test_batch_rejected_when_live_queue_is_full(executor):
+    controller = _controller()
+    executor.pending = 4
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.open_batch(1)
+    assert rejected.value.reason == "queue"
+    assert controller.batch_frames == 0
+
+
+def test_batch_frames_do_not_fill_the_live_queue(executor):
+    controller = _controller()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def job(index):
+            await release.wait()
+            return index
+
+        controller.open_batch(8)
+        batch = asyncio.ensure_future(controller.run_batch([job(index) for index in range(8)]))
+        await asyncio.sleep(0)
+        # Los 8 frames del lote están pendientes en el ejecutor
+        executor.pending = executor.batch_pending = 8
+        controller.check_frame()
+        release.set()
+        results = await batch
+        executor.pending = executor.batch_pending = 0
+        controller.close_batch(8)
+        return results
+
+    assert asyncio.run(scenario()) == list(range(8))
+    assert controller._queue_depth() == 0 and controller.batch_frames == 0
+
+
+def test_deadline_applies_once_latency_is_known(executor):
+    controller = _controller(frame_deadline=0.05)
+
+    # Sin latencias medidas (modelos cargando) no hay plazo
+    assert asyncio.run(controller.run(_sleep(0.1, "slow"))) == "slow"
+
+    executor.latency_ewma = 0.01
+    assert asyncio.run(controller.run(_sleep(0.0, "fast"))) == "fast"
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(controller.run(_sleep(0.2)))
+    assert rejected.value.reason == "deadline"
+    assert controller.expired_frames == 1
+
+
+def test_batch_deadline_grows_with_frames(executor):
+    controller = _controller(frame_deadline=0.05)
+    executor.latency_ewma = 0.02
+
+    # 10 frames: plazo 0.05 + 10 * 0.02 = 0.25 s, más que el plazo por frame
+    results = asyncio.run(controller.run_batch([_sleep(0.15, index) for index in range(10)]))
+    assert results == list(range(10))
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(controller.run_batch([_sleep(0.5) for _ in range(2)]))
+    assert rejected.value.reason == "deadline"
+    assert controller.expired_frames == 2
+
+
+def test_expired_batch_frames_stay_out_of_the_live_queue(executor):
+    controller = _controller()
+
+    # El plazo del lote venció pero el trabajador aún no ha descartado sus 3 frames
+    executor.pending = 5
+    executor.batch_pending = 3
+    controller.check_frame(frames=2)
+
+    with pytest.raises(AdmissionRejected):
+        controller.check_frame(frames=3)
+
+
+def test_landmarks_mode_only_suggested_when_usable(executor):
+    controller = _controller()
+    executor.pending = 4
+
+    with pytest.raises(AdmissionRejected) as batch:
+        controller.open_batch(1)
+    with pytest.raises(AdmissionRejected) as frame:
+        controller.check_frame()
+
+    assert "mode" not in batch.value.degrade and "mode" not in frame.value.degrade
+    assert batch.value.degrade["max_side"] > 0
+    assert controller._degrade(landmarks=True)["mode"] == "landmarks"
+
+
+def test_degrade_fps_follows_capacity(executor):
+    controller = _controller(max_streams=100)
+    executor.latency_ewma = 0.1
+    for index in range(40):
+        controller.open_stream(str(index))
+
+    fps = controller._degrade()["fps"]
+
+    settings = admission_control.settings
+    assert settings.capture_min_fps <= fps <= settings.capture_idle_fps
+    assert controller.get_stats()["streams"] == 40
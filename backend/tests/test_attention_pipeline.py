@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from services.attention_pipeline import AttentionPipeline
+
+
+def _face(low: float, high: float, count: int = 478):
+    """Landmarks repartidos en [low, high] del recorte (coordenadas normalizadas)."""
+    values = np.linspace(low, high, count)
+    return SimpleNamespace(landmark=[SimpleNamespace(x=v, y=v, z=0.0) for v in values])
+
+
+class _FaceDetector:
+    def locate_face(self, img):
+        return 200, 120, 160, 160, 0.9
+
+
+class _BlinkDetector:
+    ear_threshold = 0.2
+
+    def __init__(self, faces):
+        self.faces = list(faces)
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+    def detect_landmarks(self, crop):
+        return self.faces.pop(0)
+
+
+def test_face_mesh_resets_when_roi_changes():
+    centered = _face(0.2, 0.8)
+    blink = _BlinkDetector([centered, centered, _face(0.8, 0.99), centered])
+    pipeline = AttentionPipeline(_FaceDetector(), blink, roi_margin=0.25, roi_max_side=0)
+    img = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    resets = []
+    for _ in range(4):
+        assert pipeline.process(img).face_detected
+        resets.append(blink.resets)
+
+    # Mismo recorte en los dos primeros frames; el rostro cerca del borde obliga a
+    # recentrar la ROI y el cuarto frame ya se sigue sobre un recorte nuevo
+    assert resets == [1, 1, 1, 2]
+
+
+def test_reset_restarts_face_mesh_tracking():
+    centered = _face(0.2, 0.8)
+    blink = _BlinkDetector([centered, centered])
+    pipeline = AttentionPipeline(_FaceDetector(), blink, roi_margin=0.25, roi_max_side=0)
+    img = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    pipeline.process(img)
+    pipeline.reset()
+    pipeline.process(img)
+
+    assert blink.resets == 2
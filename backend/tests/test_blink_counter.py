@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+from services import blink_counter
+from services.blink_counter import BlinkCounterStore
+
+
+def _store(backend, **kwargs) -> BlinkCounterStore:
+    namespace = backend.namespace(
+        f"blinks_{time.monotonic_ns()}",
+        ttl=kwargs.pop("ttl", 0.0),
+        max_keys=kwargs.pop("max_keys", 0)
+    )
+    return BlinkCounterStore(namespace, poll_interval=0.05, **kwargs)
+
+
+async def _notified(subscription, timeout: float = 2.0) -> bool:
+    return await asyncio.wait_for(subscription.wait(), timeout)
+
+
+def test_increment_get_reset(backend):
+    store = _store(backend)
+
+    async def scenario():
+        counts = [await store.increment("s1") for _ in range(3)]
+        await store.increment("s2")
+        before = await store.get("s1")
+        await store.reset("s1")
+        return counts, before, await store.get("s1"), await store.get("s2")
+
+    assert asyncio.run(scenario()) == ([1, 2, 3], 3, 0, 1)
+
+
+def test_snapshot_reports_rate(backend):
+    store = _store(backend, rate_window=60.0)
+
+    async def scenario():
+        for offset in range(6):
+            await store.increment("s1", now=1000.0 + offset)
+        return await store.snapshot(["s1", "missing"], now=1005.0), await store.snapshot(now=1005.0)
+
+    selected, everything = asyncio.run(scenario())
+
+    assert selected["missing"] == {"blink_count": 0, "last_blink_at": None, "blink_rate": 0.0}
+    assert selected["s1"]["blink_count"] == 6
+    assert selected["s1"]["last_blink_at"] == 1005.0
+    # 6 parpadeos en 5 s, con poco decaimiento en una ventana de 60 s: algo menos de 6 por minuto
+    assert 5.0 < selected["s1"]["blink_rate"] <= 6.0
+    assert everything == {"s1": selected["s1"]}
+
+
+def test_subscribers_notified_on_increment_and_reset(backend):
+    store = _store(backend)
+
+    async def scenario():
+        subscription = await store.subscribe("s1")
+        await store.increment("s1")
+        incremented = await _notified(subscription)
+        await store.reset("s1")
+        reset = await _notified(subscription)
+        subscription.close()
+        closed = await _notified(subscription)
+        return incremented, reset, closed, store.get_subscriber_count()
+
+    assert asyncio.run(scenario()) == (True, True, False, 0)
+
+
+def test_subscribers_notified_on_lru_eviction(backend):
+    store = _store(backend, max_keys=2)
+
+    async def scenario():
+        await store.increment("watched")
+        subscription = await store.subscribe("watched")
+        await store.increment("b")
+        await store.increment("c")
+        if hasattr(store.counters, "prune"):
+            store.counters.prune()
+        notified = await _notified(subscription)
+        count = await store.get("watched")
+        subscription.close()
+        return notified, count
+
+    assert asyncio.run(scenario()) == (True, 0)
+
+
+def test_subscribers_notified_on_ttl_expiry(backend):
+    store = _store(backend, ttl=0.3)
+
+    async def scenario():
+        await store.increment("watched")
+        subscription = await store.subscribe("watched")
+        started = time.monotonic()
+        notified = await _notified(subscription)
+        waited = time.monotonic() - started
+        count = await store.get("watched")
+        subscription.close()
+        return notified, waited, count
+
+    notified, waited, count = asyncio.run(scenario())
+
+    assert notified and count == 0
+    assert waited >= 0.2
+
+
+def test_subscribers_notified_on_external_change(backend):
+    store = _store(backend)
+
+    async def scenario():
+        await store.increment("watched")
+        subscription = await store.subscribe("watched")
+        # Otro proceso escribe directamente en el backend
+        await store.counters.aupdate("watched", lambda record: [record[0] + 1, *record[1:]])
+        changed = await _notified(subscription)
+        await store.counters.adelete("watched")
+        deleted = await _notified(subscription)
+        subscription.close()
+        await asyncio.sleep(0.2)
+        return changed, deleted, store._poller is None
+
+    assert asyncio.run(scenario()) == (True, True, True)
+
+
+def test_module_functions_use_global_store(memory_backend, monkeypatch):
+    monkeypatch.setattr(blink_counter, "_store", None)
+
+    async def scenario():
+        await blink_counter.increment_blink_count("s1")
+        await blink_counter.increment_blink_count()
+        count = await blink_counter.get_blink_count("s1")
+        await blink_counter.reset_blink_count("s1")
+        return count, await blink_counter.get_blink_count("s1"), await blink_counter.get_blink_count()
+
+    assert asyncio.run(scenario()) == (1, 0, 1)
@@ -0,0 +1,77 @@
+from typing import Optional
+
+from models.schemas import AttentionAnalysisResponse, AttentionFeatures, Coordinates
+from services.classroom_tracker import ClassroomTracker
+
+
+def _face(x: int, y: int, size: int = 40, blinking: bool = False, yaw: Optional[float] = 0.0) -> AttentionAnalysisResponse:
+    features = None
+    if yaw is not None:
+        features = AttentionFeatures(mouth_aspect_ratio=0.1, yaw=yaw, pitch=0.0, roll=0.0, gaze_x=0.0, gaze_y=0.0)
+    return AttentionAnalysisResponse(
+        detected=True,
+        coordinates=Coordinates(x=x, y=y, w=size, h=size),
+        confidence=0.9,
+        blinking=blinking,
+        left_ear=0.1 if blinking else 0.3,
+        right_ear=0.1 if blinking else 0.3,
+        features=features
+    )
+
+
+def _ids(faces):
+    return [face.face_id for face in faces]
+
+
+def test_ids_persist_while_faces_move():
+    tracker = ClassroomTracker(iou_threshold=0.3, max_missed=2)
+    first = tracker.update([_face(0, 0), _face(200, 0)])
+    # Desplazamiento pequeño (solapamiento alto) y detecciones en otro orden
+    second = tracker.update([_face(205, 3), _face(4, 2)])
+
+    assert sorted(_ids(first)) == [1, 2]
+    assert {face.face_id: face.box[0] for face in second} == {1: 4, 2: 205}
+
+
+def test_centroid_fallback_for_fast_moves():
+    tracker = ClassroomTracker(iou_threshold=0.3, max_missed=2)
+    tracker.update([_face(0, 0)])
+    # IoU bajo el umbral, pero el centro se mueve menos de medio rostro
+    moved = tracker.update([_face(15, 0, size=10)])
+    far = tracker.update([_face(300, 300)])
+
+    assert _ids(moved) == [1]
+    assert _ids(far) == [2]
+
+
+def test_missed_faces_are_forgotten():
+    tracker = ClassroomTracker(iou_threshold=0.3, max_missed=2)
+    tracker.update([_face(0, 0), _face(200, 0)])
+    for _ in range(2):
+        tracker.update([_face(0, 0)])
+    assert sorted(tracker.faces) == [1, 2]
+
+    tracker.update([_face(0, 0)])
+    assert sorted(tracker.faces) == [1]
+    # Reaparece con una identidad nueva
+    assert _ids(tracker.update([_face(0, 0), _face(200, 0)])) == [1, 3]
+
+
+def test_per_face_blinks_and_attention():
+    tracker = ClassroomTracker(iou_threshold=0.3, max_missed=2)
+    for blinking in (False, True, True, False, True):
+        faces = tracker.update([_face(0, 0, blinking=blinking), _face(200, 0, yaw=60.0)])
+
+    states = {face.face_id: face.to_dict() for face in faces}
+    assert states[1]["blink_count"] == 2
+    assert states[1]["attentive"] and states[1]["attention_ratio"] == 1.0
+    assert states[2]["blink_count"] == 0
+    assert not states[2]["attentive"] and states[2]["attention_ratio"] == 0.0
+
+
+def test_detections_without_coordinates_are_ignored():
+    tracker = ClassroomTracker()
+    missing = AttentionAnalysisResponse(detected=False, confidence=0.0, blinking=False, left_ear=0.0, right_ear=0.0)
+
+    assert tracker.update([missing]) == []
+    assert tracker.faces == {}
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from endpoints.api import detect
+from models.schemas import BlinkBatchRequest
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(detect.router)
+    return TestClient(app)
+
+
+def test_body_validation_error_drops_url_and_prefixes_body():
+    with pytest.raises(ValidationError) as error:
+        BlinkBatchRequest(images="no es una lista")
+
+    errors = detect._body_validation_error(error.value).errors()
+
+    assert errors and all("url" not in item for item in errors)
+    assert all(item["loc"][:2] == ("body", "images") for item in errors)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"content": b"{no json", "headers": {"content-type": "application/json"}},
+    {"json": ["imagen"]},
+    {"json": {}},
+    {"json": {"images": "imagen"}},
+])
+def test_malformed_batch_returns_422(client, kwargs):
+    response = client.post("/detect/blink/batch", **kwargs)
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
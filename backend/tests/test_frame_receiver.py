@@ -0,0 +1,49 @@
+import asyncio
+
+from utils.frame_receiver import image_from_message, receive_frames
+from utils.frame_slot import LatestFrameSlot
+
+
+class FakeWebSocket:
+    """WebSocket que entrega una lista fija de mensajes y luego se desconecta."""
+
+    def __init__(self, messages):
+        self.messages = list(messages) + [{"type": "websocket.disconnect"}]
+
+    async def receive(self):
+        return self.messages.pop(0)
+
+
+def _text_frame(message):
+    if isinstance(message, dict) and message.get("type") == "hello":
+        return None
+    return ("text", image_from_message(message))
+
+
+def test_receiver_keeps_latest_frame_and_reports_errors():
+    websocket = FakeWebSocket([
+        {"type": "websocket.receive", "bytes": b"a"},
+        {"type": "websocket.receive", "text": "no es JSON"},
+        {"type": "websocket.receive", "text": '{"type": "hello"}'},
+        {"type": "websocket.receive", "text": "[1, 2]"},
+        {"type": "websocket.receive", "text": '{"image": "b64"}'},
+    ])
+    sent = []
+
+    async def send_json(payload):
+        sent.append(payload["error"])
+
+    async def scenario():
+        slot = LatestFrameSlot()
+        await receive_frames(websocket, slot, send_json, lambda data: ("bytes", data), _text_frame)
+        return await slot.get(), await slot.get(), slot.received, slot.dropped
+
+    latest, closed, received, dropped = asyncio.run(scenario())
+
+    assert latest == (2, ("text", "b64"))
+    assert closed is None
+    assert (received, dropped) == (2, 1)
+    assert sent == [
+        "El mensaje debe ser un JSON válido",
+        "El mensaje debe contener el campo 'image' con la imagen en Base64",
+    ]
@@ -0,0 +1,69 @@
+import numpy as np
+
+from services.frame_similarity import FrameSimilarityFilter
+
+
+def _frame(value: int = 120, height: int = 240, width: int = 320) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    frame = np.full((height, width, 3), value, dtype=np.uint8)
+    # Textura fija para que la miniatura no sea uniforme
+    frame[:, :, 0] = rng.integers(0, 255, (height, width), dtype=np.uint8)
+    return frame
+
+
+def test_identical_and_noisy_frames_are_duplicates():
+    similarity = FrameSimilarityFilter(tolerance=4.0)
+    frame = _frame()
+    noisy = np.clip(frame.astype(np.int16) + np.random.default_rng(1).integers(-2, 3, frame.shape), 0, 255).astype(np.uint8)
+
+    assert not similarity.is_duplicate(frame)
+    assert similarity.is_duplicate(frame)
+    assert similarity.is_duplicate(noisy)
+    assert similarity.skip_ratio == 2 / 3
+
+
+def test_small_local_change_is_not_a_duplicate():
+    similarity = FrameSimilarityFilter(tolerance=4.0)
+    frame = _frame()
+    similarity.is_duplicate(frame)
+
+    # Región del tamaño de un ojo que se oscurece: la media global apenas cambia
+    changed = frame.copy()
+    changed[100:120, 100:140] = 0
+
+    assert not similarity.is_duplicate(changed)
+
+
+def test_max_reuse_forces_inference():
+    similarity = FrameSimilarityFilter(tolerance=4.0, max_reuse=2)
+    frame = _frame()
+
+    assert [similarity.is_duplicate(frame) for _ in range(5)] == [False, True, True, False, True]
+
+
+def test_slow_drift_is_compared_with_last_processed_frame():
+    similarity = FrameSimilarityFilter(tolerance=4.0, max_reuse=100)
+    results = [similarity.is_duplicate(_frame(value)) for value in range(100, 120, 2)]
+
+    # Cada paso es menor que la tolerancia, pero la deriva acumulada fuerza nuevas inferencias
+    assert results[0] is False
+    assert False in results[1:]
+
+
+def test_disabled_and_reset():
+    disabled = FrameSimilarityFilter(tolerance=0)
+    frame = _frame()
+    assert not disabled.is_duplicate(frame)
+    assert not disabled.is_duplicate(frame)
+
+    similarity = FrameSimilarityFilter()
+    similarity.is_duplicate(frame)
+    similarity.reset()
+    assert not similarity.is_duplicate(frame)
+
+
+def test_resolution_change_is_not_a_duplicate():
+    similarity = FrameSimilarityFilter()
+    similarity.is_duplicate(_frame(height=240, width=320))
+
+    assert not similarity.is_duplicate(_frame(height=320, width=320))
@@ -0,0 +1,45 @@
+import asyncio
+
+from utils.frame_slot import LatestFrameSlot
+
+
+def test_latest_frame_wins():
+    async def scenario():
+        slot = LatestFrameSlot()
+        sequences = [slot.put(frame) for frame in ("a", "b", "c")]
+        return sequences, await slot.get(), slot.received, slot.dropped
+
+    assert asyncio.run(scenario()) == ([1, 2, 3], (3, "c"), 3, 2)
+
+
+def test_get_waits_for_next_frame():
+    async def scenario():
+        slot = LatestFrameSlot()
+        waiter = asyncio.ensure_future(slot.get())
+        await asyncio.sleep(0)
+        pending = not waiter.done()
+        slot.put("a")
+        return pending, await waiter, slot.dropped
+
+    assert asyncio.run(scenario()) == (True, (1, "a"), 0)
+
+
+def test_close_drains_pending_frame_first():
+    async def scenario():
+        slot = LatestFrameSlot()
+        slot.put("a")
+        slot.close()
+        return await slot.get(), await slot.get()
+
+    assert asyncio.run(scenario()) == ((1, "a"), None)
+
+
+def test_close_wakes_waiting_consumer():
+    async def scenario():
+        slot = LatestFrameSlot()
+        waiter = asyncio.ensure_future(slot.get())
+        await asyncio.sleep(0)
+        slot.close()
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario()) is None
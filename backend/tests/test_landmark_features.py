@@ -0,0 +1,122 @@
+import math
+
+import numpy as np
+import pytest
+
+from services.landmark_features import (
+    LEFT_EYE_INDICES,
+    NUM_REFINED_LANDMARKS,
+    RIGHT_EYE_INDICES,
+    blink_from_ears,
+    compute_features,
+    eye_aspect_ratio,
+    evaluate_eye_points,
+    to_pixels,
+)
+
+
+def _eye(width: float = 4.0, opening: float = 1.0, x: float = 0.0) -> np.ndarray:
+    """Seis puntos [p1..p6]: comisuras p1/p4 y párpados p2/p6 y p3/p5."""
+    half = opening / 2.0
+    return np.array([
+        [x, 0.0],
+        [x + width / 3, -half],
+        [x + 2 * width / 3, -half],
+        [x + width, 0.0],
+        [x + 2 * width / 3, half],
+        [x + width / 3, half],
+    ])
+
+
+def _face(yaw: float = 0.0, pitch: float = 0.0, roll: float = 0.0, opening: float = 1.0) -> np.ndarray:
+    """Landmarks (478, 3) de un rostro plano girado los grados indicados."""
+    landmarks = np.zeros((NUM_REFINED_LANDMARKS, 3))
+    landmarks[234] = [-1.0, 0.0, 0.0]
+    landmarks[454] = [1.0, 0.0, 0.0]
+    landmarks[10] = [0.0, -1.0, 0.0]
+    landmarks[152] = [0.0, 1.0, 0.0]
+    landmarks[list(LEFT_EYE_INDICES), :2] = _eye(0.4, opening * 0.1, x=-0.6)
+    landmarks[list(RIGHT_EYE_INDICES), :2] = _eye(0.4, opening * 0.1, x=0.2)
+
+    a, b, c = np.radians([yaw, pitch, roll])
+    around_y = np.array([[math.cos(a), 0, math.sin(a)], [0, 1, 0], [-math.sin(a), 0, math.cos(a)]])
+    around_x = np.array([[1, 0, 0], [0, math.cos(b), -math.sin(b)], [0, math.sin(b), math.cos(b)]])
+    around_z = np.array([[math.cos(c), -math.sin(c), 0], [math.sin(c), math.cos(c), 0], [0, 0, 1]])
+    return landmarks @ (around_z @ around_x @ around_y).T
+
+
+def test_eye_aspect_ratio():
+    assert float(eye_aspect_ratio(_eye(4.0, 1.0))) == pytest.approx(0.25)
+    assert float(eye_aspect_ratio(_eye(4.0, 0.0))) == 0.0
+    # Comisuras coincidentes: 0 en lugar de dividir por cero
+    assert float(eye_aspect_ratio(np.zeros((6, 2)))) == 0.0
+
+
+def test_eye_aspect_ratio_is_vectorized():
+    eyes = np.stack([_eye(4.0, 1.0), _eye(4.0, 2.0), _eye(2.0, 1.0)])
+
+    np.testing.assert_allclose(eye_aspect_ratio(eyes), [0.25, 0.5, 0.5])
+
+
+def test_blink_threshold():
+    assert blink_from_ears(0.1, 0.1, ear_threshold=0.2).blinking
+    assert not blink_from_ears(0.3, 0.3, ear_threshold=0.2).blinking
+    result = evaluate_eye_points(_eye(4.0, 0.4), _eye(4.0, 0.4), ear_threshold=0.2)
+    assert result.blinking and result.left_ear == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize("ear", [0.0, float("nan"), float("inf")])
+def test_degenerate_ear_is_not_a_blink(ear):
+    result = blink_from_ears(ear, 0.3, ear_threshold=0.2)
+
+    assert not result.blinking
+    assert result.left_ear == 0.0 and result.right_ear == 0.0
+
+
+def test_to_pixels_scales_each_axis():
+    pixels = to_pixels(np.array([[0.5, 0.5, 0.1]]), (480, 640))
+
+    np.testing.assert_allclose(pixels, [[320.0, 240.0, 64.0]])
+
+
+def test_frontal_face_pose():
+    features = compute_features(_face())
+
+    assert features.left_ear == pytest.approx(0.25)
+    assert features.right_ear == pytest.approx(0.25)
+    assert features.yaw == pytest.approx(0.0, abs=1e-6)
+    assert features.pitch == pytest.approx(0.0, abs=1e-6)
+    assert features.roll == pytest.approx(0.0, abs=1e-6)
+    assert isinstance(features.yaw, float)
+
+
+@pytest.mark.parametrize("angle", [-40.0, -15.0, 15.0, 40.0])
+def test_head_pose_angles(angle):
+    assert abs(compute_features(_face(yaw=angle)).yaw) == pytest.approx(abs(angle), abs=1e-6)
+    assert abs(compute_features(_face(pitch=angle)).pitch) == pytest.approx(abs(angle), abs=1e-6)
+    assert compute_features(_face(roll=angle)).roll == pytest.approx(angle, abs=1e-6)
+
+
+def test_head_pose_sign_follows_rotation():
+    left, right = compute_features(_face(yaw=-20.0)).yaw, compute_features(_face(yaw=20.0)).yaw
+    up, down = compute_features(_face(pitch=-20.0)).pitch, compute_features(_face(pitch=20.0)).pitch
+
+    assert left == pytest.approx(-right) and left != 0
+    assert up == pytest.approx(-down) and up != 0
+
+
+def test_stacked_frames_match_single_frames():
+    frames = [_face(yaw=10.0), _face(pitch=-5.0, opening=0.3), _face(roll=30.0)]
+
+    stacked = compute_features(np.stack(frames))
+
+    for index, frame in enumerate(frames):
+        single = compute_features(frame)
+        for name in ("left_ear", "right_ear", "mouth_aspect_ratio", "yaw", "pitch", "roll", "gaze_x", "gaze_y"):
+            assert getattr(stacked, name)[index] == pytest.approx(getattr(single, name))
+
+
+def test_gaze_is_zero_without_iris_landmarks():
+    features = compute_features(_face()[:468])
+
+    assert features.gaze_x == 0.0 and features.gaze_y == 0.0
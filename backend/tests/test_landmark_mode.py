@@ -0,0 +1,52 @@
+import pytest
+
+from core.config import settings
+from endpoints.websockets.blink_detection import _evaluate_landmarks
+
+
+# Ojo con comisuras a 40 px y párpados separados 16 px: EAR 0.4 en píxeles
+_EYE_PIXELS = [[0, 0], [13, -8], [27, -8], [40, 0], [27, 8], [13, 8]]
+
+
+def _normalized(points, width, height):
+    return [[x / width, y / height] for x, y in points]
+
+
+def test_pixel_coordinates():
+    result = _evaluate_landmarks({"left_eye": _EYE_PIXELS, "right_eye": _EYE_PIXELS})
+
+    assert result["type"] == "landmarks"
+    assert result["left_ear"] == pytest.approx(0.4)
+    assert result["blinking"] == (0.4 < settings.ear_threshold)
+
+
+def test_normalized_coordinates_use_frame_aspect_ratio():
+    eye = _normalized(_EYE_PIXELS, 640, 360)
+
+    result = _evaluate_landmarks({"left_eye": eye, "right_eye": eye, "width": 640, "height": 360})
+
+    assert result["left_ear"] == pytest.approx(0.4)
+    assert result["right_ear"] == pytest.approx(0.4)
+
+
+def test_no_face():
+    result = _evaluate_landmarks({"left_eye": None, "right_eye": None})
+
+    assert result["type"] == "landmarks" and result["left_ear"] == 0.0
+
+
+@pytest.mark.parametrize("message", [
+    # Normalizadas sin tamaño del frame
+    {"left_eye": _normalized(_EYE_PIXELS, 640, 360), "right_eye": _normalized(_EYE_PIXELS, 640, 360)},
+    {"left_eye": _EYE_PIXELS, "right_eye": _EYE_PIXELS, "width": 640},
+    {"left_eye": _EYE_PIXELS, "right_eye": _EYE_PIXELS, "width": 0, "height": 360},
+    {"left_eye": _EYE_PIXELS[:5], "right_eye": _EYE_PIXELS},
+    {"left_eye": "ojos", "right_eye": _EYE_PIXELS},
+    # Puntos degenerados: comisuras coincidentes o coordenadas no finitas
+    {"left_eye": [[5, 5]] * 6, "right_eye": _EYE_PIXELS},
+    {"left_eye": [[float("nan"), 0]] + _EYE_PIXELS[1:], "right_eye": _EYE_PIXELS},
+    {"left_eye": _EYE_PIXELS, "right_eye": _EYE_PIXELS, "width": float("inf"), "height": 360},
+])
+def test_invalid_messages(message):
+    with pytest.raises(ValueError):
+        _evaluate_landmarks(message)
@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import pytest
+
+from services.live_attention import LiveAttentionHub, class_room, task_room
+from services.session_timeline import SessionTimeline
+
+
+def _hub(backend, session_ttl: float = 0.0) -> LiveAttentionHub:
+    suffix = time.monotonic_ns()
+    return LiveAttentionHub(
+        backend.namespace(f"live_sessions_{suffix}", ttl=session_ttl),
+        backend.namespace(f"live_rooms_{suffix}", ttl=10.0),
+        student_timeout=10.0,
+        recent_seconds=5
+    )
+
+
+def _snapshot(student_id: str, attention, level=None, face: bool = True):
+    return {"student_id": student_id, "face": face, "attention": attention, "attention_level": level}
+
+
+def test_aggregate_room(backend):
+    hub = _hub(backend)
+
+    async def scenario():
+        await hub.publish([task_room("t1"), class_room("c1")], "s2", _snapshot("bea", 0.9, "alto"))
+        await hub.publish([task_room("t1"), class_room("c1")], "s1", _snapshot("ana", 0.5, "medio"))
+        await hub.publish([task_room("t1")], "s3", _snapshot("carla", None, face=False))
+        # Otra clase cuyo id empieza igual: no debe colarse en la sala
+        await hub.publish([class_room("c10")], "s4", _snapshot("dani", 0.1, "bajo"))
+        return await hub.aggregate(class_room("c1")), await hub.aggregate(task_room("t1"))
+
+    by_class, by_task = asyncio.run(scenario())
+
+    assert by_class["type"] == "live" and by_class["room"] == "class:c1"
+    assert [row["session_id"] for row in by_class["students"]] == ["s1", "s2"]
+    assert by_class["summary"] == {
+        "students": 2,
+        "faces": 2,
+        "attention": 0.7,
+        "levels": {"alto": 1, "medio": 1, "bajo": 0}
+    }
+    assert by_task["summary"]["students"] == 3
+    assert by_task["summary"]["faces"] == 2
+    assert by_task["summary"]["attention"] == 0.7
+
+
+def test_empty_and_stale_rooms(backend):
+    hub = _hub(backend)
+
+    async def scenario():
+        empty = await hub.aggregate(class_room("c1"))
+        await hub.publish([class_room("c1")], "s1", _snapshot("ana", 0.5))
+        stale = await hub.aggregate(class_room("c1"), now=time.time() + 60)
+        return empty, stale
+
+    empty, stale = asyncio.run(scenario())
+
+    assert empty["students"] == [] and empty["summary"]["attention"] is None
+    assert stale["summary"]["students"] == 0
+
+
+def test_session_lifecycle(backend):
+    hub = _hub(backend)
+
+    async def scenario():
+        await hub.register_session("s1", "ana", "t1", "c1")
+        publisher = await hub.publisher("s1", interval=0.0)
+        timeline = SessionTimeline(max_frames=8, max_seconds=8)
+        timeline.append(0.3, 0.3, True, False, True)
+        await publisher.update(timeline, blink_count=4)
+        live = await hub.aggregate(class_room("c1"))
+        await hub.end_session("s1")
+        return (
+            publisher.rooms,
+            live,
+            await hub.aggregate(class_room("c1")),
+            await hub.aggregate(task_room("t1")),
+            await hub.publisher("s1"),
+        )
+
+    rooms, live, after_class, after_task, publisher = asyncio.run(scenario())
+
+    assert rooms == ["task:t1", "class:c1"]
+    assert live["students"][0]["student_id"] == "ana"
+    assert live["students"][0]["blink_count"] == 4
+    assert live["students"][0]["attention"] == 1.0
+    assert after_class["students"] == [] and after_task["students"] == []
+    assert publisher is None
+
+
+def test_publisher_throttles_and_withdraws(backend):
+    hub = _hub(backend)
+
+    async def scenario():
+        await hub.register_session("s1", "ana", "t1")
+        publisher = await hub.publisher("s1", interval=1.0)
+        timeline = SessionTimeline(max_frames=8, max_seconds=8)
+        published = [
+            await publisher.update(timeline, 0, now=100.0),
+            await publisher.update(timeline, 0, now=100.5),
+            await publisher.update(timeline, 0, now=101.0),
+        ]
+        present = await hub.aggregate(task_room("t1"))
+        await publisher.close()
+        return published, present, await hub.aggregate(task_room("t1"))
+
+    published, present, withdrawn = asyncio.run(scenario())
+
+    assert published == [True, False, True]
+    # Sin clase conocida la sesión solo aparece en la sala de la tarea
+    assert present["summary"]["students"] == 1
+    assert withdrawn["summary"]["students"] == 0
+
+
+def test_publishing_renews_session_record(backend):
+    hub = _hub(backend, session_ttl=0.4)
+
+    async def scenario():
+        await hub.register_session("s1", "ana", "t1", "c1")
+        publisher = await hub.publisher("s1", interval=0.0)
+        timeline = SessionTimeline(max_frames=8, max_seconds=8)
+        for _ in range(8):
+            await publisher.update(timeline, 0)
+            await asyncio.sleep(0.1)
+        alive = await hub.sessions.aget("s1")
+        await asyncio.sleep(0.5)
+        return alive, await hub.sessions.aget("s1")
+
+    alive, expired = asyncio.run(scenario())
+
+    assert alive == {"student_id": "ana", "task_id": "t1", "class_id": "c1"}
+    assert expired is None
+
+
+def test_publisher_stops_after_session_end(backend):
+    hub = _hub(backend, session_ttl=0.4)
+
+    async def scenario():
+        await hub.register_session("s1", "ana", "t1", "c1")
+        publisher = await hub.publisher("s1", interval=0.0)
+        active = await hub.is_active("s1")
+        await hub.end_session("s1")
+        timeline = SessionTimeline(max_frames=8, max_seconds=8)
+        published = await publisher.update(timeline, 0)
+        return active, published, await hub.is_active("s1"), await hub.aggregate(class_room("c1"))
+
+    active, published, after_end, room = asyncio.run(scenario())
+
+    assert active is True
+    # La renovación del registro no resucita una sesión ya finalizada
+    assert published is False and after_end is False
+    assert room["students"] == []
+
+
+@pytest.mark.parametrize("class_id, expected", [("c1", ["task:t1", "class:c1"]), (None, ["task:t1"])])
+def test_rooms_of(class_id, expected):
+    assert LiveAttentionHub.rooms_of({"task_id": "t1", "class_id": class_id}) == expected
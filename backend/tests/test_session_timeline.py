@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from services import session_timeline
+from services.session_timeline import (
+    SessionTimeline,
+    attention_level_from_score,
+    find_session_timeline,
+    get_session_timeline,
+    pop_session_timeline,
+    sync_session_timeline,
+)
+
+
+def _fill(timeline: SessionTimeline, seconds: int, fps: int = 2) -> None:
+    """Frames a fps durante seconds segundos; atento solo en los segundos pares."""
+    for index in range(seconds * fps):
+        second = index // fps
+        timeline.append(0.3, 0.3, True, False, second % 2 == 0, timestamp=index / fps)
+
+
+@pytest.fixture(autouse=True)
+def isolated_timelines(monkeypatch):
+    monkeypatch.setattr(session_timeline, "_timelines", {})
+
+
+def test_seconds_ring_wraps_and_keeps_session_totals():
+    timeline = SessionTimeline(max_frames=8, max_seconds=5)
+    _fill(timeline, 20)
+
+    rows = timeline.to_rows()
+    assert [row["second"] for row in rows] == [15, 16, 17, 18, 19]
+    assert [row["attention"] for row in rows] == [0.0, 1.0, 0.0, 1.0, 0.0]
+    assert all(row["frames"] == 2 and row["face_ratio"] == 1.0 for row in rows)
+    assert timeline.second_count == 20
+    assert timeline.frame_count == 40
+    # El puntaje cubre los 20 segundos, no solo los 5 que quedan en el buffer
+    assert timeline.attention_score() == pytest.approx(0.5)
+    assert timeline.recent_attention(3) == pytest.approx(1 / 3)
+
+
+def test_frames_ring_tracks_last_frame():
+    timeline = SessionTimeline(max_frames=4, max_seconds=4)
+    for index in range(10):
+        timeline.append(0.3, 0.3, index != 9, False, True, timestamp=index * 0.1)
+
+    assert timeline.frame_count == 10
+    assert not timeline.face_present()
+
+
+def test_blinks_counted_on_closing_transition():
+    timeline = SessionTimeline(max_frames=16, max_seconds=4)
+    for index, blinking in enumerate([False, True, True, False, True, False]):
+        timeline.append(0.1 if blinking else 0.3, 0.1 if blinking else 0.3, True, blinking, True, timestamp=index * 0.1)
+
+    assert timeline.to_rows()[0]["blinks"] == 2
+
+
+def test_empty_timeline_has_no_score():
+    timeline = SessionTimeline(max_frames=4, max_seconds=4)
+
+    assert timeline.attention_score() is None
+    assert timeline.attention_level() is None
+    assert timeline.recent_attention(10) is None
+    assert timeline.to_rows() == []
+
+
+def test_attention_level_thresholds():
+    assert attention_level_from_score(0.9) == "alto"
+    assert attention_level_from_score(0.5) == "medio"
+    assert attention_level_from_score(0.1) == "bajo"
+
+
+def test_state_round_trip_after_wrap():
+    timeline = SessionTimeline(max_frames=8, max_seconds=5)
+    _fill(timeline, 20)
+
+    restored = SessionTimeline.from_state(timeline.to_state())
+
+    assert restored.to_rows() == timeline.to_rows()
+    assert restored.attention_score() == pytest.approx(timeline.attention_score())
+    assert restored.frame_count == timeline.frame_count
+
+
+def test_restored_timeline_continues_after_last_second():
+    timeline = SessionTimeline(max_frames=8, max_seconds=5)
+    _fill(timeline, 3)
+
+    restored = SessionTimeline.from_state(timeline.to_state())
+    restored.append(0.3, 0.3, True, False, True)
+
+    assert [row["second"] for row in restored.to_rows()] == [0, 1, 2, 3]
+
+
+def test_shared_timeline_survives_other_process(sqlite_backend):
+    async def scenario():
+        timeline = await get_session_timeline("session")
+        _fill(timeline, 4)
+        await sync_session_timeline("session", timeline, force=True)
+        # Otro proceso: sin la línea de tiempo en memoria
+        session_timeline._timelines.clear()
+
+        found = await find_session_timeline("session")
+        again = await find_session_timeline("session")
+        popped = await pop_session_timeline("session")
+        gone = await pop_session_timeline("session")
+        return timeline, found, again, popped, gone
+
+    timeline, found, again, popped, gone = asyncio.run(scenario())
+
+    assert found.to_rows() == timeline.to_rows()
+    assert again is not None
+    assert popped.attention_score() == pytest.approx(timeline.attention_score())
+    assert gone is None
+
+
+def test_memory_backend_keeps_timelines_in_process(memory_backend):
+    async def scenario():
+        timeline = await get_session_timeline("session")
+        _fill(timeline, 2)
+        await sync_session_timeline("session", timeline, force=True)
+        return (
+            timeline,
+            await get_session_timeline("session"),
+            await find_session_timeline("session"),
+            await pop_session_timeline("session"),
+            await find_session_timeline("session"),
+        )
+
+    timeline, same, found, popped, gone = asyncio.run(scenario())
+
+    assert same is timeline and found is timeline and popped is timeline
+    assert gone is None
+    assert memory_backend.namespace("session_timelines").items() == {}
@@ -0,0 +1,177 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from services.state_backend import (
+    MemoryNamespace,
+    StateBackend,
+    StateNamespace,
+    SQLiteStateBackend,
+    create_state_backend,
+)
+
+
+def _namespace(backend, **kwargs):
+    return backend.namespace(f"test_{time.monotonic_ns()}", **kwargs)
+
+
+def test_set_get_delete(backend):
+    namespace = _namespace(backend)
+    namespace.set("a", {"value": 1})
+    namespace.set("b", [1, 2])
+
+    assert namespace.get("a") == {"value": 1}
+    assert namespace.get_many(["a", "b", "missing"]) == {"a": {"value": 1}, "b": [1, 2]}
+    assert namespace.delete("a") == {"value": 1}
+    assert namespace.delete("a") is None
+    assert namespace.items() == {"b": [1, 2]}
+
+
+def test_namespaces_are_isolated(backend):
+    first, second = _namespace(backend), _namespace(backend)
+    first.set("key", 1)
+
+    assert second.get("key") is None
+    assert backend.namespace(first.name) is first
+
+
+def test_ttl_expires_keys(backend):
+    namespace = _namespace(backend, ttl=0.2)
+    namespace.set("a", 1)
+    assert namespace.get("a") == 1
+
+    time.sleep(0.3)
+
+    assert namespace.get("a") is None
+    assert namespace.items() == {}
+    assert namespace.delete("a") is None
+    # Una clave caducada se recrea desde cero
+    assert namespace.update("a", lambda value: (value or 0) + 1) == 1
+
+
+def test_max_keys_drops_oldest_writes(backend):
+    namespace = _namespace(backend, max_keys=3)
+    for index in range(5):
+        namespace.set(str(index), index)
+        time.sleep(0.002)
+    namespace.set("2", 20)
+    if hasattr(namespace, "prune"):
+        namespace.prune()
+
+    assert namespace.items() == {"3": 3, "4": 4, "2": 20}
+
+
+def test_items_prefix(backend):
+    namespace = _namespace(backend)
+    for key in ("room:a", "room:b", "room2:c", "other"):
+        namespace.set(key, key)
+
+    assert namespace.items("room:") == {"room:a": "room:a", "room:b": "room:b"}
+    assert namespace.items("nothing:") == {}
+    assert len(namespace.items()) == 4
+
+
+def test_async_variants(backend):
+    namespace = _namespace(backend)
+
+    async def scenario():
+        await namespace.aset("a", 1)
+        await namespace.aupdate("a", lambda value: value + 1)
+        return (
+            await namespace.aget("a"),
+            await namespace.aget_many(["a", "b"]),
+            await namespace.aitems(),
+            await namespace.adelete("a"),
+            await namespace.aget("a"),
+        )
+
+    assert asyncio.run(scenario()) == (2, {"a": 2}, {"a": 2}, 2, None)
+
+
+def test_memory_backend_runs_async_variants_inline():
+    namespace = MemoryNamespace("inline")
+    assert not namespace.blocking
+
+    async def scenario():
+        await namespace.aset("a", 1)
+        return await namespace.aget("a")
+
+    assert asyncio.run(scenario()) == 1
+
+
+def _increment_many(path: str, count: int) -> None:
+    namespace = SQLiteStateBackend(path).namespace("counters")
+    for _ in range(count):
+        namespace.update("total", lambda value: (value or 0) + 1)
+
+
+def test_sqlite_update_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    SQLiteStateBackend(path)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_increment_many, args=(path, 100)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert SQLiteStateBackend(path).namespace("counters").get("total") == 400
+
+
+def test_update_failure_keeps_previous_value(backend):
+    namespace = _namespace(backend)
+    namespace.set("a", 1)
+
+    def fail(value):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        namespace.update("a", fail)
+    assert namespace.get("a") == 1
+
+
+def test_update_error_is_not_masked_by_rollback(sqlite_backend):
+    namespace = _namespace(sqlite_backend)
+    connection = sqlite_backend.connection()
+
+    def fail(value):
+        # Sin transacción abierta el ROLLBACK también falla
+        connection.execute("COMMIT")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        namespace.update("a", fail)
+
+
+def test_sqlite_close_closes_every_thread_connection(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+    connections = [backend.connection()]
+    thread = threading.Thread(target=lambda: connections.append(backend.connection()))
+    thread.start()
+    thread.join()
+
+    backend.close()
+
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+    # Tras cerrar, el backend abre una conexión nueva si se vuelve a usar
+    assert backend.namespace("after").get("a") is None
+    backend.close()
+
+
+def test_base_classes_are_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
+    with pytest.raises(TypeError):
+        StateNamespace("abstract")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_state_backend("nope")
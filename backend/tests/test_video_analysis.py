@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from services.video_analysis_service import analyze_video_segment
+
+
+_FPS = 10
+# Ojos cerrados del frame 27 al 32: un único parpadeo que cruza el segundo 3
+_CLOSED = range(27, 33)
+
+
+class _FramePipeline:
+    """Pipeline falso: el brillo del frame codifica su índice."""
+
+    def process(self, img):
+        index = int(round(float(img.mean()) / 4))
+        blinking = index in _CLOSED
+        return SimpleNamespace(
+            face_detected=True,
+            features=None,
+            blink=SimpleNamespace(blinking=blinking, left_ear=0.1 if blinking else 0.3, right_ear=0.3)
+        )
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), _FPS, (32, 32))
+    if not writer.isOpened():
+        pytest.skip("OpenCV sin codificador MJPG")
+    for index in range(60):
+        writer.write(np.full((32, 32, 3), index * 4, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.mark.parametrize("sample_fps", [10, 5])
+def test_blink_across_segment_boundary_is_counted_once(video_path, sample_fps):
+    whole = analyze_video_segment(video_path, 0, 6, sample_fps, _FramePipeline())
+    segments = [
+        row
+        for start in range(0, 6, 3)
+        for row in analyze_video_segment(video_path, start, start + 3, sample_fps, _FramePipeline())
+    ]
+
+    assert sum(row["blinks"] for row in whole) == 1
+    assert segments == whole
@@ -0,0 +1,53 @@
+import struct
+
+import pytest
+
+from utils.ws_recording import WebSocketRecorder, read_recording
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "session.wsrec")
+    recorder = WebSocketRecorder(path, "/ws/detect/blink", "session_id=abc")
+    recorder.write(b"\xff\xd8jpeg", at=10.0)
+    recorder.write('{"type": "hello"}', at=10.25)
+    recorder.write(b"", at=11.0)
+    recorder.close()
+
+    recording = read_recording(path)
+
+    assert recording.header["endpoint"] == "/ws/detect/blink"
+    assert recording.header["query"] == "session_id=abc"
+    assert recording.messages == [(0.0, b"\xff\xd8jpeg"), (0.25, '{"type": "hello"}'), (1.0, b"")]
+    assert recording.duration == 1.0
+    assert recording.gaps() == pytest.approx([0.25, 0.75])
+
+
+def test_truncated_recording_keeps_complete_messages(tmp_path):
+    path = str(tmp_path / "session.wsrec")
+    recorder = WebSocketRecorder(path, "/ws/detect/blink")
+    recorder.write(b"first", at=0.0)
+    recorder.write(b"second", at=0.1)
+    recorder.close()
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+
+    assert [payload for _, payload in read_recording(path).messages] == [b"first"]
+
+
+def test_empty_recording_is_removed(tmp_path):
+    recorder = WebSocketRecorder.for_connection(str(tmp_path / "recordings"), "/ws/detect/blink")
+    recorder.close()
+    recorder.write(b"ignored")
+
+    assert list((tmp_path / "recordings").iterdir()) == []
+
+
+def test_invalid_files(tmp_path):
+    short = tmp_path / "short.wsrec"
+    short.write_bytes(b"WS")
+    other = tmp_path / "other.wsrec"
+    other.write_bytes(struct.pack("<5sBI", b"OTHER", 1, 0))
+
+    for path in (short, other):
+        with pytest.raises(ValueError):
+            read_recording(str(path))
@@ -0,0 +1,76 @@
+"""
+Tarea receptora común de los WebSockets que reciben frames.
+"""
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from utils.frame_slot import LatestFrameSlot
+from utils.ws_recording import WebSocketRecorder
+
+
+def image_from_message(message: Any) -> str:
+    """
+    Obtiene la imagen en Base64 de un mensaje JSON {"image": ...}.
+
+    Raises:
+        ValueError: Si el mensaje no contiene el campo 'image'
+    """
+    if not isinstance(message, dict) or "image" not in message:
+        raise ValueError("El mensaje debe contener el campo 'image' con la imagen en Base64")
+    return message["image"]
+
+
+async def receive_frames(
+    websocket: WebSocket,
+    slot: LatestFrameSlot,
+    send_json: Callable[[Dict[str, Any]], Awaitable[Any]],
+    binary_frame: Callable[[bytes], Any],
+    text_frame: Callable[[Any], Optional[Any]],
+    recorder: Optional[WebSocketRecorder] = None
+) -> None:
+    """
+    Lee los mensajes del cliente y deja en el slot solo el frame más reciente.
+
+    Los frames se decodifican después, al procesarlos, para no gastar CPU en los
+    que se descartan. Al desconectarse el cliente, el slot se cierra.
+
+    Args:
+        websocket: Conexión del cliente
+        slot: Slot donde se deja el frame más reciente
+        send_json: Envía un mensaje JSON al cliente (para los errores)
+        binary_frame: Convierte un mensaje binario en el frame que se guarda
+        text_frame: Convierte un mensaje JSON en el frame que se guarda; devuelve
+            None si el mensaje no es un frame y lanza ValueError con el error
+            que se envía al cliente
+        recorder: Si se indica, graba cada mensaje tal como llega
+    """
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+
+            if recorder is not None:
+                recorder.write(frame["bytes"] if frame.get("bytes") is not None else frame.get("text") or "")
+
+            image_bytes = frame.get("bytes")
+            if image_bytes is not None:
+                slot.put(binary_frame(image_bytes))
+                continue
+
+            try:
+                item = text_frame(json.loads(frame.get("text") or ""))
+            except json.JSONDecodeError:
+                await send_json({"error": "El mensaje debe ser un JSON válido"})
+                continue
+            except ValueError as e:
+                await send_json({"error": str(e)})
+                continue
+            if item is not None:
+                slot.put(item)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        slot.close()
@@ -0,0 +1,59 @@
+"""
+Buffer de un solo frame con política "el más reciente gana".
+"""
+import asyncio
+from typing import Any, Optional, Tuple
+
+
+class LatestFrameSlot:
+    """
+    Guarda únicamente el frame pendiente más reciente de una conexión.
+
+    Cuando llega un frame nuevo antes de que se procese el anterior, el anterior
+    se descarta y se contabiliza. Así la latencia queda acotada aunque el cliente
+    capture más rápido de lo que el servidor infiere.
+    """
+
+    def __init__(self):
+        self._item: Optional[Tuple[int, Any]] = None
+        self._event = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame: Any) -> int:
+        """
+        Deposita un frame, sustituyendo al pendiente si lo hay.
+
+        Args:
+            frame: Frame recibido (en el formato que use la conexión)
+
+        Returns:
+            int: Número de secuencia asignado al frame (empieza en 1)
+        """
+        self.received += 1
+        if self._item is not None:
+            self.dropped += 1
+        self._item = (self.received, frame)
+        self._event.set()
+        return self.received
+
+    async def get(self) -> Optional[Tuple[int, Any]]:
+        """
+        Espera y toma el frame más reciente.
+
+        Returns:
+            Tupla (seq, frame) o None si el slot se cerró sin frames pendientes
+        """
+        while self._item is None:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item, self._item = self._item, None
+        return item
+
+    def close(self) -> None:
+        """Cierra el slot: get() devuelve None una vez consumido el último frame."""
+        self._closed = True
+        self._event.set()
@@ -1,26 +1,254 @@
 import base64
-import re
+import struct
+from typing import Optional, Tuple
 
 import cv2
 import numpy as np
 
 
+# Marcadores JPEG Start Of Frame que contienen las dimensiones de la imagen
+_JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+}
+
+# Flags de OpenCV para decodificar a 1/2, 1/4 y 1/8 de la resolución original
+_REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def base64_to_bytes(image_base64: str) -> bytes:
+    """
+    Decodifica una imagen en Base64 a bytes.
+    Maneja el caso donde el Base64 viene con prefijo data:image/...;base64,
+    """
+    # Remover el prefijo si existe
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.partition(",")[2]
+
+    return base64.b64decode(image_base64)
+
+
 def base64_to_opencv(image_base64: str) -> np.ndarray:
     """
     Convierte una imagen en Base64 a un array de OpenCV (numpy).
     Maneja el caso donde el Base64 viene con prefijo data:image/...;base64,
     """
-    # Remover el prefijo si existe
-    image_base64 = re.sub(r"^data:image/[^;]+;base64,", "", image_base64)
+    return bytes_to_opencv(base64_to_bytes(image_base64))
+
+
+def bytes_to_opencv(image_bytes: bytes) -> np.ndarray:
+    """
+    Convierte los bytes de una imagen codificada (JPEG, WebP, PNG...) a un array de OpenCV (numpy).
+
+    Raises:
+        ValueError: Si los bytes no corresponden a una imagen válida
+    """
+    return decode_frame(image_bytes)
+
+
+def read_image_size(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Obtiene las dimensiones (ancho, alto) de una imagen JPEG, PNG o WebP leyendo
+    solo su cabecera, sin decodificarla.
+
+    Returns:
+        Tupla (width, height) o None si el formato no se reconoce
+    """
+    data = memoryview(image_bytes)
+    size = len(data)
+
+    # JPEG: recorrer los segmentos hasta encontrar un marcador SOF
+    if size > 4 and data[0] == 0xFF and data[1] == 0xD8:
+        i = 2
+        while i + 9 < size:
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker == 0xFF:
+                # Byte de relleno
+                i += 1
+                continue
+            if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                # Marcadores sin longitud
+                i += 2
+                continue
+            if marker in _JPEG_SOF_MARKERS:
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return width, height
+            segment_length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            i += 2 + segment_length
+        return None
+
+    # PNG: dimensiones en el chunk IHDR
+    if size >= 24 and bytes(data[:8]) == b"\x89PNG\r\n\x1a\n":
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
 
-    # Decodificar Base64
-    image_bytes = base64.b64decode(image_base64)
+    # WebP: dimensiones según el tipo de chunk (VP8, VP8L o VP8X)
+    if size >= 30 and bytes(data[:4]) == b"RIFF" and bytes(data[8:12]) == b"WEBP":
+        chunk = bytes(data[12:16])
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = struct.unpack("<I", data[21:25])[0]
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return width, height
+
+    return None
+
+
+def reduced_decode_flag(width: int, height: int, target_side: int) -> int:
+    """
+    Elige el flag de decodificación reducida más agresivo que conserve al menos
+    target_side píxeles en el lado mayor de la imagen.
+
+    Args:
+        width: Ancho original de la imagen
+        height: Alto original de la imagen
+        target_side: Tamaño mínimo deseado para el lado mayor (0 = resolución completa)
+
+    Returns:
+        int: Flag de cv2.imdecode
+    """
+    if target_side > 0:
+        longest = max(width, height)
+        for factor, flag in _REDUCED_COLOR_FLAGS:
+            if longest // factor >= target_side:
+                return flag
+    return cv2.IMREAD_COLOR
 
-    # Convertir a array numpy
+
+def decode_frame(
+    image_bytes: bytes,
+    target_side: int = 0,
+    max_pixels: int = 0
+) -> np.ndarray:
+    """
+    Decodifica un frame a la menor escala que conserve target_side píxeles en su lado mayor.
+
+    Las dimensiones se leen de la cabecera antes de decodificar, de modo que los
+    frames demasiado grandes se rechazan sin gastar CPU en ellos y los JPEG se
+    decodifican directamente a escala reducida.
+
+    Args:
+        image_bytes: Bytes de la imagen codificada
+        target_side: Tamaño mínimo del lado mayor tras la reducción (0 = resolución completa)
+        max_pixels: Número máximo de píxeles permitido (0 = sin límite)
+
+    Returns:
+        np.ndarray: Imagen en formato OpenCV BGR
+
+    Raises:
+        ValueError: Si la imagen supera max_pixels o no se puede decodificar
+    """
+    return _decode(image_bytes, read_image_size(image_bytes), target_side, max_pixels)
+
+
+def _decode(
+    image_bytes: bytes,
+    size: Optional[Tuple[int, int]],
+    target_side: int,
+    max_pixels: int
+) -> np.ndarray:
+    """Implementación de decode_frame con las dimensiones de cabecera ya leídas."""
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        width, height = size
+        if max_pixels and width * height > max_pixels:
+            raise ValueError(
+                f"La imagen ({width}x{height}) supera el tamaño máximo permitido de {max_pixels} píxeles"
+            )
+        flag = reduced_decode_flag(width, height, target_side)
+
+    # Convertir a array numpy sin copiar los bytes
     nparr = np.frombuffer(image_bytes, np.uint8)
 
     # Decodificar imagen
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(nparr, flag)
+    if img is None:
+        raise ValueError("No se pudo decodificar la imagen")
+
+    if size is None and max_pixels and img.shape[0] * img.shape[1] > max_pixels:
+        raise ValueError(f"La imagen supera el tamaño máximo permitido de {max_pixels} píxeles")
 
     return img
 
+
+def bgr_to_rgb(img: np.ndarray, buffer: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Convierte una imagen BGR a RGB reutilizando un buffer si tiene la forma adecuada.
+
+    Args:
+        img: Imagen en formato OpenCV BGR
+        buffer: Buffer RGB de una llamada anterior o None
+
+    Returns:
+        np.ndarray: Imagen RGB (el mismo buffer si pudo reutilizarse)
+    """
+    if buffer is None or buffer.shape != img.shape or buffer.dtype != img.dtype:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=buffer)
+
+
+class FrameDecoder:
+    """
+    Decodificador de frames por conexión.
+
+    Decodifica a escala reducida y, si el frame sigue siendo mayor que el tamaño
+    objetivo, lo reescala sobre un buffer BGR preasignado que se reutiliza entre
+    frames de la misma conexión.
+
+    Tras cada decodificación, scale indica cuántos píxeles de la imagen original
+    corresponden a un píxel del frame devuelto.
+
+    Nota: el array devuelto puede ser el buffer interno, por lo que debe usarse
+    (o copiarse) antes de decodificar el siguiente frame.
+    """
+
+    def __init__(self, target_side: int = 480, max_pixels: int = 0):
+        """
+        Args:
+            target_side: Tamaño del lado mayor de los frames decodificados (0 = resolución completa)
+            max_pixels: Número máximo de píxeles permitido en la imagen original (0 = sin límite)
+        """
+        self.target_side = target_side
+        self.max_pixels = max_pixels
+        self.scale = 1.0
+        self._bgr: Optional[np.ndarray] = None
+
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Decodifica los bytes de un frame.
+
+        Raises:
+            ValueError: Si la imagen supera max_pixels o no se puede decodificar
+        """
+        size = read_image_size(image_bytes)
+        img = _decode(image_bytes, size, self.target_side, self.max_pixels)
+        source_width = size[0] if size is not None else img.shape[1]
+
+        height, width = img.shape[:2]
+        longest = max(width, height)
+        if not self.target_side or longest <= self.target_side:
+            self.scale = source_width / width
+            return img
+
+        scale = self.target_side / longest
+        shape = (max(1, round(height * scale)), max(1, round(width * scale)), 3)
+        if self._bgr is None or self._bgr.shape != shape:
+            self._bgr = np.empty(shape, dtype=np.uint8)
+        self.scale = source_width / shape[1]
+        return cv2.resize(img, (shape[1], shape[0]), dst=self._bgr, interpolation=cv2.INTER_AREA)
+
+    def decode_base64(self, image_base64: str) -> np.ndarray:
+        """Decodifica un frame recibido en Base64 (con o sin prefijo data:image/...;base64,)."""
+        return self.decode(base64_to_bytes(image_base64))
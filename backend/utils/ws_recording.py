@@ -0,0 +1,153 @@
+"""
+Formato compacto para grabar sesiones de WebSocket y reproducirlas después.
+
+Estructura del archivo (.wsrec):
+- Cabecera: b"WSREC" + versión (1 byte) + longitud (uint32) + JSON con la ruta,
+  los parámetros de la URL y la fecha de la grabación.
+- Un registro por mensaje recibido: instante (float64, segundos desde el primer
+  mensaje), tipo (uint8: 0 binario, 1 texto), longitud (uint32) y el contenido.
+
+Los intervalos entre llegadas se obtienen de la diferencia entre instantes. Los
+instantes son los de llegada al servidor; un cliente que graba su propia sesión
+con WebSocketRecorder registra en su lugar los instantes de envío.
+"""
+import json
+import os
+import struct
+import time
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+
+RECORD_BINARY = 0
+RECORD_TEXT = 1
+
+_MAGIC = b"WSREC"
+_VERSION = 1
+_HEADER = struct.Struct("<5sBI")
+_RECORD = struct.Struct("<dBI")
+
+
+class WebSocketRecorder:
+    """
+    Escribe los mensajes de una sesión de WebSocket en un archivo .wsrec.
+    """
+
+    def __init__(self, path: str, endpoint: str, query: str = ""):
+        """
+        Args:
+            path: Archivo de salida
+            endpoint: Ruta del WebSocket grabado (por ejemplo "/ws/detect/blink")
+            query: Parámetros de la URL de la conexión (sin "?")
+        """
+        self.path = path
+        self.frames = 0
+        self._file: Optional[BinaryIO] = open(path, "wb")
+        self._started: Optional[float] = None
+        header = json.dumps({
+            "endpoint": endpoint,
+            "query": query,
+            "recorded_at": datetime.utcnow().isoformat()
+        }).encode("utf-8")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, len(header)))
+        self._file.write(header)
+
+    @classmethod
+    def for_connection(cls, directory: str, endpoint: str, query: str = "") -> "WebSocketRecorder":
+        """
+        Crea una grabación con nombre único en un directorio.
+
+        Args:
+            directory: Directorio de las grabaciones (se crea si no existe)
+            endpoint: Ruta del WebSocket grabado
+            query: Parámetros de la URL de la conexión
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.wsrec"
+        return cls(os.path.join(directory, name), endpoint, query)
+
+    def write(self, payload: Union[bytes, str], at: Optional[float] = None) -> None:
+        """
+        Añade un mensaje a la grabación.
+
+        Args:
+            payload: Mensaje binario (bytes) o de texto (str)
+            at: Instante del mensaje (time.monotonic() por defecto)
+        """
+        if self._file is None:
+            return
+        now = time.monotonic() if at is None else at
+        if self._started is None:
+            self._started = now
+        if isinstance(payload, str):
+            kind, data = RECORD_TEXT, payload.encode("utf-8")
+        else:
+            kind, data = RECORD_BINARY, payload
+        self._file.write(_RECORD.pack(now - self._started, kind, len(data)))
+        self._file.write(data)
+        self.frames += 1
+
+    def close(self) -> None:
+        """Cierra el archivo (las grabaciones sin mensajes se eliminan)."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if not self.frames:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class WebSocketRecording:
+    """
+    Grabación leída de un archivo .wsrec.
+
+    Attributes:
+        header: Ruta, parámetros de la URL y fecha de la grabación
+        messages: Lista de (instante en segundos, mensaje bytes | str)
+    """
+
+    def __init__(self, header: Dict[str, Any], messages: List[Tuple[float, Union[bytes, str]]]):
+        self.header = header
+        self.messages = messages
+
+    @property
+    def duration(self) -> float:
+        return self.messages[-1][0] if self.messages else 0.0
+
+    def gaps(self) -> List[float]:
+        """Intervalos (s) entre mensajes consecutivos."""
+        return [b[0] - a[0] for a, b in zip(self.messages, self.messages[1:])]
+
+
+def read_recording(path: str) -> WebSocketRecording:
+    """
+    Lee una grabación completa.
+
+    Raises:
+        ValueError: Si el archivo no es una grabación válida
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_HEADER.size)
+        if len(prefix) < _HEADER.size:
+            raise ValueError(f"{path} no es una grabación de WebSocket")
+        magic, version, header_length = _HEADER.unpack(prefix)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} no es una grabación de WebSocket (versión {_VERSION})")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+        messages = []
+        while True:
+            record = f.read(_RECORD.size)
+            if len(record) < _RECORD.size:
+                break
+            offset, kind, length = _RECORD.unpack(record)
+            data = f.read(length)
+            if len(data) < length:
+                # Grabación truncada (servidor detenido a mitad de un mensaje)
+                break
+            messages.append((offset, data.decode("utf-8") if kind == RECORD_TEXT else data))
+    return WebSocketRecording(header, messages)
@@ -0,0 +1,53 @@
+-- =============================================================================
+-- MIGRACIÓN: Línea de tiempo de atención por sesión
+-- El backend calcula el nivel de atención con los resultados de /ws/detect/blink
+-- y guarda un agregado por segundo al finalizar la sesión (/sessions/end)
+-- =============================================================================
+
+-- 1. Puntaje de atención calculado en el servidor (0-1)
+ALTER TABLE public.activity_sessions
+ADD COLUMN IF NOT EXISTS attention_score float;
+
+-- 2. Tabla con un registro por segundo de sesión
+CREATE TABLE IF NOT EXISTS public.session_attention_timeline (
+    session_id uuid REFERENCES public.activity_sessions(id) ON DELETE CASCADE,
+    second integer NOT NULL,        -- Segundo desde el primer frame de la sesión
+    frames smallint NOT NULL,       -- Frames analizados en ese segundo
+    face_ratio real NOT NULL,       -- Fracción de frames con rostro
+    blinks smallint NOT NULL,       -- Parpadeos que empiezan en ese segundo
+    mean_ear real NOT NULL,         -- EAR promedio de los frames con rostro
+    attention real NOT NULL,        -- Fracción de frames en que el estudiante estaba atento
+    PRIMARY KEY (session_id, second)
+);
+
+-- 3. Seguridad: mismas reglas que la sesión a la que pertenece cada registro
+ALTER TABLE public.session_attention_timeline ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Acceso a la línea de tiempo propia o de profesor" ON public.session_attention_timeline;
+
+CREATE POLICY "Acceso a la línea de tiempo propia o de profesor" ON public.session_attention_timeline
+FOR SELECT USING (
+    EXISTS (
+        SELECT 1 FROM activity_sessions
+        WHERE activity_sessions.id = session_id
+        AND (activity_sessions.student_id = auth.uid()
+             OR
+             EXISTS (
+                SELECT 1 FROM tasks
+                JOIN classes ON tasks.class_id = classes.id
+                WHERE tasks.id = activity_sessions.task_id
+                AND classes.professor_id = auth.uid()
+             )
+        )
+    )
+);
+
+-- 4. Comentarios para documentación
+COMMENT ON COLUMN public.activity_sessions.attention_score IS
+'Puntaje de atención (0-1) calculado en el servidor a partir de la línea de tiempo. NULL si el nivel lo envió el frontend.';
+
+COMMENT ON COLUMN public.activity_sessions.attention_level IS
+'Nivel de atención al finalizar: alto (>0.7), medio (>=0.4), bajo (<0.4). Se calcula en el servidor cuando hay línea de tiempo; si no, lo envía el frontend. NULL mientras la sesión está en progreso.';
+
+COMMENT ON TABLE public.session_attention_timeline IS
+'Agregado por segundo de la atención de cada sesión, escrito en una sola inserción al finalizarla';